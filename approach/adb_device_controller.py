@@ -1,61 +1,224 @@
+import re
+import shlex
+import logging
 import subprocess
+import struct
 import time
 import os
 
+import cv2
+import numpy as np
+
+import tracing
+import yyh_utils
+from execute_action import compile_action
+
+logger = logging.getLogger(__name__)
+
+# Settle detection: the device hashes each raw capture, so a poll transfers a digest instead
+# of a frame. Screens that keep changing (blinking cursor, spinner) fall back to captures
+# downscaled to this longest side and compared with the SSIM stability rule of video segmentation.
+SETTLE_CAPTURE_DIM = 320
+SETTLE_SIM_THRESHOLD = 0.99
+SETTLE_HEADER_RATIO = 0.04  # Status bar share of the screen, ignored (clock, notifications)
+SETTLE_HASH_PHASE = 1.0     # Seconds of hash polling before falling back to SSIM captures
+SETTLE_MIN_DWELL = 0.3      # Seconds after the action before the screen may count as settled
+RAW_HEADER_SIZE = 16        # Largest raw screencap header (12 bytes on older Android)
+
 class ADBDeviceController:
-    def __init__(self, device_id=None):
-        """Initialize with optional device ID for ADB."""
+    def __init__(self, device_id=None, runner=subprocess.run):
+        """
+        Initialize with optional device ID for ADB.
+
+        `runner` executes adb command lines (same signature as subprocess.run); a fake can be
+        passed to exercise the controller without a device (see tests/fake_adb.py).
+        """
         self.device_id = device_id
+        self.runner = runner
+        self._screen_size = None
+        self._touch_device = False  # not probed yet
 
-    def _adb(self, cmd):
+    def _adb(self, cmd, text=True):
         """Run an adb command with optional device targeting."""
         base = ["adb"]
         if self.device_id:
             base += ["-s", self.device_id]
-        return subprocess.run(base + cmd, capture_output=True, text=True)
+        return self.runner(base + cmd, capture_output=True, text=text)
+
+    # --- Single input actions, each compiled into a one-command device script ---
+    def _run_action(self, action):
+        return self.run_script(compile_action(action))
 
     def click(self, x, y):
         """Simulate a tap at (x, y) on the device screen."""
-        time.sleep(0.2)
-        self._adb(["shell", "input", "tap", str(int(x)), str(int(y))])
+        return self._run_action({"action": "tap", "position": (x, y)})
 
     def input_text(self, text):
-        """Send text input to the device (escapes spaces)."""
-        time.sleep(0.2)
-        text = text.replace(" ", "\\ ")  # Escape spaces
-        self._adb(["shell", "input", "text", text])
+        """Send text input to the device."""
+        return self._run_action({"action": "input_text", "text": text})
 
     def swipe(self, x1, y1, x2, y2, duration_ms=500):
         """Simulate swipe from (x1, y1) to (x2, y2) with optional duration."""
-        time.sleep(0.2)
-        self._adb([
-            "shell", "input", "swipe",
-            str(int(x1)), str(int(y1)), str(int(x2)), str(int(y2)), str(duration_ms)
-        ])
+        return self._run_action({"action": "swipe", "from": (x1, y1), "to": (x2, y2), "duration": duration_ms})
 
     def long_click(self, x, y, duration_ms=1000):
         """Simulate a long click by swiping a short distance for a duration."""
-        time.sleep(0.2)
-        self.swipe(x, y, x+1, y+1, duration_ms)
+        return self._run_action({"action": "long_press", "position": (x, y), "duration": duration_ms})
 
     def back(self):
         """Send back key event."""
-        time.sleep(0.2)
-        self._adb(["shell", "input", "keyevent", "4"])
+        return self._run_action({"action": "back"})
+
+    def home(self):
+        """Send home key event."""
+        return self._run_action({"action": "home"})
 
+    @tracing.traced("device.screenshot")
     def screenshot(self, index, save_path):
         """Take a screenshot and pull it from device to local path."""
         remote_path = f"/sdcard/screenshot-{index}.png"
         local_path = os.path.join(save_path, f"screenshot-{index}.png")
-        print(f"Taking screenshot: {remote_path} -> {local_path}")
+        logger.debug(f"Taking screenshot: {remote_path} -> {local_path}")
         self._adb(["shell", "/system/bin/screencap", "-p", remote_path])
         self._adb(["pull", remote_path, local_path])
         return local_path
 
+    def capture_frame(self, max_dim=SETTLE_CAPTURE_DIM):
+        """
+        Capture the screen straight into memory as a small Y (luminance) frame.
+
+        Uses raw `screencap` output (no PNG encoding on the device, no file round-trip)
+        and crops the status bar. Returns None if the capture could not be decoded.
+        """
+        data = self._adb(["exec-out", "screencap"], text=False).stdout
+        if len(data) < 12:
+            return None
+
+        width, height = struct.unpack_from("<II", data)
+        header = len(data) - width * height * 4  # 12 bytes on older, 16 bytes on newer Android
+        if width and height and header in (12, 16):
+            rgba = np.frombuffer(data, dtype=np.uint8, offset=header).reshape(height, width, 4)
+            img = cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR)
+        else:
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                return None
+
+        h, w = img.shape[:2]
+        scale = min(1.0, max_dim / max(h, w))
+        img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        y = yyh_utils.extract_Y(img)
+        return y[int(y.shape[0] * SETTLE_HEADER_RATIO):]
+
+    def screen_size(self):
+        """(width, height) of the display from `wm size` (cached), or None if unknown."""
+        if self._screen_size is None:
+            sizes = [line.split(":")[1].strip() for line in self._adb(["shell", "wm", "size"]).stdout.splitlines() if ":" in line]
+            if sizes and "x" in sizes[0]:
+                self._screen_size = tuple(int(v) for v in sizes[0].split("x"))
+        return self._screen_size
+
+    def touch_device(self):
+        """
+        Multi-touch input device for raw `sendevent` gestures (cached), or None if none was found.
+
+        Returns:
+            dict: {"path": "/dev/input/eventN", "scale": (sx, sy) from screen to touch
+                   coordinates, "pressure": whether the device reports ABS_MT_PRESSURE}
+        """
+        if self._touch_device is False:
+            self._touch_device = None
+            size = self.screen_size()
+            output = self._adb(["shell", "getevent", "-pl"]).stdout
+            for block in output.split("add device")[1:]:
+                path = re.search(r"\d+:\s*(\S+)", block)
+                max_x = re.search(r"ABS_MT_POSITION_X\s*:.*?max (\d+)", block)
+                max_y = re.search(r"ABS_MT_POSITION_Y\s*:.*?max (\d+)", block)
+                if size and path and max_x and max_y:
+                    self._touch_device = {
+                        "path": path.group(1),
+                        "scale": ((int(max_x.group(1)) + 1) / size[0], (int(max_y.group(1)) + 1) / size[1]),
+                        "pressure": "ABS_MT_PRESSURE" in block,
+                    }
+                    break
+        return self._touch_device
+
+    def screen_hash(self):
+        """
+        MD5 of the raw screen below the status bar, computed on the device (a 32-byte reply
+        instead of a full-resolution frame). Returns None if the device could not compute it.
+        """
+        size = self.screen_size()
+        skip = RAW_HEADER_SIZE + (size[0] * 4 * int(size[1] * SETTLE_HEADER_RATIO) if size else 0)
+        result = self._adb(["shell", f"screencap | tail -c +{skip + 1} | md5sum"])
+        digest = result.stdout.split()[0] if result.returncode == 0 and result.stdout.strip() else ""
+        return digest if len(digest) == 32 else None
+
+    @tracing.traced("device.settle")
+    def wait_for_settle(self, timeout=3.0, interval=0.1, stable_captures=2, sim_threshold=SETTLE_SIM_THRESHOLD,
+                        min_dwell=SETTLE_MIN_DWELL):
+        """
+        Wait until the screen stops changing, instead of sleeping for a fixed time.
+
+        First polls device-side hashes of the screen and returns once `stable_captures`
+        consecutive pairs of hashes are identical. If the screen is still changing after
+        SETTLE_HASH_PHASE seconds, polls low-resolution captures and returns as soon as
+        `stable_captures` consecutive pairs of frames are stable (same rule as
+        VideoStableSegment), or when `timeout` seconds have passed. Neither phase returns
+        before `min_dwell` seconds, so a transition that starts late (back press, activity
+        launch, network load) is not mistaken for a settled screen.
+
+        Returns:
+            bool: True if the screen settled, False on timeout.
+        """
+        start = time.monotonic()
+        prev = self.screen_hash()
+        stable = 0
+        while prev is not None and time.monotonic() - start < min(timeout, SETTLE_HASH_PHASE):
+            time.sleep(interval)
+            digest = self.screen_hash()
+            stable = stable + 1 if digest == prev else 0
+            prev = digest
+            if stable >= stable_captures and time.monotonic() - start >= min_dwell:
+                logger.debug(f"Screen settled after {time.monotonic() - start:.2f}s")
+                return True
+
+        # Still changing (or no hash support): tolerate small changes such as a blinking cursor
+        segmenter = yyh_utils.VideoStableSegment(stable_sim_threshold=sim_threshold)
+        prev = self.capture_frame()
+        stable = 0
+
+        while time.monotonic() - start < timeout:
+            time.sleep(interval)
+            frame = self.capture_frame()
+            if frame is not None and prev is not None and frame.shape == prev.shape \
+                    and segmenter.is_stable(yyh_utils.frame_similarity(prev, frame)):
+                stable += 1
+            else:
+                stable = 0
+            prev = frame
+
+            if stable >= stable_captures and time.monotonic() - start >= min_dwell:
+                logger.debug(f"Screen settled after {time.monotonic() - start:.2f}s")
+                return True
+
+        logger.info(f"Screen did not settle within {timeout:.1f}s")
+        return False
+
     def shell(self, command):
         """Run a custom shell command on the device."""
-        return self._adb(["shell"] + command.split())
+        return self._adb(["shell"] + shlex.split(command))
 
+    def run_script(self, script):
+        """
+        Run a shell script on the device in a single adb round-trip.
+
+        The script is handed to the device shell as one string, so `;`, `&` and
+        `sleep` are interpreted on the device and timing is not affected by adb latency.
+        """
+        return self._adb(["shell", script])
+
+    @tracing.traced("device.ui_dump")
     def get_ui_xml(self, local_path="temp/ui_dump.xml"):
         """
         Dump UI hierarchy to XML and pull it locally.
@@ -69,3 +232,57 @@ class ADBDeviceController:
                 return f.read()
         else:
             raise RuntimeError("Failed to dump or pull UI XML")
+
+    # --- App and emulator management (used by device_setup.py) ---
+    def package_paths(self, package):
+        """On-device APK paths of an installed package (empty if it is not installed)."""
+        result = self._adb(["shell", "pm", "path", package])
+        return [line[len("package:"):].strip() for line in result.stdout.splitlines() if line.startswith("package:")]
+
+    def file_sha256(self, remote_path):
+        """SHA-256 hex digest of a file on the device, or None if it cannot be read."""
+        result = self._adb(["shell", "sha256sum", remote_path])
+        digest = result.stdout.split()[0] if result.returncode == 0 and result.stdout.strip() else ""
+        return digest.lower() if len(digest) == 64 else None
+
+    @tracing.traced("device.install")
+    def install_apk(self, apk_path):
+        """Install (or replace) an APK, keeping the app's data. Raises RuntimeError on failure."""
+        result = self._adb(["install", "-r", apk_path])
+        if result.returncode != 0 or "Success" not in result.stdout:
+            raise RuntimeError(f"Failed to install {apk_path}: {(result.stdout + result.stderr).strip()}")
+
+    def clear_app(self, package):
+        """Stop the app and delete all its data (`pm clear`). Raises RuntimeError on failure."""
+        result = self._adb(["shell", "pm", "clear", package])
+        if "Success" not in result.stdout:
+            raise RuntimeError(f"Failed to clear {package}: {(result.stdout + result.stderr).strip()}")
+
+    def launch_app(self, package):
+        """Start the launcher activity of a package."""
+        self._adb(["shell", "monkey", "-p", package, "-c", "android.intent.category.LAUNCHER", "1"])
+
+    def is_emulator(self):
+        """True if the device is an Android emulator."""
+        return self._adb(["shell", "getprop", "ro.kernel.qemu"]).stdout.strip() == "1"
+
+    def emulator_console(self, *args):
+        """
+        Run an emulator console command (e.g. "avd", "snapshot", "list") and return its output.
+        Raises RuntimeError if the console reports an error.
+        """
+        result = self._adb(["emu"] + list(args))
+        output = (result.stdout + result.stderr).strip()
+        if result.returncode != 0 or output.startswith("KO") or "\nKO" in output:
+            raise RuntimeError(f"Emulator console command '{' '.join(args)}' failed: {output}")
+        return output
+
+    def wait_for_boot(self, timeout=60.0, interval=0.5):
+        """Wait until the device is connected and has finished booting. Returns False on timeout."""
+        start = time.monotonic()
+        self._adb(["wait-for-device"])
+        while time.monotonic() - start < timeout:
+            if self._adb(["shell", "getprop", "sys.boot_completed"]).stdout.strip() == "1":
+                return True
+            time.sleep(interval)
+        return False
@@ -0,0 +1,243 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import tracing
+from replay_fixtures import (
+    ReplayFixture, RecordingDevice, RecordingVLM, RecordingDetector,
+    SimulatedDevice, RecordedVLM, RecordedDetector, fixture_dir_for, build_keyframe_fixture,
+)
+
+"""
+Offline end-to-end replay benchmark over approach/dataset.
+
+- `record <video>`: runs a live replay (device + GPT-4o + GroundingDINO) and stores a replay fixture
+  next to the recording (see replay_fixtures.py).
+- `build <video>`: stores a replay fixture built offline from the recording's keyframes, with canned
+  UI dumps and replies (no device or API key needed).
+- `run`: replays every dataset entry against its fixture with a simulated device, recorded VLM replies
+  and recorded detections. Entries without a fixture are benchmarked on segmentation only.
+  Each entry runs in its own process, so wall time and memory high-water mark are per entry.
+  Reports wall time per stage, calls per segment and peak RSS, and exits non-zero when the
+  regression budget (benchmark_budget.json) is exceeded.
+"""
+
+logger = logging.getLogger(__name__)
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset")
+DEFAULT_BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_budget.json")
+
+
+def find_video(entry_dir):
+    """Returns the recording of a dataset entry (first .mp4 in the folder), or None."""
+    videos = sorted(glob.glob(os.path.join(entry_dir, "*.mp4")))
+    return videos[0] if videos else None
+
+def peak_rss_mb():
+    """Memory high-water mark of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def record(video_path, fixture_dir=None):
+    """Runs a live replay and records a fixture for it."""
+    import openai_api
+    import segment_replay
+    import video_analysis
+
+    fixture = ReplayFixture(fixture_dir or fixture_dir_for(video_path))
+    try:
+        segment_replay.main(
+            video_path,
+            device=RecordingDevice(segment_replay.ADBDeviceController(), fixture),
+            vlm=RecordingVLM(openai_api, fixture),
+            detector=RecordingDetector(video_analysis.load_detector(), fixture),
+            interactive=False,
+        )
+    finally:
+        fixture.save()
+        logger.info(f"Replay fixture written to {fixture.root}")
+
+def run_entry(entry_dir, live_detection=False):
+    """
+    Benchmarks one dataset entry in the current process.
+
+    Returns:
+        dict: Measurements for the entry.
+    """
+    import segment_replay
+    import video_analysis
+
+    video_path = find_video(entry_dir)
+    fixture_dir = fixture_dir_for(video_path)
+    tracing.reset()
+    tracing.enable()
+
+    result = {"entry": os.path.basename(entry_dir), "video": video_path}
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as out_root:
+        if ReplayFixture.exists(fixture_dir):
+            fixture = ReplayFixture.load(fixture_dir)
+            device, vlm = SimulatedDevice(fixture), RecordedVLM(fixture)
+            detector = video_analysis.load_detector() if live_detection else RecordedDetector(fixture)
+            summary = segment_replay.main(
+                video_path, device=device, vlm=vlm, detector=detector,
+                interactive=False, out_root=out_root, cache_folder=None,
+            )
+            steps = max(1, summary["steps"])
+            result.update(
+                mode="replay",
+                segments=summary["segments"],
+                executed=summary["executed"],
+                skipped=summary["skipped"],
+                vlm_calls=dict(vlm.calls),
+                vlm_calls_per_segment=sum(vlm.calls.values()) / steps,
+                device_actions_per_segment=len(device.scripts) / steps,
+                divergences=vlm.divergences + device.divergences,
+            )
+        else:
+            _, stable_segments, _ = video_analysis.segment_video(video_path, cache_folder=None)
+            result.update(mode="segment", segments=len(stable_segments))
+
+    result["wall_s"] = time.perf_counter() - start
+    result["stages"] = {name: s["total_s"] for name, s in tracing.summary().items()}
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def check_budget(result, budget):
+    """
+    Compares one entry's measurements with the regression budget.
+
+    The budget has global limits (max_wall_s, max_peak_rss_mb, max_vlm_calls_per_segment,
+    stages: {stage: max_total_s}) which can be overridden per entry under "entries".
+
+    Returns:
+        list: Human-readable budget violations (empty if within budget).
+    """
+    limits = {k: v for k, v in budget.items() if k != "entries"}
+    override = budget.get("entries", {}).get(result["entry"], {})
+    limits.update({k: v for k, v in override.items() if k != "stages"})
+    stage_limits = {**budget.get("stages", {}), **override.get("stages", {})}
+
+    violations = []
+    for key, measured in (("max_wall_s", result["wall_s"]),
+                          ("max_peak_rss_mb", result["peak_rss_mb"]),
+                          ("max_vlm_calls_per_segment", result.get("vlm_calls_per_segment"))):
+        if key in limits and measured is not None and measured > limits[key]:
+            violations.append(f"{result['entry']}: {key} {measured:.2f} > {limits[key]}")
+    for stage, limit in stage_limits.items():
+        measured = result["stages"].get(stage, 0.0)
+        if measured > limit:
+            violations.append(f"{result['entry']}: stage '{stage}' {measured:.2f}s > {limit}s")
+    return violations
+
+def format_report(results):
+    """Renders benchmark results as a plain-text table."""
+    stages = sorted({stage for r in results for stage in r.get("stages", {})})
+    header = ["entry", "mode", "segments", "wall s", "rss MB", "vlm/seg"] + stages
+    rows = [header]
+    for r in results:
+        if "error" in r:
+            rows.append([r["entry"], "error"] + [""] * (len(header) - 2))
+            continue
+        vlm_per_segment = r.get("vlm_calls_per_segment")
+        rows.append([
+            r["entry"], r["mode"], str(r["segments"]), f"{r['wall_s']:.2f}", f"{r['peak_rss_mb']:.0f}",
+            f"{vlm_per_segment:.2f}" if vlm_per_segment is not None else "-",
+        ] + [f"{r['stages'].get(stage, 0.0):.2f}" for stage in stages])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return "\n".join("  ".join(cell.ljust(w) for cell, w in zip(row, widths)) for row in rows)
+
+def run_suite(dataset_dir=DATASET_DIR, budget_path=DEFAULT_BUDGET, entries=None, live_detection=False, output=None):
+    """
+    Benchmarks every dataset entry, each in a fresh process.
+
+    Returns:
+        int: Process exit code (1 if any entry failed or exceeded the budget).
+    """
+    entry_dirs = sorted(
+        d for d in glob.glob(os.path.join(dataset_dir, "*"))
+        if os.path.isdir(d) and find_video(d) and (not entries or os.path.basename(d) in entries)
+    )
+    budget = {}
+    if budget_path and os.path.exists(budget_path):
+        with open(budget_path, "r", encoding="utf-8") as f:
+            budget = json.load(f)
+
+    results, violations = [], []
+    for entry_dir in entry_dirs:
+        logger.info(f"⏱ Benchmarking {os.path.basename(entry_dir)}...")
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            result_path = tmp.name
+        cmd = [sys.executable, os.path.abspath(__file__), "run-entry", entry_dir, "--result", result_path]
+        if live_detection:
+            cmd.append("--live-detection")
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            logger.error(f"❌ {os.path.basename(entry_dir)} failed:\n{proc.stderr[-2000:]}")
+            results.append({"entry": os.path.basename(entry_dir), "error": proc.stderr[-2000:]})
+            violations.append(f"{os.path.basename(entry_dir)}: benchmark run failed")
+            continue
+        with open(result_path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        os.remove(result_path)
+        results.append(result)
+        violations += check_budget(result, budget)
+
+    logger.info("Benchmark results:\n" + format_report(results))
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "violations": violations}, f, indent=2)
+
+    for v in violations:
+        logger.error(f"❌ Budget exceeded: {v}")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline replay benchmark over the dataset.")
+    parser.add_argument("--log-level", default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Benchmark all dataset entries")
+    p_run.add_argument("--dataset", default=DATASET_DIR, help="Dataset folder with one sub-folder per recording")
+    p_run.add_argument("--budget", default=DEFAULT_BUDGET, help="Regression budget JSON")
+    p_run.add_argument("--entries", nargs="*", help="Only benchmark these entries")
+    p_run.add_argument("--live-detection", action="store_true", help="Run GroundingDINO instead of recorded detections")
+    p_run.add_argument("--output", help="Write the results as JSON to this path")
+
+    p_entry = sub.add_parser("run-entry", help="Benchmark one entry in this process (used by 'run')")
+    p_entry.add_argument("entry_dir")
+    p_entry.add_argument("--result", required=True, help="Where to write the JSON result")
+    p_entry.add_argument("--live-detection", action="store_true")
+
+    p_record = sub.add_parser("record", help="Record a replay fixture from a live replay")
+    p_record.add_argument("video_path")
+    p_record.add_argument("--fixture", help="Fixture folder (default: replay_fixture next to the video)")
+
+    p_build = sub.add_parser("build", help="Build a replay fixture offline from the recording's keyframes")
+    p_build.add_argument("video_path")
+    p_build.add_argument("--fixture", help="Fixture folder (default: replay_fixture next to the video)")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.command == "run":
+        sys.exit(run_suite(args.dataset, args.budget, args.entries, args.live_detection, args.output))
+    elif args.command == "run-entry":
+        logging.getLogger().setLevel(logging.WARNING)
+        result = run_entry(args.entry_dir, args.live_detection)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+    elif args.command == "record":
+        record(args.video_path, args.fixture)
+    elif args.command == "build":
+        build_keyframe_fixture(args.video_path, args.fixture)
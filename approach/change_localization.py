@@ -0,0 +1,144 @@
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from consistency_gate import STATUS_BAR_RATIO
+
+"""
+Localizes where a transition changed the screen, so VLM calls can send small high-detail
+crops of those areas plus a low-detail full view instead of a whole high-detail screenshot.
+Only unlabeled screenshots are cropped: labeled ones (whose indices the model must read) are
+always sent whole.
+
+- change_boxes: bounding boxes of the absdiff between the start and stop keyframes.
+- focus_boxes: pads, merges and limits boxes; returns None when the change is too large to
+  be worth cropping (the caller then sends the full high-detail image as before).
+- crop_views: writes the crops and keeps their boxes, so the VLM can be told (and any
+  coordinates it returns mapped back to) full-image pixels.
+"""
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+DIFF_THRESHOLD = 25         # Per-pixel absolute difference that counts as changed (0-255)
+MERGE_KERNEL_RATIO = 0.02   # Changes closer than this share of the image width are merged
+MIN_AREA_RATIO = 0.0005     # Changed blobs smaller than this share of the image are noise
+CROP_PAD_RATIO = 0.04       # Context added around every box, as a share of the image width
+MIN_CROP_SIZE = 160         # Crops are at least this many pixels wide and high
+MAX_CROPS = 3               # More boxes than this are merged into their union
+MAX_COVERAGE = 0.4          # Crops covering more of the image than this are not worth it
+
+
+def change_boxes(start_img, stop_img):
+    """
+    Bounding boxes of the areas that differ between two screenshots.
+
+    Args:
+        start_img (np.ndarray): BGR start keyframe.
+        stop_img (np.ndarray): BGR stop keyframe (resized to the start keyframe if needed).
+
+    Returns:
+        list: (x1, y1, x2, y2) boxes in start-keyframe pixels, largest first.
+    """
+    h, w = start_img.shape[:2]
+    if stop_img.shape[:2] != (h, w):
+        stop_img = cv2.resize(stop_img, (w, h), interpolation=cv2.INTER_AREA)
+
+    a = cv2.GaussianBlur(cv2.cvtColor(start_img, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+    b = cv2.GaussianBlur(cv2.cvtColor(stop_img, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+    mask = (cv2.absdiff(a, b) > DIFF_THRESHOLD).astype(np.uint8)
+    mask[: int(h * STATUS_BAR_RATIO)] = 0  # clock and notification icons change all the time
+
+    k = max(3, int(w * MERGE_KERNEL_RATIO) | 1)
+    mask = cv2.dilate(mask, np.ones((k, k), np.uint8))
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+
+    min_area = MIN_AREA_RATIO * w * h
+    boxes = [
+        (int(x), int(y), int(x + bw), int(y + bh))
+        for x, y, bw, bh, area in stats[1:]
+        if area >= min_area
+    ]
+    return sorted(boxes, key=lambda box: (box[2] - box[0]) * (box[3] - box[1]), reverse=True)
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def _union(a, b):
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+def _pad(box, size, pad):
+    w, h = size
+    x1, y1, x2, y2 = box[0] - pad, box[1] - pad, box[2] + pad, box[3] + pad
+    # Grow small boxes to the minimum crop size around their center
+    if x2 - x1 < MIN_CROP_SIZE:
+        cx = (x1 + x2) // 2
+        x1, x2 = cx - MIN_CROP_SIZE // 2, cx + MIN_CROP_SIZE // 2
+    if y2 - y1 < MIN_CROP_SIZE:
+        cy = (y1 + y2) // 2
+        y1, y2 = cy - MIN_CROP_SIZE // 2, cy + MIN_CROP_SIZE // 2
+    return max(0, int(x1)), max(0, int(y1)), min(w, int(x2)), min(h, int(y2))
+
+def focus_boxes(boxes, image_size):
+    """
+    Turns change boxes into the crops worth sending.
+
+    Args:
+        boxes (list): (x1, y1, x2, y2) boxes in image pixels.
+        image_size (tuple): (width, height) of the image.
+
+    Returns:
+        list: Padded, merged crop boxes, or None if the full image should be sent instead
+              (no change found, or the crops would cover most of the screen anyway).
+    """
+    if not boxes:
+        return None
+    w, h = image_size
+    pad = int(w * CROP_PAD_RATIO)
+    merged = [_pad(box, image_size, pad) for box in boxes]
+
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                if _overlaps(merged[i], merged[j]):
+                    merged[i] = _union(merged[i], merged.pop(j))
+                    changed = True
+                    break
+            if changed:
+                break
+
+    if len(merged) > MAX_CROPS:
+        union = merged[0]
+        for box in merged[1:]:
+            union = _union(union, box)
+        merged = [union]
+
+    coverage = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in merged) / float(w * h)
+    if coverage > MAX_COVERAGE:
+        logger.debug(f"Change covers {coverage:.0%} of the screen; sending the full view.")
+        return None
+    return merged
+
+def scale_boxes(boxes, from_size, to_size):
+    """Maps boxes from one image resolution to another."""
+    sx, sy = to_size[0] / from_size[0], to_size[1] / from_size[1]
+    return [(int(x1 * sx), int(y1 * sy), int(x2 * sx), int(y2 * sy)) for x1, y1, x2, y2 in boxes]
+
+def crop_views(image_path, boxes, out_dir, name):
+    """
+    Writes one crop per box next to the other step files.
+
+    Returns:
+        list: [{"path": crop path, "box": [x1, y1, x2, y2] in full-image pixels}, ...]
+    """
+    image = cv2.imread(image_path)
+    crops = []
+    for k, (x1, y1, x2, y2) in enumerate(boxes):
+        path = os.path.join(out_dir, f"{name}_crop{k}.png")
+        cv2.imwrite(path, image[y1:y2, x1:x2])
+        crops.append({"path": path, "box": [x1, y1, x2, y2]})
+    return crops
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+
+"""
+Per-step checkpointing of a replay, stored in the video's output directory.
+
+The checkpoint records segment boundaries (keyframes are written to the step folders),
+per-step region detections, model replies and executed actions, and which steps are complete.
+With `resume=True` a replay skips completed steps and reuses the video-only results
+(keyframes, DINO regions, relevant-region replies) of the step it was interrupted in;
+everything that depends on the live device is redone from there. A checkpoint written with
+other segmentation options is discarded, since its step indices belong to other segments.
+"""
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "checkpoint.json"
+CHECKPOINT_VERSION = 1
+
+
+def video_fingerprint(video_path):
+    """Identifies a recording by path, size and modification time."""
+    stat = os.stat(video_path)
+    return {"path": os.path.abspath(video_path), "size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+class ReplayCheckpoint:
+    """JSON checkpoint of a replay, written atomically after every update."""
+    def __init__(self, out_dir, video_path, data=None, segmentation=None):
+        self.path = os.path.join(out_dir, CHECKPOINT_FILE)
+        self.data = data or {
+            "version": CHECKPOINT_VERSION,
+            "video": video_fingerprint(video_path),
+            "segmentation": segmentation or {},
+            "segments": None,
+            "merged_segments": 0,
+            "steps": {},
+        }
+
+    @classmethod
+    def open(cls, out_dir, video_path, resume=False, segmentation=None):
+        """
+        Loads the checkpoint of a previous run when resuming, otherwise starts a new one.
+
+        A checkpoint written for a different (or modified) video, or with different
+        segmentation options (e.g. {"fast": True, "collapse_duplicates": False}), is ignored.
+        """
+        path = os.path.join(out_dir, CHECKPOINT_FILE)
+        segmentation = segmentation or {}
+        if resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CHECKPOINT_VERSION or data.get("video") != video_fingerprint(video_path):
+                logger.warning("⚠️ Checkpoint does not match this video; starting from scratch.")
+            elif data.get("segmentation", {}) != segmentation:
+                logger.warning(f"⚠️ Checkpoint was segmented with {data.get('segmentation', {})}, not {segmentation}; starting from scratch.")
+            else:
+                checkpoint = cls(out_dir, video_path, data)
+                logger.info(f"⏩ Resuming from checkpoint: {len(checkpoint.completed_steps())} steps completed.")
+                return checkpoint
+        elif resume:
+            logger.info("No checkpoint found; starting from scratch.")
+        return cls(out_dir, video_path, segmentation=segmentation)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def segments(self):
+        segments = self.data["segments"]
+        return [tuple(s) for s in segments] if segments is not None else None
+
+    @property
+    def merged_segments(self):
+        """Replay steps removed by collapsing near-duplicate segments."""
+        return self.data.get("merged_segments", 0)
+
+    def set_segments(self, segments, merged=0):
+        self.data["segments"] = [list(map(int, s)) for s in segments]
+        self.data["merged_segments"] = merged
+        self.data["steps"] = {}
+        self.save()
+
+    def step(self, index):
+        """Returns the (mutable) record of a step."""
+        return self.data["steps"].setdefault(str(index), {"status": "pending"})
+
+    def get(self, index, key, default=None):
+        return self.data["steps"].get(str(index), {}).get(key, default)
+
+    def record(self, index, key, value):
+        """Stores a value for a step and saves the checkpoint."""
+        self.step(index)[key] = value
+        self.save()
+
+    def append(self, index, key, value):
+        """Appends a value to a list of a step (e.g. model replies) and saves the checkpoint."""
+        self.step(index).setdefault(key, []).append(value)
+        self.save()
+
+    def mark(self, index, status):
+        """Marks a step 'executed' or 'skipped'; both count as completed."""
+        self.record(index, "status", status)
+
+    def is_completed(self, index):
+        return self.get(index, "status") in ("executed", "skipped")
+
+    def completed_steps(self):
+        return [int(i) for i, s in self.data["steps"].items() if s.get("status") in ("executed", "skipped")]
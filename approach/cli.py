@@ -0,0 +1,148 @@
+import argparse
+import importlib
+import json
+import logging
+import time
+
+import tracing
+
+"""
+Command line entry point with one subcommand per pipeline stage.
+
+Each subcommand imports only the modules its stage needs, after argument parsing, so
+`segment` never loads torch, GroundingDINO or the OpenAI client. The time spent importing
+stage modules is logged for every run.
+
+    python cli.py segment <video> [--keyframes out/]
+    python cli.py compare <image1> <image2> SSIM|ABS|SIFT|ORB|AKAZE
+    python cli.py detect <image> [-o annotated.png]
+    python cli.py compile <video> [-o plan.zip]
+    python cli.py replay <video> | --plan plan.zip [--reset-app dataset/<entry>]
+"""
+
+logger = logging.getLogger("cli")
+
+
+def import_stage(*names):
+    """Imports stage modules and logs how long that took."""
+    start = time.perf_counter()
+    modules = [importlib.import_module(name) for name in names]
+    logger.info(f"⏱ Imported {', '.join(names)} in {time.perf_counter() - start:.2f}s")
+    return modules[0] if len(modules) == 1 else modules
+
+def select_dino_backend(args):
+    """Applies --dino-backend/--dino-size; leaves GroundingDINO unimported when they are not given."""
+    if args.dino_backend or args.dino_size:
+        dino_detection = import_stage("dino_detection")
+        dino_detection.use_backend(args.dino_backend or dino_detection.BACKEND, args.dino_size)
+
+
+def cmd_segment(args):
+    video_analysis = import_stage("video_analysis")
+    frames, stable_segments, _ = video_analysis.segment_video(
+        args.video_path, cache_folder=args.cache, collapse_duplicates=args.collapse_duplicates, fast=args.fast_segmentation
+    )
+    if args.keyframes:
+        video_analysis.write_keyframes(args.keyframes, frames, stable_segments)
+    print(json.dumps([list(map(int, s)) for s in stable_segments]))
+
+def cmd_compare(args):
+    experiment = import_stage("experiment")
+    experiment.compare_images(args.image1, args.image2, args.method, args.matcher, args.max_dim)
+
+def cmd_detect(args):
+    select_dino_backend(args)
+    detector = import_stage("dino_detection")
+    regions = detector.run_grounding_dino(args.image_path, args.output)
+    print(json.dumps(regions, indent=1))
+
+def cmd_compile(args):
+    select_dino_backend(args)
+    replay_plan = import_stage("replay_plan")
+    replay_plan.compile_plan(args.video_path, args.output, cache_folder=args.cache, fast_segmentation=args.fast_segmentation,
+                             collapse_duplicates=args.collapse_duplicates)
+
+def cmd_replay(args):
+    if not args.video_path and not args.plan:
+        raise SystemExit("replay: either video_path or --plan is required")
+    select_dino_backend(args)
+    if args.reset_app:
+        device_setup = import_stage("device_setup")
+        device = device_setup.ADBDeviceController()
+        device_setup.DeviceSetup(device).prepare(device_setup.find_apk(args.reset_app))
+    segment_replay = import_stage("segment_replay")
+    segment_replay.main(
+        args.video_path, use_local_gate=not args.no_local_gate, audit_every=args.audit_every,
+        resume=args.resume, plan_path=args.plan, cache_folder=args.cache, localize_changes=not args.no_change_crops,
+        fast_segmentation=args.fast_segmentation, collapse_duplicates=args.collapse_duplicates,
+    )
+
+
+def add_dino_arguments(p):
+    p.add_argument("--dino-backend", default=None, help="GroundingDINO backend: reference, fixed, fixed-int8, onnx or onnx-int8 (see dino_backends.py)")
+    p.add_argument("--dino-size", nargs=2, type=int, default=None, metavar=("WIDTH", "HEIGHT"), help="Input size of the fixed-size GroundingDINO backends")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ViBR: segment GUI recordings and replay them on Android devices.")
+    parser.add_argument("--log-level", default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    parser.add_argument("--trace", default=None, help="Write per-stage timing spans as Chrome-trace JSON to this path")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("segment", help="Split a recording into stable segments")
+    p.add_argument("video_path")
+    p.add_argument("--cache", default="./cache", help="Similarity cache folder")
+    p.add_argument("--fast-segmentation", action="store_true", help="Locate transitions from packet statistics and only decode frames around them (needs PyAV or ffprobe)")
+    p.add_argument("--collapse-duplicates", action="store_true", help="Merge consecutive segments whose keyframes show no localized change (drops their steps)")
+    p.add_argument("--keyframes", default=None, help="Write start/stop keyframes of every step to this folder")
+    p.set_defaults(func=cmd_segment)
+
+    p = sub.add_parser("compare", help="Compare two GUI screenshots")
+    p.add_argument("image1")
+    p.add_argument("image2")
+    p.add_argument("method", help="Comparison method: SSIM, ABS, SIFT, ORB or AKAZE")
+    p.add_argument("--matcher", default="BF", help="Feature matcher for SIFT/ORB/AKAZE: BF or FLANN")
+    p.add_argument("--max-dim", type=int, default=None, help="Downscale images to this longest side before feature detection")
+    p.set_defaults(func=cmd_compare)
+
+    p = sub.add_parser("detect", help="Run GroundingDINO region detection on a screenshot")
+    p.add_argument("image_path")
+    p.add_argument("-o", "--output", default="dino.png", help="Annotated output image")
+    add_dino_arguments(p)
+    p.set_defaults(func=cmd_detect)
+
+    p = sub.add_parser("compile", help="Compile a recording into a replay plan")
+    p.add_argument("video_path")
+    p.add_argument("-o", "--output", default=None, help="Plan file (default: <video>.plan.zip)")
+    p.add_argument("--fast-segmentation", action="store_true", help="Locate transitions from packet statistics and only decode frames around them (needs PyAV or ffprobe)")
+    p.add_argument("--collapse-duplicates", action="store_true", help="Merge consecutive segments whose keyframes show no localized change (drops their steps)")
+    p.add_argument("--cache", default="./cache", help="Similarity cache folder")
+    add_dino_arguments(p)
+    p.set_defaults(func=cmd_compile)
+
+    p = sub.add_parser("replay", help="Replay a recording or a replay plan on the connected device")
+    p.add_argument("video_path", nargs="?")
+    p.add_argument("--plan", default=None, help="Replay a compiled plan instead of analyzing the video")
+    p.add_argument("--no-local-gate", action="store_true", help="Always ask GPT-4o for state consistency")
+    p.add_argument("--audit-every", type=int, default=0, help="Also send every n-th locally decided consistency check to GPT-4o")
+    p.add_argument("--fast-segmentation", action="store_true", help="Locate transitions from packet statistics and only decode frames around them (needs PyAV or ffprobe)")
+    p.add_argument("--collapse-duplicates", action="store_true", help="Merge consecutive segments whose keyframes show no localized change (drops their steps)")
+    p.add_argument("--no-change-crops", action="store_true", help="Send GPT-4o whole high-detail screenshots instead of crops of the changed areas")
+    p.add_argument("--resume", action="store_true", help="Resume an interrupted replay from its checkpoint")
+    p.add_argument("--reset-app", default=None, metavar="ENTRY", help="Install/reset the app of this dataset entry (folder or APK) first, see device_setup.py")
+    p.add_argument("--cache", default="./cache", help="Similarity cache folder")
+    add_dino_arguments(p)
+    p.set_defaults(func=cmd_replay)
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    tracing.enable(args.trace is not None)
+    try:
+        args.func(args)
+    finally:
+        if args.trace:
+            tracing.export_chrome_trace(args.trace)
+            logger.info("⏱ Stage timings:\n" + tracing.format_summary())
@@ -0,0 +1,173 @@
+import logging
+
+import cv2
+
+import tracing
+from experiment import abs_diff_score, ssim_score, get_feature_matcher
+
+"""
+Local, tiered GUI state-consistency check used before asking the VLM.
+
+- Normalizes both screenshots (status bar removed, same resolution, grayscale).
+- Tier 1: mean absolute difference catches nearly pixel-identical screens.
+- Tier 2: SSIM decides clearly-same and clearly-different screens.
+- Tier 3: SIFT feature similarity (descriptors cached per reference frame, never per screenshot) settles what SSIM alone cannot.
+- Clearly-different screens are only decided locally when enabled; otherwise they go to the VLM too.
+- Anything still ambiguous is escalated to the VLM; skip and disagreement rates are tracked for tuning.
+"""
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+STATUS_BAR_RATIO = 0.04    # Top share of the screen cropped away (clock, notifications, battery)
+NORMALIZED_WIDTH = 480     # Both images are resized to this width before comparison
+
+SAME_ABS_THRESHOLD = 2.0   # Mean absolute difference below which screens are the same
+SAME_SSIM_THRESHOLD = 0.97
+DIFF_SSIM_THRESHOLD = 0.40
+SAME_SIFT_THRESHOLD = 0.60
+DIFF_SIFT_THRESHOLD = 0.05
+SAME_SIFT_MIN_SSIM = 0.85  # Feature agreement alone is not enough when the structure changed a lot
+
+
+def normalize_screen(img, size=None):
+    """
+    Crops the status bar, converts to grayscale and resizes an OpenCV image.
+
+    Args:
+        img (np.ndarray): BGR screenshot or video frame.
+        size (tuple): Target (width, height). Defaults to NORMALIZED_WIDTH keeping the aspect ratio.
+    Returns:
+        np.ndarray: Normalized grayscale image.
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    h, w = gray.shape[:2]
+    gray = gray[int(h * STATUS_BAR_RATIO):]
+    if size is None:
+        h = gray.shape[0]
+        size = (NORMALIZED_WIDTH, max(1, int(h * NORMALIZED_WIDTH / w)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+class LocalConsistencyGate:
+    """
+    Decides confidently-same and confidently-different GUI states on-box.
+
+    `check` returns a verdict of "yes", "no" or None (ambiguous, ask the VLM). With
+    `audit_every` > 0, every n-th confident decision is also sent to the VLM so that
+    disagreement with the model can be measured via `record_vlm_verdict`.
+
+    By default only "yes" is decided locally: a "no" still goes to the VLM, whose
+    functional-equivalence judgement can accept screens that look different.
+    """
+    def __init__(self, decide_different=False, audit_every=0):
+        """
+        Args:
+            decide_different (bool): Whether the gate may answer "no" on its own.
+            audit_every (int): Escalate every n-th confident decision for auditing (0 disables auditing).
+        """
+        self.decide_different = decide_different
+        self.audit_every = audit_every
+        self.matcher = get_feature_matcher("SIFT", "BF")
+        self.stats = {
+            "checks": 0,
+            "same": 0,
+            "different": 0,
+            "escalated": 0,
+            "audited": 0,
+            "disagreements": 0,
+            "vlm_verdicts": 0,
+            "lean_disagreements": 0,
+        }
+
+    def _decide(self, reference, live):
+        """Runs the comparison tiers; returns (verdict, tier, scores, lean)."""
+        scores = {}
+
+        mean_diff = abs_diff_score(reference, live)
+        scores["abs"] = mean_diff
+        if mean_diff < SAME_ABS_THRESHOLD:
+            return "yes", "abs", scores, "yes"
+
+        ssim = ssim_score(reference, live)
+        scores["ssim"] = ssim
+        if ssim >= SAME_SSIM_THRESHOLD:
+            return "yes", "ssim", scores, "yes"
+
+        sift, _ = self.matcher.similarity(reference, live, cache_b=False)
+        scores["sift"] = sift
+        if sift is not None:
+            if sift >= SAME_SIFT_THRESHOLD and ssim >= SAME_SIFT_MIN_SSIM:
+                return "yes", "sift", scores, "yes"
+            if self.decide_different and sift <= DIFF_SIFT_THRESHOLD and ssim <= DIFF_SSIM_THRESHOLD:
+                return "no", "sift", scores, "no"
+
+        # Ambiguous: remember which side the scores lean to, for calibration against the VLM.
+        lean = "yes" if ssim >= (SAME_SSIM_THRESHOLD + DIFF_SSIM_THRESHOLD) / 2 else "no"
+        return None, "", scores, lean
+
+    @tracing.traced("consistency.local")
+    def check(self, reference_img, live_img):
+        """
+        Compares a recording frame with a device screenshot.
+
+        Args:
+            reference_img (np.ndarray): Reference image from the recording (BGR).
+            live_img (np.ndarray): Current device screenshot (BGR).
+        Returns:
+            dict: {"verdict": "yes" | "no" | None, "tier": str, "scores": dict, "lean": str, "audit": bool}
+        """
+        reference = normalize_screen(reference_img)
+        live = normalize_screen(live_img, size=(reference.shape[1], reference.shape[0]))
+
+        verdict, tier, scores, lean = self._decide(reference, live)
+        self.stats["checks"] += 1
+
+        audit = False
+        if verdict is None:
+            self.stats["escalated"] += 1
+        else:
+            self.stats["same" if verdict == "yes" else "different"] += 1
+            decided = self.stats["same"] + self.stats["different"]
+            if self.audit_every and decided % self.audit_every == 0:
+                audit = True
+                self.stats["audited"] += 1
+
+        score_str = ", ".join(f"{k}={v:.3f}" for k, v in scores.items() if v is not None)
+        logger.info(f"🧮 Local consistency: {verdict or 'ambiguous'} ({tier or 'escalate'}; {score_str})")
+        return {"verdict": verdict, "tier": tier, "scores": scores, "lean": lean, "audit": audit}
+
+    def record_vlm_verdict(self, result, same_state):
+        """
+        Records the VLM answer for a check that was escalated or audited.
+
+        Args:
+            result (dict): The dict returned by `check`.
+            same_state (str): The VLM's "same_state" answer ("yes"/"no").
+        """
+        self.stats["vlm_verdicts"] += 1
+        if result["verdict"] is not None and result["verdict"] != same_state:
+            self.stats["disagreements"] += 1
+            logger.warning(f"⚠️ Local gate disagreed with VLM: local={result['verdict']} vlm={same_state} scores={result['scores']}")
+        if result["verdict"] is None and result["lean"] != same_state:
+            self.stats["lean_disagreements"] += 1
+
+    def summary(self):
+        """Returns skip/escalation/disagreement rates for threshold tuning."""
+        checks = max(1, self.stats["checks"])
+        escalated_vlm = max(1, self.stats["vlm_verdicts"] - self.stats["audited"])
+        return {
+            **self.stats,
+            "skip_rate": (self.stats["same"] + self.stats["different"] - self.stats["audited"]) / checks,
+            "escalation_rate": self.stats["escalated"] / checks,
+            "audit_disagreement_rate": self.stats["disagreements"] / max(1, self.stats["audited"]),
+            "lean_disagreement_rate": self.stats["lean_disagreements"] / escalated_vlm,
+        }
+
+    def log_summary(self):
+        s = self.summary()
+        logger.info(
+            f"🧮 Local consistency gate: {s['checks']} checks, skip rate {s['skip_rate']:.0%}, "
+            f"escalated {s['escalated']}, audit disagreements {s['disagreements']}/{s['audited']}, "
+            f"lean disagreements {s['lean_disagreements']}/{s['vlm_verdicts'] - s['audited']}"
+        )
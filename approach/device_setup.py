@@ -0,0 +1,178 @@
+import argparse
+import glob
+import logging
+import os
+import re
+import shutil
+import subprocess
+import time
+
+import tracing
+from adb_device_controller import ADBDeviceController
+from yyh_utils import file_sha256
+
+"""
+Brings the device into a clean starting state for replaying a dataset entry.
+
+- The entry's APK is installed only when the installed package's APK (`pm path`) has a
+  different SHA-256 than the local file; otherwise the install is skipped.
+- App data is wiped with `pm clear` and the app is launched.
+- On emulators, that clean state is saved as a snapshot named after the package and the APK
+  hash; later resets load the snapshot (seconds) instead of installing and clearing again.
+- Every reset reports the time it took, per stage.
+
+All device access goes through ADBDeviceController, whose adb runner can be replaced by a
+fake to exercise the flow without a device (see tests/test_device_setup.py).
+
+    python device_setup.py dataset/AuthToken-1
+    python device_setup.py dataset/Markor-264/markor-0.3.9-#264.apk --no-snapshot
+"""
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+SNAPSHOT_PREFIX = "vibr"
+SNAPSHOT_HASH_CHARS = 12     # APK hash characters in the snapshot name (a new APK gets a new snapshot)
+LAUNCH_SETTLE_TIMEOUT = 10.0
+LAUNCH_MIN_DWELL = 1.0       # An activity launch can take this long to draw its first frame
+
+
+def find_apk(entry):
+    """APK of a dataset entry folder (first .apk in it), or the path itself if it is an APK."""
+    if os.path.isdir(entry):
+        apks = sorted(glob.glob(os.path.join(entry, "*.apk")))
+        if not apks:
+            raise FileNotFoundError(f"No .apk file in {entry}")
+        return apks[0]
+    return entry
+
+def find_aapt():
+    """aapt/aapt2 from PATH or the newest Android SDK build-tools, or None."""
+    for name in ("aapt", "aapt2"):
+        if shutil.which(name):
+            return shutil.which(name)
+    sdk = os.environ.get("ANDROID_HOME") or os.environ.get("ANDROID_SDK_ROOT")
+    if sdk:
+        for name in ("aapt", "aapt2"):
+            candidates = sorted(glob.glob(os.path.join(sdk, "build-tools", "*", name)))
+            if candidates:
+                return candidates[-1]
+    return None
+
+def apk_package(apk_path):
+    """
+    Package name of an APK, read with `aapt dump badging`.
+
+    Raises:
+        RuntimeError: If aapt is not available or cannot read the APK (pass the package explicitly then).
+    """
+    aapt = find_aapt()
+    if aapt is None:
+        raise RuntimeError("aapt not found (install Android build-tools or pass --package)")
+    result = subprocess.run([aapt, "dump", "badging", apk_path], capture_output=True, text=True)
+    match = re.search(r"package: name='([^']+)'", result.stdout)
+    if not match:
+        raise RuntimeError(f"Could not read the package name of {apk_path}: {result.stderr.strip()}")
+    return match.group(1)
+
+def snapshot_name(package, apk_hash):
+    return f"{SNAPSHOT_PREFIX}-{package.replace('.', '_')}-{apk_hash[:SNAPSHOT_HASH_CHARS]}"
+
+
+class DeviceSetup:
+    """
+    Installs, resets and snapshots apps on one device.
+
+    Args:
+        device (ADBDeviceController): Device to prepare.
+        use_snapshots (bool): Save and load emulator snapshots (ignored on physical devices).
+    """
+    def __init__(self, device, use_snapshots=True):
+        self.device = device
+        self.use_snapshots = use_snapshots and device.is_emulator()
+
+    def snapshots(self):
+        """Names of the emulator's snapshots."""
+        output = self.device.emulator_console("avd", "snapshot", "list")
+        # Rows look like "<id or -->  <tag>  <vm size>  <date>  <vm clock>"
+        rows = [line.split() for line in output.splitlines()]
+        return {row[1] for row in rows if len(row) > 1 and (row[0].isdigit() or row[0] == "--")}
+
+    @tracing.traced("setup.install")
+    def ensure_installed(self, apk_path, package, apk_hash):
+        """Installs the APK unless the device already has exactly this file. Returns True if it installed."""
+        paths = self.device.package_paths(package)
+        base = next((p for p in paths if p.endswith("/base.apk")), paths[0] if paths else None)
+        if base is not None and self.device.file_sha256(base) == apk_hash:
+            logger.info(f"📦 {package} is up to date; skipping install.")
+            return False
+        logger.info(f"📦 Installing {os.path.basename(apk_path)} ({'new' if base is None else 'changed'})...")
+        self.device.install_apk(apk_path)
+        return True
+
+    @tracing.traced("setup.reset")
+    def prepare(self, apk_path, package=None, refresh_snapshot=False, launch=True):
+        """
+        Brings the app into a clean, freshly launched state.
+
+        Args:
+            apk_path (str): APK to install.
+            package (str): Package name (read from the APK if not given).
+            refresh_snapshot (bool): Rebuild the emulator snapshot even if it exists.
+            launch (bool): Launch the app after clearing its data.
+
+        Returns:
+            dict: {"package", "method" ("snapshot" or "clear"), "installed", "snapshot", "reset_s", "stages"}
+        """
+        start = time.perf_counter()
+        stages = {}
+
+        def stage(name, func, *args):
+            t = time.perf_counter()
+            result = func(*args)
+            stages[name] = time.perf_counter() - t
+            return result
+
+        apk_hash = stage("hash", file_sha256, apk_path)
+        package = package or stage("package", apk_package, apk_path)
+        snapshot = snapshot_name(package, apk_hash) if self.use_snapshots else None
+        report = {"package": package, "method": "clear", "installed": False, "snapshot": snapshot}
+
+        if snapshot and not refresh_snapshot and snapshot in stage("snapshot_list", self.snapshots):
+            stage("snapshot_load", self.device.emulator_console, "avd", "snapshot", "load", snapshot)
+            if not stage("boot", self.device.wait_for_boot):
+                raise RuntimeError(f"Device did not come back after loading snapshot {snapshot}")
+            report["method"] = "snapshot"
+        else:
+            report["installed"] = stage("install", self.ensure_installed, apk_path, package, apk_hash)
+            stage("clear", self.device.clear_app, package)
+            if launch:
+                stage("launch", self.device.launch_app, package)
+                stage("settle", lambda: self.device.wait_for_settle(LAUNCH_SETTLE_TIMEOUT, min_dwell=LAUNCH_MIN_DWELL))
+            if snapshot:
+                stage("snapshot_save", self.device.emulator_console, "avd", "snapshot", "save", snapshot)
+
+        report["reset_s"] = time.perf_counter() - start
+        report["stages"] = stages
+        logger.info(
+            f"🧹 Reset {package} via {report['method']} in {report['reset_s']:.1f}s ("
+            + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in stages.items()) + ")"
+        )
+        return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Install and reset the app of a dataset entry for a clean replay.")
+    parser.add_argument("entry", help="Dataset entry folder or APK file")
+    parser.add_argument("--package", default=None, help="Package name (default: read from the APK with aapt)")
+    parser.add_argument("--device", default=None, help="ADB device ID (default: the only connected device)")
+    parser.add_argument("--no-snapshot", action="store_true", help="Do not save or load emulator snapshots")
+    parser.add_argument("--refresh-snapshot", action="store_true", help="Reinstall/clear and save the snapshot again")
+    parser.add_argument("--no-launch", action="store_true", help="Do not launch the app after clearing its data")
+    parser.add_argument("--log-level", default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    apk_path = find_apk(args.entry)
+    setup = DeviceSetup(ADBDeviceController(args.device), use_snapshots=not args.no_snapshot)
+    setup.prepare(apk_path, args.package, refresh_snapshot=args.refresh_snapshot, launch=not args.no_launch)
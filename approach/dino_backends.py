@@ -0,0 +1,391 @@
+import argparse
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+import torch
+
+import dino_detection
+import tracing
+from region_fusion import boxes_array, pairwise_iou, assign
+
+"""
+Faster CPU inference backends for GroundingDINO.
+
+The reference path (groundingdino.util.inference.predict) tokenizes and encodes TEXT_PROMPT
+with BERT on every frame and runs the full-precision model at ~800px. The prompt never
+changes, so the backends here encode it once and only run the image half of the model:
+
+- "reference": load_image + predict, exactly as before.
+- "fixed": the image half in eager PyTorch with the prompt encoding cached, at a fixed input size.
+- "fixed-int8": the same with int8 dynamic quantization of all Linear layers.
+- "onnx" / "onnx-int8": the "fixed" model exported to ONNX (prompt encoding baked in as
+  constants) and run with ONNX Runtime; the int8 variant is quantized by ONNX Runtime.
+  Exports are written next to the weights on first use and redone when the prompt,
+  input size or weights change.
+
+Every backend returns the same (image_source, boxes, logits, phrases) as the reference.
+`python dino_backends.py <screenshots...>` measures the latency of each backend and the
+parity of its boxes with the reference.
+"""
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+BACKENDS = ("reference", "fixed", "fixed-int8", "onnx", "onnx-int8")
+EXPORT_DIR = os.path.dirname(dino_detection.WEIGHTS_PATH)
+ONNX_OPSET = 17                        # grid_sample (deformable attention) needs >= 16
+IMAGE_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGE_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+PARITY_IOU = 0.5                       # A box counts as reproduced at this IoU with a reference box
+
+
+def preprocess(image_source, input_size):
+    """RGB image -> normalized (1, 3, H, W) float32 array at exactly input_size (width, height)."""
+    w, h = input_size
+    interpolation = cv2.INTER_AREA if w < image_source.shape[1] else cv2.INTER_LINEAR
+    image = cv2.resize(image_source, (w, h), interpolation=interpolation).astype(np.float32) / 255.0
+    image = (image - IMAGE_MEAN) / IMAGE_STD
+    return np.ascontiguousarray(image.transpose(2, 0, 1)[None])
+
+def reference_input_size(image_size):
+    """(width, height) load_image resizes an image of image_size to (short side 800, long side <= 1333)."""
+    w, h = image_size
+    scale = 800 / min(w, h)
+    if max(w, h) * scale > 1333:
+        scale = 1333 / max(w, h)
+    return int(round(w * scale)), int(round(h * scale))
+
+def read_image(image_path):
+    """Reads an image as an RGB array (what load_image returns as image_source)."""
+    image = cv2.imread(image_path)
+    if image is None:
+        raise FileNotFoundError(image_path)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+class FixedPromptDINO(torch.nn.Module):
+    """
+    Image half of GroundingDINO with the encoding of one caption computed once.
+
+    Mirrors GroundingDINO.forward for a single unpadded image, but only evaluates the last
+    decoder layer's heads (the only ones predict uses).
+
+    Args:
+        model: Loaded GroundingDINO model.
+        caption (str): Text prompt (preprocessed like predict does).
+    """
+    def __init__(self, model, caption):
+        super().__init__()
+        from GroundingDINO.groundingdino.models.GroundingDINO.bertwarper import (
+            generate_masks_with_special_tokens_and_transfer_map,
+        )
+
+        self.model = model.eval()
+        with torch.no_grad():
+            tokenized = model.tokenizer([caption], padding="longest", return_tensors="pt")
+            masks, position_ids, _ = generate_masks_with_special_tokens_and_transfer_map(
+                tokenized, model.specical_tokens, model.tokenizer
+            )
+            if model.sub_sentence_present:
+                encoder_input = {k: v for k, v in tokenized.items() if k != "attention_mask"}
+                encoder_input["attention_mask"] = masks
+                encoder_input["position_ids"] = position_ids
+            else:
+                encoder_input = tokenized
+            encoded_text = model.feat_map(model.bert(**encoder_input)["last_hidden_state"])
+
+        n = model.max_text_len
+        self.register_buffer("encoded_text", encoded_text[:, :n, :])
+        self.register_buffer("text_token_mask", tokenized.attention_mask.bool()[:, :n])
+        self.register_buffer("position_ids", position_ids[:, :n])
+        self.register_buffer("text_self_attention_masks", masks[:, :n, :n])
+
+    def forward(self, image):
+        from GroundingDINO.groundingdino.util.misc import NestedTensor, inverse_sigmoid
+
+        model = self.model
+        text_dict = {
+            "encoded_text": self.encoded_text,
+            "text_token_mask": self.text_token_mask,
+            "position_ids": self.position_ids,
+            "text_self_attention_masks": self.text_self_attention_masks,
+        }
+        samples = NestedTensor(image, torch.zeros(image.shape[:1] + image.shape[2:], dtype=torch.bool))
+        features, poss = model.backbone(samples)
+
+        srcs, masks = [], []
+        for level, feature in enumerate(features):
+            src, mask = feature.decompose()
+            srcs.append(model.input_proj[level](src))
+            masks.append(mask)
+        for level in range(len(features), model.num_feature_levels):
+            src = model.input_proj[level](features[-1].tensors if level == len(features) else srcs[-1])
+            mask = torch.nn.functional.interpolate(samples.mask[None].float(), size=src.shape[-2:]).to(torch.bool)[0]
+            poss.append(model.backbone[1](NestedTensor(src, mask)).to(src.dtype))
+            srcs.append(src)
+            masks.append(mask)
+
+        hs, reference, _, _, _ = model.transformer(srcs, masks, None, poss, None, None, text_dict)
+        boxes = (model.bbox_embed[-1](hs[-1]) + inverse_sigmoid(reference[-2])).sigmoid()
+        logits = model.class_embed[-1](hs[-1], text_dict)
+        return logits, boxes
+
+
+class ReferenceBackend:
+    """load_image + predict, the unmodified GroundingDINO inference path."""
+    name = "reference"
+
+    def predict(self, image_path):
+        from GroundingDINO.groundingdino.util.inference import load_image, predict
+
+        image_source, image_tensor = load_image(image_path)
+        boxes, logits, phrases = predict(
+            model=dino_detection.get_model(),
+            image=image_tensor,
+            caption=dino_detection.TEXT_PROMPT,
+            box_threshold=dino_detection.BOX_THRESHOLD,
+            text_threshold=dino_detection.TEXT_THRESHOLD,
+            device=dino_detection.device,
+        )
+        return image_source, boxes, logits, phrases
+
+
+class FixedPromptBackend(ABC):
+    """Base class for backends that run a FixedPromptDINO at a fixed input size."""
+    name = "fixed"
+
+    def __init__(self, input_size=None):
+        from GroundingDINO.groundingdino.util.inference import preprocess_caption
+
+        self.input_size = tuple(input_size or dino_detection.INPUT_SIZE)
+        self.caption = preprocess_caption(dino_detection.TEXT_PROMPT)
+        self.tokenizer = dino_detection.get_model().tokenizer
+        self.tokenized = self.tokenizer(self.caption)
+
+    @abstractmethod
+    def run(self, image):
+        """(1, 3, H, W) float32 array -> (logits, boxes) of shape (1, queries, 256) and (1, queries, 4)."""
+
+    def predict(self, image_path):
+        from GroundingDINO.groundingdino.util.utils import get_phrases_from_posmap
+
+        image_source = read_image(image_path)
+        logits, boxes = self.run(preprocess(image_source, self.input_size))
+        logits = torch.as_tensor(np.asarray(logits)).sigmoid()[0]
+        boxes = torch.as_tensor(np.asarray(boxes))[0]
+
+        keep = logits.max(dim=1)[0] > dino_detection.BOX_THRESHOLD
+        logits, boxes = logits[keep], boxes[keep]
+        phrases = [
+            get_phrases_from_posmap(logit > dino_detection.TEXT_THRESHOLD, self.tokenized, self.tokenizer).replace(".", "")
+            for logit in logits
+        ]
+        return image_source, boxes, logits.max(dim=1)[0], phrases
+
+    def build_module(self, quantize=False):
+        module = FixedPromptDINO(dino_detection.get_model(), self.caption).eval()
+        if quantize:
+            module = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+        return module
+
+
+class TorchBackend(FixedPromptBackend):
+    """FixedPromptDINO in eager PyTorch, optionally with int8 dynamic quantization."""
+
+    def __init__(self, input_size=None, quantize=False):
+        super().__init__(input_size)
+        self.name = "fixed-int8" if quantize else "fixed"
+        self.module = self.build_module(quantize)
+
+    def run(self, image):
+        with torch.no_grad():
+            logits, boxes = self.module(torch.from_numpy(image))
+        return logits.numpy(), boxes.numpy()
+
+
+class OnnxBackend(FixedPromptBackend):
+    """FixedPromptDINO exported to ONNX and run with ONNX Runtime, optionally int8-quantized."""
+
+    def __init__(self, input_size=None, quantize=False):
+        import onnxruntime
+
+        super().__init__(input_size)
+        self.name = "onnx-int8" if quantize else "onnx"
+        path = self.export(quantize)
+        self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+
+    def export_path(self, quantize):
+        w, h = self.input_size
+        stem = os.path.splitext(os.path.basename(dino_detection.WEIGHTS_PATH))[0]
+        return os.path.join(EXPORT_DIR, f"{stem}_{w}x{h}{'_int8' if quantize else ''}.onnx")
+
+    def export_info(self):
+        return {
+            "text_prompt": self.caption,
+            "input_size": list(self.input_size),
+            "weights_mtime": os.path.getmtime(dino_detection.WEIGHTS_PATH),
+        }
+
+    def is_current(self, path):
+        try:
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                return json.load(f) == self.export_info()
+        except (OSError, ValueError):
+            return False
+
+    def export(self, quantize):
+        """Writes the (quantized) ONNX model unless an up-to-date one exists; returns its path."""
+        path = self.export_path(quantize)
+        if os.path.exists(path) and self.is_current(path):
+            return path
+
+        if quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            fp32_path = self.export(quantize=False)
+            with tracing.span("dino.export", backend=self.name):
+                quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+        else:
+            w, h = self.input_size
+            logger.info(f"📦 Exporting GroundingDINO at {w}x{h} to {path} (this takes a few minutes)...")
+            with tracing.span("dino.export", backend=self.name), torch.no_grad():
+                torch.onnx.export(
+                    self.build_module(), torch.zeros(1, 3, h, w), path,
+                    input_names=["image"], output_names=["logits", "boxes"], opset_version=ONNX_OPSET,
+                )
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump(self.export_info(), f)
+        logger.info(f"✅ Exported {self.name} model to {path}")
+        return path
+
+    def run(self, image):
+        return self.session.run(["logits", "boxes"], {"image": image})
+
+
+def create_backend(name, input_size=None):
+    """Creates a backend by name (see BACKENDS)."""
+    if name == "reference":
+        return ReferenceBackend()
+    if name in ("fixed", "fixed-int8"):
+        return TorchBackend(input_size, quantize=name.endswith("int8"))
+    if name in ("onnx", "onnx-int8"):
+        return OnnxBackend(input_size, quantize=name.endswith("int8"))
+    raise ValueError(f"Unknown GroundingDINO backend: {name} (choose from {', '.join(BACKENDS)})")
+
+
+def pixel_boxes(image_source, boxes):
+    """Normalized (cx, cy, w, h) boxes -> (N, 4) [x1, y1, x2, y2] array in image pixels."""
+    h, w = image_source.shape[:2]
+    b = boxes_array(np.asarray(boxes)) * (w, h, w, h)
+    return np.concatenate([b[:, :2] - b[:, 2:] / 2, b[:, :2] + b[:, 2:] / 2], axis=1)
+
+def parity(reference, candidate):
+    """
+    Compares the detections of a backend with the reference on one image.
+
+    Boxes are matched one-to-one (IoU >= PARITY_IOU, highest IoU first).
+
+    Args:
+        reference (tuple): (image_source, boxes, logits, phrases) from the reference backend.
+        candidate (tuple): The same from the backend under test.
+
+    Returns:
+        dict: Box counts, matched boxes, mean IoU of the matches and matches with the same phrase.
+    """
+    ref_boxes = pixel_boxes(reference[0], reference[1])
+    cand_boxes = pixel_boxes(candidate[0], candidate[1])
+    iou = pairwise_iou(ref_boxes, cand_boxes)
+    pairs = assign(1 - iou, iou >= PARITY_IOU)
+    return {
+        "reference_boxes": len(ref_boxes),
+        "boxes": len(cand_boxes),
+        "matched": len(pairs),
+        "iou_sum": float(sum(iou[r, c] for r, c in pairs)),
+        "same_phrase": sum(reference[3][r] == candidate[3][c] for r, c in pairs),
+    }
+
+def benchmark(image_paths, backend_names, input_size=None, runs=3):
+    """
+    Latency of each backend and parity of its boxes with the reference.
+
+    Args:
+        image_paths (list): Screenshots to detect on.
+        backend_names (list): Backends to compare ("reference" is always run first).
+        input_size (tuple): (width, height) for the fixed-size backends.
+        runs (int): Timed passes over all images (after one warm-up pass).
+
+    Returns:
+        dict: Per backend: setup time, median/p95 latency per image, speedup and parity.
+    """
+    names = ["reference"] + [n for n in backend_names if n != "reference"]
+    report, reference_results = {}, None
+    for name in names:
+        start = time.perf_counter()
+        backend = create_backend(name, input_size)
+        results = [backend.predict(path) for path in image_paths]
+        setup_s = time.perf_counter() - start
+
+        latencies = []
+        for _ in range(runs):
+            for path in image_paths:
+                t = time.perf_counter()
+                backend.predict(path)
+                latencies.append(time.perf_counter() - t)
+        latencies.sort()
+        entry = {
+            "setup_s": setup_s,
+            "median_ms": 1000 * latencies[len(latencies) // 2],
+            "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        }
+
+        if reference_results is None:
+            reference_results = results
+        else:
+            counts = [parity(ref, res) for ref, res in zip(reference_results, results)]
+            ref_total = sum(c["reference_boxes"] for c in counts)
+            total = sum(c["boxes"] for c in counts)
+            matched = sum(c["matched"] for c in counts)
+            entry.update({
+                "speedup": report["reference"]["median_ms"] / entry["median_ms"],
+                "recall": matched / ref_total if ref_total else 1.0,
+                "precision": matched / total if total else 1.0,
+                "mean_iou": sum(c["iou_sum"] for c in counts) / matched if matched else 0.0,
+                "phrase_agreement": sum(c["same_phrase"] for c in counts) / matched if matched else 0.0,
+            })
+        report[name] = entry
+        del backend
+    return report
+
+def format_report(report):
+    lines = [f"{'backend':<12}{'median ms':>11}{'p95 ms':>9}{'speedup':>9}{'recall':>8}{'precision':>11}{'mean IoU':>10}{'phrases':>9}"]
+    for name, e in report.items():
+        lines.append(
+            f"{name:<12}{e['median_ms']:>11.0f}{e['p95_ms']:>9.0f}{e.get('speedup', 1.0):>8.2f}x"
+            f"{e.get('recall', 1.0):>8.1%}{e.get('precision', 1.0):>11.1%}{e.get('mean_iou', 1.0):>10.3f}"
+            f"{e.get('phrase_agreement', 1.0):>9.1%}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare latency and box parity of GroundingDINO backends.")
+    parser.add_argument("images", nargs="+", help="Screenshots to run detection on")
+    parser.add_argument("--backends", nargs="+", default=["fixed", "fixed-int8", "onnx", "onnx-int8"], choices=BACKENDS)
+    parser.add_argument("--size", nargs=2, type=int, default=None, metavar=("WIDTH", "HEIGHT"),
+                        help=f"Input size of the fixed-size backends (default: {dino_detection.INPUT_SIZE})")
+    parser.add_argument("--runs", type=int, default=3, help="Timed passes over all images")
+    parser.add_argument("-o", "--output", default=None, help="Write the report as JSON to this path")
+    parser.add_argument("--log-level", default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    report = benchmark(args.images, args.backends, args.size, args.runs)
+    logger.info("📊 GroundingDINO backends:\n" + format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -1,16 +1,23 @@
-from GroundingDINO.groundingdino.util.inference import load_model, load_image, predict
+from GroundingDINO.groundingdino.util.inference import load_model
+import logging
 import cv2
 import torch
 import supervision as sv
 from torchvision.ops import box_convert
 
+import tracing
+
 """
 GroundingDINO region detection and annotation utilities.
 
 - Uses a loaded GroundingDINO model to detect semantically-relevant UI regions in a screenshot.
 - Provides annotation functions for highlighting both all detected regions and a subset of relevant regions.
+- Inference runs through a backend from dino_backends.py (BACKEND): the reference predict, or
+  faster fixed-prompt / int8 / ONNX Runtime variants.
 """
 
+logger = logging.getLogger(__name__)
+
 # Force CPU usage for easier compatibility.
 device = torch.device("cpu")
 
@@ -21,9 +28,38 @@ TEXT_PROMPT = "button. input text field. icon"
 BOX_THRESHOLD = 0.25     # Lower threshold for more permissive region detection
 TEXT_THRESHOLD = 0.2
 
-# Load the DINO model only once to avoid reloads in repeated calls
-MODEL = load_model(CONFIG_PATH, WEIGHTS_PATH)
-
+# Inference backend (see dino_backends.BACKENDS) and input size (width, height) of the fixed-size backends.
+BACKEND = "reference"
+INPUT_SIZE = (600, 1333)  # what load_image produces for our 20:9 portrait recordings
+
+_model = None
+_backend = None
+
+def get_model():
+    """Loads the DINO model on first use and keeps it for repeated calls."""
+    global _model
+    if _model is None:
+        with tracing.span("dino.load"):
+            _model = load_model(CONFIG_PATH, WEIGHTS_PATH)
+    return _model
+
+def use_backend(name, input_size=None):
+    """Selects the inference backend for subsequent run_grounding_dino calls."""
+    global BACKEND, INPUT_SIZE, _backend
+    BACKEND = name
+    INPUT_SIZE = tuple(input_size or INPUT_SIZE)
+    _backend = None
+
+def get_backend():
+    """Creates the selected backend on first use and keeps it for repeated calls."""
+    global _backend
+    if _backend is None:
+        import dino_backends  # deferred: dino_backends imports this module
+        with tracing.span("dino.load", backend=BACKEND):
+            _backend = dino_backends.create_backend(BACKEND, INPUT_SIZE)
+    return _backend
+
+@tracing.traced("dino")
 def run_grounding_dino(image_path: str, output_path: str):
     """
     Runs GroundingDINO model to detect regions in an image and save an annotated version.
@@ -40,22 +76,13 @@ def run_grounding_dino(image_path: str, output_path: str):
             - "center": (cx, cy) int tuple
             - "box": [x1, y1, x2, y2] bounding box in image coords
     """
-    image_source, image_tensor = load_image(image_path)
-
-    # Run GroundingDINO on the image tensor
-    boxes, logits, phrases = predict(
-        model=MODEL,
-        image=image_tensor,
-        caption=TEXT_PROMPT,
-        box_threshold=BOX_THRESHOLD,
-        text_threshold=TEXT_THRESHOLD,
-        device=device,
-    )
+    # Run GroundingDINO on the image
+    image_source, boxes, logits, phrases = get_backend().predict(image_path)
 
     if len(boxes) == 0:
-        print("⚠️ No regions detected by GroundingDINO.")
+        logger.warning("⚠️ No regions detected by GroundingDINO.")
         cv2.imwrite(output_path, cv2.cvtColor(image_source, cv2.COLOR_RGB2BGR))
-        print(f"🔍 Annotated DINO output saved to {output_path}")
+        logger.debug(f"🔍 Annotated DINO output saved to {output_path}")
         return []
 
     # Scale predicted boxes to image size and convert from (cx, cy, w, h) to (x1, y1, x2, y2)
@@ -78,7 +105,7 @@ def run_grounding_dino(image_path: str, output_path: str):
     annotated_frame = label_annotator.annotate(scene=annotated_frame, detections=detections, labels=labels)
 
     cv2.imwrite(output_path, annotated_frame)
-    print(f"🔍 Annotated DINO output saved to {output_path}")
+    logger.debug(f"🔍 Annotated DINO output saved to {output_path}")
 
     # Return region metadata for downstream reasoning or annotation
     regions = []
@@ -113,7 +140,7 @@ def annotate_relevant_regions(image_path, output_path, regions, relevant_indices
     filtered_regions = [r for r in regions if r["index"] in relevant_indices]
 
     if not filtered_regions:
-        print("⚠️ No relevant regions to annotate.")
+        logger.warning("⚠️ No relevant regions to annotate.")
         cv2.imwrite(output_path, image)
         return
 
@@ -130,4 +157,4 @@ def annotate_relevant_regions(image_path, output_path, regions, relevant_indices
     annotated = label_annotator.annotate(scene=annotated, detections=detections, labels=labels)
 
     cv2.imwrite(output_path, annotated)
-    print(f"✅ Relevant-only annotation saved to {output_path}")
+    logger.debug(f"✅ Relevant-only annotation saved to {output_path}")
@@ -1,7 +1,136 @@
+import logging
+import shlex
 import time
 
+import tracing
+
+logger = logging.getLogger(__name__)
+
 # Human-readable action parser and execution script for Android ADB automation
 
+# Actions are compiled into device-side shell scripts so that a list of actions (and multi-tap
+# gestures) runs in a single `adb shell` round-trip with the delays timed on the device.
+INTER_ACTION_DELAY = 0.2    # seconds between consecutive actions in one script
+DOUBLE_TAP_INTERVAL = 0.1   # seconds between the two taps of a double tap
+TAP_DURATION = 0.05         # seconds between touch down and up of each tap of a double tap
+
+KEYCODE_HOME = 3
+KEYCODE_BACK = 4
+
+# Linux input event codes for raw multi-touch gestures via `sendevent`
+EV_SYN, EV_KEY, EV_ABS = 0, 1, 3
+SYN_REPORT = 0
+BTN_TOUCH = 330
+ABS_MT_POSITION_X, ABS_MT_POSITION_Y, ABS_MT_TRACKING_ID, ABS_MT_PRESSURE = 53, 54, 57, 58
+
+
+def _xy(point):
+    x, y = point
+    return int(x), int(y)
+
+def _touch_events(touch, x, y):
+    """sendevent commands for one touch down and one touch up at screen point (x, y)."""
+    sx, sy = touch["scale"]
+    down = [(EV_ABS, ABS_MT_TRACKING_ID, 0), (EV_ABS, ABS_MT_POSITION_X, int(x * sx)), (EV_ABS, ABS_MT_POSITION_Y, int(y * sy))]
+    if touch["pressure"]:
+        down.append((EV_ABS, ABS_MT_PRESSURE, 50))
+    down += [(EV_KEY, BTN_TOUCH, 1), (EV_SYN, SYN_REPORT, 0)]
+    up = [(EV_ABS, ABS_MT_TRACKING_ID, -1), (EV_KEY, BTN_TOUCH, 0), (EV_SYN, SYN_REPORT, 0)]
+    command = lambda events: "; ".join(f"sendevent {touch['path']} {t} {c} {v}" for t, c, v in events)
+    return command(down), command(up)
+
+def double_tap_script(x, y, touch=None):
+    """
+    Two taps DOUBLE_TAP_INTERVAL apart.
+
+    With a touch device, each tap is a raw `sendevent` sequence (a small native binary per
+    event, no JVM start-up), so the timing is set by the device-side sleeps. Without one,
+    `input motionevent` DOWN/UP pairs are used; each still starts an `input` process.
+    """
+    if touch:
+        down, up = _touch_events(touch, x, y)
+    else:
+        down, up = f"input motionevent DOWN {x} {y}", f"input motionevent UP {x} {y}"
+    tap = f"{down}; sleep {TAP_DURATION}; {up}"
+    return f"{tap}; sleep {DOUBLE_TAP_INTERVAL}; {tap}"
+
+def compile_action(action, touch=None):
+    """
+    Compile a single action dict into a device-side shell command.
+
+    Args:
+        action (dict): Action to compile.
+        touch (dict): Touch device from ADBDeviceController.touch_device(), used for precisely
+                      timed multi-tap gestures (None: `input motionevent`).
+
+    Returns:
+        str: Shell command, or None for actions that have no device-side command
+             ('wait', 'no action') or are unknown.
+    """
+    kind = action["action"]
+
+    if kind == "tap":
+        x, y = _xy(action["position"])
+        return f"input tap {x} {y}"
+
+    if kind == "double_tap":
+        x, y = _xy(action["position"])
+        return double_tap_script(x, y, touch)
+
+    if kind == "long_press":
+        x, y = _xy(action["position"])
+        duration = int(action.get("duration", 1000))
+        return f"input swipe {x} {y} {x + 1} {y + 1} {duration}"
+
+    if kind == "swipe":
+        x1, y1 = _xy(action["from"])
+        x2, y2 = _xy(action["to"])
+        duration = int(action.get("duration", 500))
+        return f"input swipe {x1} {y1} {x2} {y2} {duration}"
+
+    if kind == "input_text":
+        return f"input text {shlex.quote(action['text'])}"
+
+    if kind == "back":
+        return f"input keyevent {KEYCODE_BACK}"
+
+    if kind == "home":
+        return f"input keyevent {KEYCODE_HOME}"
+
+    return None
+
+def compile_actions(actions, touch=None):
+    """
+    Compile a list of actions into execution steps.
+
+    Consecutive device-side actions are joined into one shell script; 'wait' and
+    'no action' split the scripts, since they pause on the host side.
+
+    Returns:
+        list: Steps, each either ("script", str) or ("wait", duration_ms).
+    """
+    steps, commands = [], []
+
+    for action in actions:
+        kind = action["action"]
+        if kind in ("wait", "no action"):
+            if commands:
+                steps.append(("script", f"; sleep {INTER_ACTION_DELAY}; ".join(commands)))
+                commands = []
+            steps.append(("wait", action.get("duration", 1000)))
+            continue
+
+        command = compile_action(action, touch)
+        if command is None:
+            logger.warning(f"Unknown action type: {kind}")
+            continue
+        commands.append(command)
+
+    if commands:
+        steps.append(("script", f"; sleep {INTER_ACTION_DELAY}; ".join(commands)))
+    return steps
+
+@tracing.traced("actions.execute")
 def execute_actions(device, actions):
     """
     Execute a list of UI actions on an Android device via ADB.
@@ -15,44 +144,17 @@ def execute_actions(device, actions):
     Unknown actions are ignored with a warning.
     """
     for i, action in enumerate(actions):
-        print(f"[{i+1}] {action.get('description', 'Executing action')} -> {action['action']}")
-
-        if action["action"] == "tap":
-            x, y = action["position"]
-            device.click(x, y)
-
-        elif action["action"] == "double_tap":
-            x, y = action["position"]
-            device.click(x, y)
-            time.sleep(0.1)
-            device.click(x, y)
-
-        elif action["action"] == "long_press":
-            x, y = action["position"]
-            duration = action.get("duration", 1000)
-            device.long_click(x, y, duration)
-
-        elif action["action"] == "swipe":
-            x1, y1 = action["from"]
-            x2, y2 = action["to"]
-            duration = action.get("duration", 500)
-            device.swipe(x1, y1, x2, y2, duration)
-
-        elif action["action"] == "input_text":
-            text = action["text"]
-            device.input_text(text)
-
-        elif action["action"] == "back":
-            device.back()
-
-        elif action["action"] == "home":
-            # 'input keyevent 3' is the Android HOME key
-            device.shell("input keyevent 3")
+        logger.info(f"[{i+1}] {action.get('description', 'Executing action')} -> {action['action']}")
 
-        elif action["action"] == "wait" or action["action"] == "no action":
-            # 'wait' and 'no action' both just pause for the given duration (ms)
-            duration = action.get("duration", 1000)
-            time.sleep(duration / 1000.0)
+    touch_device = getattr(device, "touch_device", None)
+    touch = touch_device() if touch_device and any(a["action"] == "double_tap" for a in actions) else None
 
+    for kind, payload in compile_actions(actions, touch):
+        if kind == "script":
+            result = device.run_script(payload)
+            if result.returncode != 0:
+                logger.warning(f"Action script failed ({result.returncode}): {result.stderr.strip()}")
         else:
-            print(f"Unknown action type: {action['action']}")
+            # 'wait' and 'no action' both pause for the full duration (ms): a recorded wait may be
+            # covering a timer, network load or toast that a settled screen does not reveal
+            time.sleep(payload / 1000.0)
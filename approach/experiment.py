@@ -1,44 +1,55 @@
 import cv2
 import numpy as np
-from skimage.metrics import structural_similarity as ssim
 import argparse
 import sys
 
+from feature_matcher import FeatureMatcher
+
+def to_gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+def ssim_score(imageA, imageB):
+    from skimage.metrics import structural_similarity as ssim  # deferred: skimage.metrics pulls in scipy
+    score, _ = ssim(to_gray(imageA), to_gray(imageB), full=True)
+    return float(score)
+
+def abs_diff_score(imageA, imageB):
+    return float(np.mean(cv2.absdiff(imageA, imageB)))
+
 def compute_ssim(imageA, imageB, threshold=0.95):
-    grayA = cv2.cvtColor(imageA, cv2.COLOR_BGR2GRAY)
-    grayB = cv2.cvtColor(imageB, cv2.COLOR_BGR2GRAY)
-    score, _ = ssim(grayA, grayB, full=True)
+    score = ssim_score(imageA, imageB)
     print(f"SSIM Score: {score:.4f}")
     return score > threshold
 
 def compute_abs_diff(imageA, imageB, threshold=10):
-    diff = cv2.absdiff(imageA, imageB)
-    mean_diff = np.mean(diff)
+    mean_diff = abs_diff_score(imageA, imageB)
     print(f"Absolute Difference (mean): {mean_diff:.2f}")
     return mean_diff < threshold
 
 def compute_sift_matches(imageA, imageB, threshold=0.25):
-    grayA = cv2.cvtColor(imageA, cv2.COLOR_BGR2GRAY)
-    grayB = cv2.cvtColor(imageB, cv2.COLOR_BGR2GRAY)
+    return compute_feature_matches(imageA, imageB, threshold, method="SIFT")
 
-    sift = cv2.SIFT_create()
-    kp1, des1 = sift.detectAndCompute(grayA, None)
-    kp2, des2 = sift.detectAndCompute(grayB, None)
+def compute_feature_matches(imageA, imageB, threshold=0.25, method="SIFT", matcher="BF", max_dim=None):
+    # Matchers are reused so keypoints/descriptors of an image are only computed once.
+    feature_matcher = get_feature_matcher(method, matcher, max_dim)
+    similarity, good = feature_matcher.similarity(imageA, imageB)
 
-    if des1 is None or des2 is None:
-        print("SIFT descriptors not found.")
+    if similarity is None:
+        print(f"{feature_matcher.method} descriptors not found.")
         return False
 
-    bf = cv2.BFMatcher()
-    matches = bf.knnMatch(des1, des2, k=2)
+    print(f"{feature_matcher.method} Similarity: {similarity:.4f} ({good} good matches)")
+    return similarity > threshold
 
-    good = [m for m, n in matches if m.distance < 0.75 * n.distance]
-    similarity = len(good) / max(len(kp1), len(kp2)) if max(len(kp1), len(kp2)) > 0 else 0
+_FEATURE_MATCHERS = {}
 
-    print(f"SIFT Similarity: {similarity:.4f} ({len(good)} good matches)")
-    return similarity > threshold
+def get_feature_matcher(method="SIFT", matcher="BF", max_dim=None):
+    key = (method.upper(), matcher.upper(), max_dim)
+    if key not in _FEATURE_MATCHERS:
+        _FEATURE_MATCHERS[key] = FeatureMatcher(method, matcher, max_dim=max_dim)
+    return _FEATURE_MATCHERS[key]
 
-def compare_images(img_path1, img_path2, method):
+def compare_images(img_path1, img_path2, method, matcher="BF", max_dim=None):
     img1 = cv2.imread(img_path1)
     img2 = cv2.imread(img_path2)
 
@@ -55,10 +66,10 @@ def compare_images(img_path1, img_path2, method):
         result = compute_ssim(img1, img2)
     elif method == "ABS":
         result = compute_abs_diff(img1, img2)
-    elif method == "SIFT":
-        result = compute_sift_matches(img1, img2)
+    elif method in ("SIFT", "ORB", "AKAZE"):
+        result = compute_feature_matches(img1, img2, method=method, matcher=matcher, max_dim=max_dim)
     else:
-        print("Error: Method must be one of 'SSIM', 'ABS', or 'SIFT'.")
+        print("Error: Method must be one of 'SSIM', 'ABS', 'SIFT', 'ORB' or 'AKAZE'.")
         sys.exit(1)
 
     print(f"\nClassified as Similar: {result}")
@@ -67,7 +78,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="GUI state comparison.")
     parser.add_argument("image1", help="Path to the first image")
     parser.add_argument("image2", help="Path to the second image")
-    parser.add_argument("method", help="Comparison method: SSIM, ABS, or SIFT")
+    parser.add_argument("method", help="Comparison method: SSIM, ABS, SIFT, ORB or AKAZE")
+    parser.add_argument("--matcher", default="BF", help="Feature matcher for SIFT/ORB/AKAZE: BF or FLANN")
+    parser.add_argument("--max-dim", type=int, default=None, help="Downscale images so the longest side is at most this many pixels before feature detection")
     args = parser.parse_args()
 
-    compare_images(args.image1, args.image2, args.method)
+    compare_images(args.image1, args.image2, args.method, args.matcher, args.max_dim)
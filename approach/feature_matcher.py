@@ -0,0 +1,151 @@
+import hashlib
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+"""
+Local-feature matching engine for GUI state comparison.
+
+- Caches keypoints and descriptors per image content hash, so a reference frame is described once
+  no matter how many device screenshots it is compared against. One-off images (live screenshots)
+  can be described without entering the cache.
+- Supports SIFT (reference), ORB and AKAZE detectors with brute-force or FLANN-based k-NN matching.
+- Optionally downscales images before detection to bound the cost on high-resolution screenshots.
+"""
+
+# --- Constants ---
+DETECTORS = ("SIFT", "ORB", "AKAZE")
+MATCHERS = ("BF", "FLANN")
+RATIO_TEST = 0.75          # Lowe's ratio test, as used by the original SIFT comparison
+ORB_FEATURES = 2000        # ORB defaults to 500 keypoints, which is too few for dense GUIs
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+DEFAULT_CACHE_SIZE = 32     # Reference frames kept; each holds thousands of SIFT descriptors
+
+
+def image_hash(img):
+    """
+    Returns a content hash for an image array (pixels, shape and dtype).
+
+    Args:
+        img (np.ndarray): OpenCV image.
+    Returns:
+        str: Hex digest identifying the image content.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((img.shape, img.dtype.str)).encode("utf-8"))
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+class FeatureMatcher:
+    """
+    Feature-based image similarity with per-image descriptor caching.
+
+    Similarity is the number of ratio-test matches divided by the larger keypoint count,
+    which is the score `experiment.compute_sift_matches` has always reported.
+    """
+    def __init__(self, method="SIFT", matcher="BF", max_dim=None, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Args:
+            method (str): Feature detector, one of 'SIFT', 'ORB' or 'AKAZE'.
+            matcher (str): Matching strategy, 'BF' (brute force) or 'FLANN'.
+            max_dim (int): If set, images are downscaled so their longest side is at most this many pixels.
+            cache_size (int): Number of described images kept in the LRU cache.
+        """
+        self.method = method.upper()
+        self.matcher_type = matcher.upper()
+        if self.method not in DETECTORS:
+            raise ValueError(f"Unknown feature detector: {method}")
+        if self.matcher_type not in MATCHERS:
+            raise ValueError(f"Unknown matcher: {matcher}")
+
+        self.max_dim = max_dim
+        self.cache_size = cache_size
+        self.binary = self.method != "SIFT"  # ORB and AKAZE produce binary descriptors
+        self.detector = self._create_detector()
+        self._cache = OrderedDict()
+
+    def _create_detector(self):
+        if self.method == "SIFT":
+            return cv2.SIFT_create()
+        if self.method == "ORB":
+            return cv2.ORB_create(nfeatures=ORB_FEATURES)
+        return cv2.AKAZE_create()
+
+    def _create_matcher(self):
+        if self.matcher_type == "BF":
+            return cv2.BFMatcher(cv2.NORM_HAMMING if self.binary else cv2.NORM_L2)
+        if self.binary:
+            index_params = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1)
+        else:
+            index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
+        return cv2.FlannBasedMatcher(index_params, dict(checks=50))
+
+    def _prepare(self, img):
+        """Converts to grayscale and applies the optional downscale."""
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        if self.max_dim:
+            h, w = gray.shape[:2]
+            scale = self.max_dim / max(h, w)
+            if scale < 1.0:
+                gray = cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        return gray
+
+    def describe(self, img, cache=True):
+        """
+        Returns keypoints and descriptors for an image, computing them at most once per content hash.
+
+        Args:
+            img (np.ndarray): OpenCV image (BGR or grayscale).
+            cache (bool): Store the result; pass False for images that will not be compared again.
+        Returns:
+            (keypoints, descriptors): descriptors is None when no features were found.
+        """
+        key = image_hash(img)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        keypoints, descriptors = self.detector.detectAndCompute(self._prepare(img), None)
+        if not cache:
+            return keypoints, descriptors
+        self._cache[key] = (keypoints, descriptors)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return keypoints, descriptors
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def _good_matches(self, matcher, query_des, train_des):
+        """Runs k-NN matching and applies the ratio test."""
+        pairs = matcher.knnMatch(query_des, train_des, k=2)
+        # FLANN-LSH may return fewer than two neighbours for some queries.
+        return [p[0] for p in pairs if len(p) == 2 and p[0].distance < RATIO_TEST * p[1].distance]
+
+    @staticmethod
+    def _score(good, kp1, kp2):
+        denom = max(len(kp1), len(kp2))
+        return len(good) / denom if denom > 0 else 0
+
+    def similarity(self, imageA, imageB, cache_b=True):
+        """
+        Computes the feature similarity between two images.
+
+        Args:
+            imageA (np.ndarray): First image (query side), always cached.
+            imageB (np.ndarray): Second image (train side).
+            cache_b (bool): Also cache imageB's descriptors (False for one-off live screenshots).
+        Returns:
+            (float, int): Similarity in [0, 1] and number of good matches.
+                Similarity is None when either image has no descriptors.
+        """
+        kp1, des1 = self.describe(imageA)
+        kp2, des2 = self.describe(imageB, cache=cache_b)
+        if des1 is None or des2 is None or len(des2) < 2:
+            return None, 0
+
+        good = self._good_matches(self._create_matcher(), des1, des2)
+        return self._score(good, kp1, kp2), len(good)
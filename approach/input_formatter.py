@@ -7,6 +7,8 @@ from typing import List
 import cv2
 from io import StringIO
 
+import tracing
+
 
 """
 Android UI element parser and screenshot annotator.
@@ -72,6 +74,7 @@ def is_overlapping(b1, b2, margin, min_dist) -> bool:
     c2 = ((b2[0] + b2[2]) // 2, (b2[1] + b2[3]) // 2)
     return math.hypot(c1[0] - c2[0], c1[1] - c2[1]) <= min_dist
 
+@tracing.traced("xml.parse")
 def parse_xml_string(
     xml: str,
     bound_margin: int,
@@ -126,6 +129,7 @@ def parse_xml_string(
     return elements
 
 # --- Visualization ---
+@tracing.traced("label_screenshot")
 def label_screenshot(
     screenshot_path: pathlib.Path,
     screenshot_dir: str,
@@ -1,5 +1,12 @@
 import base64
-from openai import OpenAI
+import logging
+import math
+import os
+import struct
+import tempfile
+
+import tracing
+from rate_limiter import RateLimiter
 
 """
 Functions to interact with OpenAI GPT-4o for visual app state comparison, action region prediction,
@@ -9,14 +16,142 @@ WARNING: Remove hardcoded API key before sharing or pushing to public repositori
 """
 
 # TODO: Remove API key before sharing code! Never hardcode secrets in production.
-client = OpenAI(api_key="put-your-api-key-here")
+API_KEY = "put-your-api-key-here"
+
+logger = logging.getLogger(__name__)
+
+# Shared by every replay on this host (see rate_limiter.py); set to your account's gpt-4o limits.
+RATE_LIMIT_RPM = 500
+RATE_LIMIT_TPM = 30000
+RATE_LIMIT_STATE = os.path.join(tempfile.gettempdir(), "vibr_openai_rate_limit.json")
+MAX_RATE_LIMIT_RETRIES = 3
+OUTPUT_TOKEN_ALLOWANCE = 300   # Counted against the token budget for every call's reply
+
+_client = None
+_limiter = None
+
+def get_client():
+    """Creates the OpenAI client on first use (importing openai takes most of a second)."""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        # No SDK-internal retries: every retry has to go through the shared limiter (chat_completion)
+        _client = OpenAI(api_key=API_KEY, max_retries=0)
+    return _client
+
+def get_limiter():
+    """Creates the shared rate limiter on first use."""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(RATE_LIMIT_RPM, RATE_LIMIT_TPM, RATE_LIMIT_STATE)
+    return _limiter
+
+def log_rate_limit_summary():
+    if _limiter is not None:
+        _limiter.log_summary()
+
+def estimate_image_tokens(width, height, detail="high"):
+    """GPT-4o image token cost: 85 at low detail, otherwise 85 + 170 per 512px tile after downscaling."""
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+def png_size(data):
+    """Width and height of a PNG from its first 24 bytes (IHDR)."""
+    return struct.unpack(">II", data[16:24])
+
+def estimate_tokens(messages):
+    """Rough token cost of a chat request: text (~4 characters per token), images and the reply."""
+    tokens = OUTPUT_TOKEN_ALLOWANCE
+    for message in messages:
+        for part in message["content"]:
+            if part["type"] == "text":
+                tokens += len(part["text"]) // 4
+            elif part["type"] == "image_url":
+                image_url = part["image_url"]
+                # The PNG header sits in the first 44 base64 characters
+                width, height = png_size(base64.b64decode(image_url["url"].split(",", 1)[1][:44]))
+                tokens += estimate_image_tokens(width, height, image_url.get("detail", "high"))
+    return tokens
+
+def chat_completion(priority, **kwargs):
+    """
+    chat.completions.create behind the shared rate limiter.
+
+    Args:
+        priority (str): "critical" for calls a replay waits on, "prefetch" for recording analysis.
+        **kwargs: Passed to chat.completions.create (model, messages, ...).
+    """
+    from openai import RateLimitError
+
+    tokens = estimate_tokens(kwargs["messages"])
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        get_limiter().acquire(tokens, priority)
+        try:
+            return get_client().chat.completions.create(**kwargs)
+        except RateLimitError as e:
+            if attempt == MAX_RATE_LIMIT_RETRIES:
+                raise
+            retry_after = float(e.response.headers.get("retry-after", 1.0))
+            logger.warning(f"⚠️ Rate limited by the provider; pausing all replays for {retry_after:.1f}s.")
+            get_limiter().block(retry_after)
 
 def encode_image(image_path):
     """Read an image file and return its base64-encoded string (UTF-8)."""
-    print(image_path)
+    logger.debug(f"Encoding image {image_path}")
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
+CROP_NOTE = (
+    "\nSome screenshots are sent as a low-detail full view followed by high-detail crops of the areas "
+    "that changed during the transition. All coordinates refer to full-view pixels.\n"
+)
+
+def image_part(image_path, detail=None):
+    """Chat message part with a base64-encoded PNG."""
+    image_url = {"url": f"data:image/png;base64,{encode_image(image_path)}"}
+    if detail:
+        image_url["detail"] = detail
+    return {"type": "image_url", "image_url": image_url}
+
+def crops_cost_less(image_size, boxes, detail="high"):
+    """
+    True if a low-detail full view plus high-detail crops of `boxes` cost fewer image tokens
+    than sending the (width, height) image at `detail`. Decided before any crop is written.
+    """
+    crop_tokens = estimate_image_tokens(*image_size, "low") + sum(
+        estimate_image_tokens(x2 - x1, y2 - y1, "high") for x1, y1, x2, y2 in boxes
+    )
+    return crop_tokens < estimate_image_tokens(*image_size, detail)
+
+def image_parts(image_path, label, detail="high", crops=None):
+    """
+    Chat message parts for one screenshot.
+
+    Without crops this is the image at the given detail. With crops (see change_localization.crop_views)
+    it is a low-detail full view followed by each crop at high detail, with the crop's position in the
+    full view stated in text so coordinates stay in full-view pixels. Crops only ever replace the
+    high-detail full view: if they would cost more image tokens than it, the full view is sent instead.
+    """
+    if crops:
+        with open(image_path, "rb") as f:
+            image_size = png_size(f.read(24))
+        if not crops_cost_less(image_size, [crop["box"] for crop in crops], detail):
+            crops = None
+    if not crops:
+        return [image_part(image_path, detail)]
+    parts = [{"type": "text", "text": f"{label} (full view, low detail):"}, image_part(image_path, "low")]
+    for crop in crops:
+        x1, y1, x2, y2 = crop["box"]
+        parts.append({"type": "text", "text": f"{label}, detail of x={x1}..{x2}, y={y1}..{y2}:"})
+        parts.append(image_part(crop["path"], "high"))
+    return parts
+
+@tracing.traced("vlm.state_consistency")
 def ask_gpt_state_consistency(start_img, live_img, action="", target_region=""):
     """
     Compares two Android screenshots to determine if their UI state is functionally equivalent,
@@ -54,7 +189,8 @@ def ask_gpt_state_consistency(start_img, live_img, action="", target_region=""):
         "{ \"same_state\": \"yes\" } or { \"same_state\": \"no\", \"description\": \"<reason>\" }"
     )
 
-    response = client.chat.completions.create(
+    response = chat_completion(
+        "critical",
         model="gpt-4o",
         messages=[
             {"role": "user", "content": [
@@ -65,10 +201,11 @@ def ask_gpt_state_consistency(start_img, live_img, action="", target_region=""):
         ]
     )
 
-    print("Consistency Response from GPT-4o:", response.choices[0].message.content)
+    logger.info(f"Consistency Response from GPT-4o: {response.choices[0].message.content}")
 
     return response.choices[0].message.content.strip().lower()
 
+@tracing.traced("vlm.action_region")
 def ask_gpt_for_action_region(start_img, stop_img, live_img, predicted_action, relevant_indices=None):
     """
     Uses GPT-4o to infer which action and UI region should be executed on the current (live) screen
@@ -84,16 +221,15 @@ def ask_gpt_for_action_region(start_img, stop_img, live_img, predicted_action, r
     Returns:
         str: JSON response from GPT-4o describing action and region.
     """
-    b64_start = encode_image(start_img)
-    b64_stop = encode_image(stop_img)
-    b64_live = encode_image(live_img)
 
     # Prompt for action inference using start, stop, and current screenshots, based on region indices
     prompt_instruction_region = '''
     Your goal is to reproduce the action {predicted_action} from the GUI recording on a real device. I show you the three GUI screenshots by order. In the recording, the interaction with the highlighted purple region in the first GUI leads to the second GUI. The current GUI on your device is shown as the third GUI, on which element should you perform the action to achieve the same transition? Please follow the primitive in action space.
  
+    The numbers on the third GUI label its UI elements; name the element to act on as "element". Only if the target has no label there, name the highlighted region of the first GUI it corresponds to as "region" (the index shown on the first GUI). Never put a label of the third GUI into "region".
+ 
     ### Possible Actions: 
-    1. **tap** - Taps a location on screen. - Example: { "action": "tap", "region": 2, "description": "Tap center of screen to open app." } 
+    1. **tap** - Taps a location on screen. - Example: { "action": "tap", "element": 2, "description": "Tap center of screen to open app." } 
  
     2. **swipe** - Swipes from one point to another. - Example: { "action": "swipe", "from": [540, 1600], "to": [540, 400], "duration": 500, "description": "Swipe up to scroll." } 
  
@@ -110,24 +246,26 @@ def ask_gpt_for_action_region(start_img, stop_img, live_img, predicted_action, r
     Return a **JSON object** describing the required action. Do not include any other text or explanation.
     '''
 
-    response = client.chat.completions.create(
+    response = chat_completion(
+        "critical",
         model="gpt-4o",
         # temperature=0.2,
         messages=[
             {"role": "user", "content": [
-                {"type": "text", "text": prompt_instruction_region },
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64_start}", "detail": "low"}},
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64_stop}", "detail": "low"}},
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64_live}", "detail": "high"}}
+                {"type": "text", "text": prompt_instruction_region},
+                image_part(start_img, "low"),
+                image_part(stop_img, "low"),
+                image_part(live_img, "high"),
             ]}
         ]
     )
 
-    print("Region Action Response from GPT-4o:", response.choices[0].message.content)
+    logger.info(f"Region Action Response from GPT-4o: {response.choices[0].message.content}")
 
     return response.choices[0].message.content
 
-def ask_gpt_for_relevant_regions(start_img_path, stop_img_path):
+@tracing.traced("vlm.relevant_regions")
+def ask_gpt_for_relevant_regions(start_img_path, stop_img_path, stop_crops=None):
     """
     Sends start and stop images to GPT-4o and asks which UI regions are most relevant for
     the transition, and predicts the action type.
@@ -135,6 +273,7 @@ def ask_gpt_for_relevant_regions(start_img_path, stop_img_path):
     Args:
         start_img_path (str): Path to start (reference) image.
         stop_img_path (str): Path to stop (after interaction) image.
+        stop_crops (list): Optional high-detail crops of the stop image; it is then sent at low detail.
 
     Returns:
         str: JSON response with relevant regions and predicted action.
@@ -164,17 +303,18 @@ def ask_gpt_for_relevant_regions(start_img_path, stop_img_path):
       { "target_regions": [int, int, ...], "predicted_action": "<action>" }
       """
 
-    response = client.chat.completions.create(
+    response = chat_completion(
+        "prefetch",
         model="gpt-4o",
         messages=[{
             "role": "user",
             "content": [
-                {"type": "text", "text": prompt_instruction_relevant_regions + "\n\nScreenshots are attached below."},
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encode_image(start_img_path)}", "detail": "high"}},
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encode_image(stop_img_path)}", "detail": "high"}}
+                {"type": "text", "text": prompt_instruction_relevant_regions + (CROP_NOTE if stop_crops else "") + "\n\nScreenshots are attached below."},
+                image_part(start_img_path, "high"),
+                *image_parts(stop_img_path, "FOLLOW-UP state", "high", stop_crops),
             ]
         }]
     )
 
-    print("Relevant Region Response from GPT-4o:", response.choices[0].message.content)
+    logger.info(f"Relevant Region Response from GPT-4o: {response.choices[0].message.content}")
     return response.choices[0].message.content
@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: the state file is locked with msvcrt instead
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+import tracing
+
+"""
+Token-bucket rate limiter for VLM requests, shared by all threads and, through a locked state
+file, by all replay processes on a host.
+
+- Two buckets: requests per minute and tokens per minute (image tokens dominate).
+- "critical" calls (device-state checks a replay is blocked on) may drain both buckets;
+  "prefetch" calls (recording analysis) leave a reserve and yield while a critical call waits.
+- A provider rate-limit response blocks the shared buckets for its retry-after period, so
+  every process backs off together instead of producing a storm of 429s.
+- Queue waits are recorded per priority (and as "vlm.queue" tracing spans).
+"""
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+PRIORITIES = ("critical", "prefetch")
+BURST_SECONDS = 10          # Bucket capacity: this many seconds of budget
+PREFETCH_RESERVE = 0.25     # Share of each bucket prefetch calls leave for critical calls
+MAX_SLEEP = 0.5             # Waiters re-check the shared state at least this often
+WAITER_TTL = 2.0            # A critical waiter that stops polling is forgotten after this long
+
+
+def lock_file(f):
+    """Takes an exclusive lock on an open file, blocking until it is available (fcntl or msvcrt)."""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:  # LK_LOCK gives up after about 10 seconds; keep waiting
+            continue
+
+def unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter.
+
+    Args:
+        rpm (float): Requests per minute.
+        tpm (float): Tokens per minute.
+        state_path (str): JSON state file shared between processes (None: this process only).
+        clock (callable): Wall-clock time in seconds (shared between processes, so not monotonic).
+        sleep (callable): Sleeps for a number of seconds.
+    """
+    def __init__(self, rpm, tpm, state_path=None, clock=time.time, sleep=time.sleep):
+        self.limits = {"requests": float(rpm), "tokens": float(tpm)}
+        self.clock = clock
+        self.sleep = sleep
+        shared = fcntl is not None or msvcrt is not None
+        self.state_path = state_path if shared else None
+        self._lock = threading.Lock()
+        self._state = None
+        self.waits = {priority: [] for priority in PRIORITIES}
+        if state_path and not shared:
+            logger.warning("⚠️ Neither fcntl nor msvcrt is available; the rate limit is not shared between processes.")
+
+    def capacity(self, kind):
+        return max(1.0, self.limits[kind] * BURST_SECONDS / 60.0)
+
+    def _fresh_state(self, now):
+        return {
+            "levels": {kind: self.capacity(kind) for kind in self.limits},
+            "updated": now,
+            "blocked_until": 0.0,
+            "critical_waiters": {},
+        }
+
+    @contextmanager
+    def _transaction(self):
+        """Yields the shared state under the thread lock and, if configured, an exclusive file lock."""
+        with self._lock:
+            if self.state_path is None:
+                if self._state is None:
+                    self._state = self._fresh_state(self.clock())
+                yield self._state
+                return
+
+            with open(self.state_path + ".lock", "a+") as lock:
+                lock_file(lock)
+                try:
+                    try:
+                        with open(self.state_path, "r", encoding="utf-8") as f:
+                            state = json.load(f)
+                    except (OSError, ValueError):
+                        state = self._fresh_state(self.clock())
+                    yield state
+                    tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(state, f)
+                    os.replace(tmp_path, self.state_path)
+                finally:
+                    unlock_file(lock)
+
+    def _refill(self, state, now):
+        elapsed = max(0.0, now - state["updated"])
+        for kind, limit in self.limits.items():
+            state["levels"][kind] = min(self.capacity(kind), state["levels"][kind] + elapsed * limit / 60.0)
+        state["updated"] = now
+
+    def _delay(self, state, tokens, priority, critical_waiting, now):
+        """Seconds until a call may start (0.0: now)."""
+        if state["blocked_until"] > now:
+            return state["blocked_until"] - now
+        if priority != "critical" and critical_waiting:
+            return MAX_SLEEP
+        reserve = PREFETCH_RESERVE if priority != "critical" else 0.0
+        delay = 0.0
+        for kind, cost in (("requests", 1.0), ("tokens", float(tokens))):
+            capacity = self.capacity(kind)
+            # Calls larger than the bucket start when it is full and leave it in debt.
+            needed = min(cost + reserve * capacity, capacity)
+            level = state["levels"][kind]
+            if level < needed:
+                delay = max(delay, (needed - level) * 60.0 / self.limits[kind])
+        return delay
+
+    def acquire(self, tokens, priority="critical"):
+        """
+        Blocks until a call costing `tokens` fits into the budget, then consumes it.
+
+        Args:
+            tokens (int): Estimated tokens of the call (prompt, images and expected output).
+            priority (str): "critical" or "prefetch".
+
+        Returns:
+            float: Seconds spent waiting in the queue.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        waiter = f"{os.getpid()}-{threading.get_ident()}"
+        start = self.clock()
+        with tracing.span("vlm.queue", priority=priority, tokens=tokens):
+            while True:
+                with self._transaction() as state:
+                    now = self.clock()
+                    self._refill(state, now)
+                    waiters = {k: t for k, t in state["critical_waiters"].items() if t > now and k != waiter}
+                    delay = self._delay(state, tokens, priority, bool(waiters), now)
+                    if delay <= 0.0:
+                        state["levels"]["requests"] -= 1.0
+                        state["levels"]["tokens"] -= float(tokens)
+                    elif priority == "critical":
+                        waiters[waiter] = now + min(delay, MAX_SLEEP) + WAITER_TTL
+                    state["critical_waiters"] = waiters
+                if delay <= 0.0:
+                    break
+                self.sleep(min(delay, MAX_SLEEP))
+
+        wait = self.clock() - start
+        self.waits[priority].append(wait)
+        if wait > 1.0:
+            logger.info(f"⏳ {priority} VLM call waited {wait:.1f}s for rate limit budget.")
+        return wait
+
+    def block(self, seconds):
+        """Stops all callers (in every process) for `seconds`, e.g. after a rate-limit response."""
+        with self._transaction() as state:
+            now = self.clock()
+            self._refill(state, now)
+            state["blocked_until"] = max(state["blocked_until"], now + seconds)
+            for kind in state["levels"]:
+                state["levels"][kind] = min(state["levels"][kind], 0.0)
+
+    def metrics(self):
+        """Queue-wait statistics per priority (calls, mean/p95/max wait in seconds)."""
+        metrics = {}
+        for priority, waits in self.waits.items():
+            ordered = sorted(waits)
+            metrics[priority] = {
+                "calls": len(ordered),
+                "mean_wait_s": sum(ordered) / len(ordered) if ordered else 0.0,
+                "p95_wait_s": ordered[int(0.95 * (len(ordered) - 1))] if ordered else 0.0,
+                "max_wait_s": ordered[-1] if ordered else 0.0,
+            }
+        return metrics
+
+    def log_summary(self):
+        for priority, m in self.metrics().items():
+            if m["calls"]:
+                logger.info(
+                    f"📊 Rate limiter ({priority}): {m['calls']} calls, queue wait mean {m['mean_wait_s']:.2f}s, "
+                    f"p95 {m['p95_wait_s']:.2f}s, max {m['max_wait_s']:.2f}s"
+                )
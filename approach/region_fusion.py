@@ -0,0 +1,159 @@
+import logging
+
+import numpy as np
+
+"""
+Geometric fusion of GroundingDINO regions (detected on a recording keyframe) with the
+AndroidElements parsed from the live device's UI dump.
+
+DINO boxes are scaled from recording resolution to device resolution, the IoU and
+center-distance matrices against all element bounds are computed in one NumPy pass, and
+regions are matched one-to-one to elements with an optimal (Hungarian) assignment.
+All lookups afterwards are dictionary or array operations.
+"""
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+MIN_IOU = 0.1                # pairs below this IoU only match if their centers are close
+MAX_CENTER_DIST = 0.05       # as a fraction of the device screen diagonal
+DIST_WEIGHT = 2.0            # weight of the normalized center distance in the matching cost
+INVALID_COST = 1e6
+
+
+def boxes_array(boxes):
+    """(N, 4) float array of [x1, y1, x2, y2] boxes."""
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+def box_centers(boxes):
+    return (boxes[:, :2] + boxes[:, 2:]) / 2
+
+def pairwise_iou(a, b):
+    """IoU matrix of shape (len(a), len(b))."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+def pairwise_center_distance(a, b):
+    """Euclidean distance matrix between box centers, shape (len(a), len(b))."""
+    delta = box_centers(a)[:, None, :] - box_centers(b)[None, :, :]
+    return np.hypot(delta[..., 0], delta[..., 1])
+
+def assign(cost, valid):
+    """
+    One-to-one assignment minimizing the total cost over valid pairs.
+
+    Uses scipy's Hungarian solver when available, otherwise a greedy lowest-cost-first pass.
+
+    Returns:
+        list: (row, col) pairs.
+    """
+    if cost.size == 0:
+        return []
+    try:
+        from scipy.optimize import linear_sum_assignment  # deferred: scipy.optimize is slow to import
+    except ImportError:  # scipy is optional
+        linear_sum_assignment = None
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(np.where(valid, cost, INVALID_COST))
+        return [(int(r), int(c)) for r, c in zip(rows, cols) if valid[r, c]]
+
+    pairs, used_rows, used_cols = [], set(), set()
+    for flat in np.argsort(cost, axis=None):
+        r, c = np.unravel_index(flat, cost.shape)
+        if valid[r, c] and r not in used_rows and c not in used_cols:
+            pairs.append((int(r), int(c)))
+            used_rows.add(r)
+            used_cols.add(c)
+    return pairs
+
+def as_index(value):
+    """An index from a model reply (2, 2.0 or "2") as an int, or None if it is not one."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+def nearest_index(centers, point):
+    """Index of the center closest to point, or None if there are no centers."""
+    if len(centers) == 0:
+        return None
+    return int(np.argmin(np.hypot(centers[:, 0] - point[0], centers[:, 1] - point[1])))
+
+
+class RegionFusion:
+    """
+    Correspondence between DINO regions of a recording keyframe and UI elements on the device.
+
+    Args:
+        regions (list): DINO regions ({"index", "box", ...}) in recording pixels.
+        elements (list): AndroidElements parsed from the device UI dump.
+        recording_size (tuple): (width, height) of the keyframe the regions were detected on.
+        device_size (tuple): (width, height) of the device screenshot.
+    """
+    def __init__(self, regions, elements, recording_size, device_size):
+        self.elements = elements
+        sx = device_size[0] / recording_size[0]
+        sy = device_size[1] / recording_size[1]
+
+        self.region_indices = [r["index"] for r in regions]
+        self.region_boxes = boxes_array([r["box"] for r in regions]) * (sx, sy, sx, sy)
+        self.element_boxes = boxes_array([e.bounds for e in elements])
+        self.element_centers = np.array([e.center for e in elements], dtype=np.float64).reshape(-1, 2)
+
+        iou = pairwise_iou(self.region_boxes, self.element_boxes)
+        dist = pairwise_center_distance(self.region_boxes, self.element_boxes) / np.hypot(*device_size)
+        valid = (iou >= MIN_IOU) | (dist <= MAX_CENTER_DIST)
+        pairs = assign((1 - iou) + DIST_WEIGHT * dist, valid)
+
+        self.region_to_element = {self.region_indices[r]: c for r, c in pairs}
+        self.region_centers = {
+            index: tuple(int(v) for v in center)
+            for index, center in zip(self.region_indices, box_centers(self.region_boxes))
+        }
+        logger.debug(f"Fused {len(pairs)} of {len(regions)} DINO regions with {len(elements)} UI elements.")
+
+    def element_center(self, element_index):
+        """Center of the element with this label index, or None if there is no such element."""
+        element_index = as_index(element_index)
+        if element_index is not None and 0 <= element_index < len(self.elements):
+            return self.elements[element_index].center
+        return None
+
+    def region_element(self, region_index):
+        """AndroidElement matched to a DINO region, or None."""
+        element_index = self.region_to_element.get(region_index)
+        return self.elements[element_index] if element_index is not None else None
+
+    def region_center(self, region_index):
+        """
+        Device coordinates for a DINO region: the center of its matched element, or the
+        scaled center of the region itself if no element matched (None for unknown regions).
+        """
+        region_index = as_index(region_index)
+        element = self.region_element(region_index)
+        return element.center if element is not None else self.region_centers.get(region_index)
+
+    def center(self, candidate):
+        """
+        Device coordinates of a tagged candidate: ("element", label index on the device
+        screenshot) or ("region", DINO region index of the recording). None if unknown.
+        """
+        kind, index = candidate
+        return self.element_center(index) if kind == "element" else self.region_center(index)
+
+    def nearest_element(self, point):
+        """Element whose center is closest to a device point, or None if there are no elements."""
+        index = nearest_index(self.element_centers, point)
+        return self.elements[index] if index is not None else None
@@ -0,0 +1,309 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from collections import defaultdict
+
+import cv2
+
+"""
+Recorded stand-ins for the device, the VLM and the region detector.
+
+A replay fixture captures everything a live replay observed from the outside world:
+- device screenshots and UI XML dumps, per device state (the state advances with every executed action script),
+- every GPT-4o reply, keyed by function, replay step and call order within the step,
+- GroundingDINO regions per step.
+
+`Recording*` wrappers write a fixture while a live replay runs; `SimulatedDevice`, `RecordedVLM`
+and `RecordedDetector` serve it back so `segment_replay.main` can run offline and deterministically.
+`build_keyframe_fixture` creates a fixture without a device or an API key: the device states are the
+recording's own keyframes, with canned UI dumps and replies that tap where each transition changed the screen.
+"""
+
+logger = logging.getLogger(__name__)
+
+FIXTURE_DIR_NAME = "replay_fixture"
+FIXTURE_FILE = "fixture.json"
+FIXTURE_VERSION = 1
+VLM_FUNCTIONS = ("ask_gpt_state_consistency", "ask_gpt_for_action_region", "ask_gpt_for_relevant_regions")
+
+# Replies served when a replay diverges from the recording (a call that was never recorded).
+DEFAULT_REPLIES = {
+    "ask_gpt_state_consistency": '{"same_state": "yes"}',
+    "ask_gpt_for_action_region": '{"action": "no action", "description": "No recorded reply."}',
+    "ask_gpt_for_relevant_regions": '{"target_regions": [], "predicted_action": "no action"}',
+}
+
+COLOR_RED = (0, 0, 255)
+
+KEYFRAME_XML = ("<?xml version='1.0' encoding='UTF-8' standalone='yes' ?><hierarchy rotation=\"0\">"
+                "<node index=\"0\" text=\"\" resource-id=\"\" class=\"android.widget.FrameLayout\" clickable=\"false\" "
+                "bounds=\"[0,0][{width},{height}]\">{nodes}</node></hierarchy>")
+KEYFRAME_NODE = ("<node index=\"{index}\" text=\"\" resource-id=\"vibr:id/change_{index}\" class=\"android.view.View\" "
+                 "clickable=\"true\" bounds=\"[{x1},{y1}][{x2},{y2}]\" />")
+
+
+def step_key(path):
+    """Replay step of an intermediate file, i.e. the name of its step directory (e.g. 'step_3')."""
+    return os.path.basename(os.path.dirname(os.path.abspath(path)))
+
+def fixture_dir_for(video_path):
+    """Default fixture location: next to the recording."""
+    return os.path.join(os.path.dirname(os.path.abspath(video_path)), FIXTURE_DIR_NAME)
+
+
+class ReplayFixture:
+    """On-disk fixture: fixture.json plus a states/ folder with screenshots and UI dumps."""
+    def __init__(self, root, data=None):
+        self.root = root
+        self.data = data or {"version": FIXTURE_VERSION, "states": [], "vlm": {}, "detections": {}}
+        self._lock = threading.Lock()  # screenshots and UI dumps are recorded from concurrent threads
+
+    @classmethod
+    def load(cls, root):
+        with open(os.path.join(root, FIXTURE_FILE), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != FIXTURE_VERSION:
+            raise ValueError(f"Unsupported fixture version {data.get('version')} in {root}")
+        return cls(root, data)
+
+    @staticmethod
+    def exists(root):
+        return os.path.exists(os.path.join(root, FIXTURE_FILE))
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, FIXTURE_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=1)
+
+    def state(self, index, create=False):
+        """Returns the dict describing device state `index` (None if it was never recorded)."""
+        states = self.data["states"]
+        with self._lock:
+            if create:
+                while len(states) <= index:
+                    states.append({"screenshot": None, "xml": None})
+            return states[index] if index < len(states) else None
+
+    def path(self, rel_path):
+        return os.path.join(self.root, rel_path)
+
+
+def build_keyframe_fixture(video_path, fixture_dir=None):
+    """
+    Builds a replay fixture offline from a recording's keyframes.
+
+    Device state i is the start keyframe of step i and the last state is the final stop keyframe,
+    so a replay that executes every step walks through the recording. The UI dump of a state has
+    one clickable element per area the following transition changes; the canned replies select no
+    DINO region and tap the largest of those areas. No detections and no consistency replies are
+    stored: identical frames are decided by the local consistency gate.
+
+    Returns:
+        ReplayFixture: The saved fixture.
+    """
+    import video_analysis
+    from change_localization import change_boxes
+
+    fixture = ReplayFixture(fixture_dir or fixture_dir_for(video_path))
+    fixture.data["source"] = "keyframes"
+    frames, stable_segments, _ = video_analysis.segment_video(video_path, cache_folder=None)
+    keyframes = [frames[start if i == len(stable_segments) - 1 else end]
+                 for i, (start, end) in enumerate(stable_segments)]
+    height, width = keyframes[0].shape[:2]
+    os.makedirs(fixture.path("states"), exist_ok=True)
+
+    for i, image in enumerate(keyframes):
+        boxes = change_boxes(image, keyframes[i + 1]) if i + 1 < len(keyframes) else []
+        nodes = "".join(KEYFRAME_NODE.format(index=k, x1=x1, y1=y1, x2=x2, y2=y2) for k, (x1, y1, x2, y2) in enumerate(boxes))
+        state = fixture.state(i, create=True)
+        state["screenshot"], state["xml"] = os.path.join("states", f"{i}.png"), os.path.join("states", f"{i}.xml")
+        cv2.imwrite(fixture.path(state["screenshot"]), image)
+        with open(fixture.path(state["xml"]), "w", encoding="utf-8") as f:
+            f.write(KEYFRAME_XML.format(width=width, height=height, nodes=nodes))
+        if i + 1 == len(keyframes):
+            break
+
+        x1, y1, x2, y2 = boxes[0] if boxes else (0, 0, width, height)
+        step = f"step_{i}"
+        fixture.data["vlm"].setdefault("ask_gpt_for_relevant_regions", {})[step] = [
+            json.dumps({"target_regions": [], "predicted_action": "tap"})
+        ]
+        fixture.data["vlm"].setdefault("ask_gpt_for_action_region", {})[step] = [
+            json.dumps({"action": "tap", "position": [(x1 + x2) // 2, (y1 + y2) // 2], "description": "Tap the changed area."})
+        ]
+
+    fixture.save()
+    logger.info(f"Keyframe fixture with {len(keyframes)} device states written to {fixture.root}")
+    return fixture
+
+
+# --- Recording ---
+class RecordingDevice:
+    """Wraps a real device controller and records what it observes into a fixture."""
+    def __init__(self, device, fixture):
+        self.device = device
+        self.fixture = fixture
+        self.state_index = 0
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def screenshot(self, index, save_path):
+        local_path = self.device.screenshot(index, save_path)
+        state = self.fixture.state(self.state_index, create=True)
+        if state["screenshot"] is None and os.path.exists(local_path):
+            rel_path = os.path.join("states", f"{self.state_index}.png")
+            os.makedirs(os.path.dirname(self.fixture.path(rel_path)), exist_ok=True)
+            shutil.copyfile(local_path, self.fixture.path(rel_path))
+            state["screenshot"] = rel_path
+        return local_path
+
+    def get_ui_xml(self, *args, **kwargs):
+        xml_str = self.device.get_ui_xml(*args, **kwargs)
+        state = self.fixture.state(self.state_index, create=True)
+        if state["xml"] is None:
+            rel_path = os.path.join("states", f"{self.state_index}.xml")
+            os.makedirs(os.path.dirname(self.fixture.path(rel_path)), exist_ok=True)
+            with open(self.fixture.path(rel_path), "w", encoding="utf-8") as f:
+                f.write(xml_str)
+            state["xml"] = rel_path
+        return xml_str
+
+    def run_script(self, script):
+        result = self.device.run_script(script)
+        self.state_index += 1
+        return result
+
+
+class RecordingVLM:
+    """Wraps the VLM client (e.g. the openai_api module) and records every reply."""
+    def __init__(self, vlm, fixture):
+        self.vlm = vlm
+        self.fixture = fixture
+
+    def __getattr__(self, name):
+        func = getattr(self.vlm, name)
+        if name not in VLM_FUNCTIONS:
+            return func
+
+        def record(first_image, *args, **kwargs):
+            reply = func(first_image, *args, **kwargs)
+            steps = self.fixture.data["vlm"].setdefault(name, {})
+            steps.setdefault(step_key(first_image), []).append(reply)
+            return reply
+        return record
+
+
+class RecordingDetector:
+    """Wraps the region detector (e.g. the dino_detection module) and records its regions."""
+    def __init__(self, detector, fixture):
+        self.detector = detector
+        self.fixture = fixture
+
+    def run_grounding_dino(self, image_path, output_path):
+        regions = self.detector.run_grounding_dino(image_path, output_path)
+        self.fixture.data["detections"][step_key(output_path)] = regions
+        return regions
+
+    def annotate_relevant_regions(self, *args, **kwargs):
+        return self.detector.annotate_relevant_regions(*args, **kwargs)
+
+
+# --- Replaying ---
+class SimulatedDevice:
+    """
+    Device stand-in that serves recorded screenshots and UI XML.
+
+    The served state advances by one with every executed action script, mirroring how the
+    recording was taken. Requests beyond the recording fall back to the last recorded state
+    and are counted as divergences.
+    """
+    def __init__(self, fixture):
+        self.fixture = fixture
+        self.state_index = 0
+        self.scripts = []
+        self.divergences = 0
+
+    def _state_file(self, kind):
+        for index in range(self.state_index, -1, -1):
+            state = self.fixture.state(index)
+            if state and state[kind]:
+                if index != self.state_index:
+                    self.divergences += 1
+                return self.fixture.path(state[kind])
+        raise RuntimeError(f"Fixture {self.fixture.root} has no recorded {kind}")
+
+    def screenshot(self, index, save_path):
+        local_path = os.path.join(save_path, f"screenshot-{index}.png")
+        shutil.copyfile(self._state_file("screenshot"), local_path)
+        return local_path
+
+    def get_ui_xml(self, local_path=None):
+        with open(self._state_file("xml"), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def run_script(self, script):
+        self.scripts.append(script)
+        self.state_index += 1
+        return subprocess.CompletedProcess(["adb", "shell", script], 0, "", "")
+
+    def wait_for_settle(self, *args, **kwargs):
+        return True
+
+
+class RecordedVLM:
+    """Serves recorded VLM replies in the order they were given within each step."""
+    def __init__(self, fixture):
+        self.fixture = fixture
+        self.calls = defaultdict(int)
+        self.divergences = 0
+        self._cursor = defaultdict(int)
+
+    def _reply(self, name, first_image):
+        key = (name, step_key(first_image))
+        self.calls[name] += 1
+        replies = self.fixture.data["vlm"].get(name, {}).get(key[1], [])
+        position = self._cursor[key]
+        self._cursor[key] += 1
+        if position < len(replies):
+            return replies[position]
+        self.divergences += 1
+        logger.warning(f"No recorded {name} reply #{position} for {key[1]}; using default.")
+        return DEFAULT_REPLIES[name]
+
+    def ask_gpt_state_consistency(self, start_img, *args, **kwargs):
+        return self._reply("ask_gpt_state_consistency", start_img)
+
+    def ask_gpt_for_action_region(self, start_img, *args, **kwargs):
+        return self._reply("ask_gpt_for_action_region", start_img)
+
+    def ask_gpt_for_relevant_regions(self, start_img_path, *args, **kwargs):
+        return self._reply("ask_gpt_for_relevant_regions", start_img_path)
+
+
+class RecordedDetector:
+    """Serves recorded GroundingDINO regions and draws plain OpenCV annotations."""
+    def __init__(self, fixture):
+        self.fixture = fixture
+        self.calls = 0
+
+    @staticmethod
+    def _draw(image_path, output_path, regions):
+        image = cv2.imread(image_path)
+        for r in regions:
+            x1, y1, x2, y2 = r["box"]
+            cv2.rectangle(image, (x1, y1), (x2, y2), COLOR_RED, 2)
+            cv2.putText(image, str(r["index"]), (x1, max(y1 - 4, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, COLOR_RED, 2)
+        cv2.imwrite(output_path, image)
+
+    def run_grounding_dino(self, image_path, output_path):
+        self.calls += 1
+        regions = self.fixture.data["detections"].get(step_key(output_path), [])
+        self._draw(image_path, output_path, regions)
+        return regions
+
+    def annotate_relevant_regions(self, image_path, output_path, regions, relevant_indices):
+        self._draw(image_path, output_path, [r for r in regions if r["index"] in relevant_indices])
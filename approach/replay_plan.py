@@ -0,0 +1,199 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import zipfile
+
+import openai_api
+from yyh_utils import file_sha256
+from video_analysis import segment_video, write_keyframes, keyframe_paths, analyze_step, load_detector
+
+"""
+Compiles a recording into a reusable replay plan.
+
+Everything a replay needs that depends only on the video (decoding, similarity, segmentation,
+keyframes, GroundingDINO regions and GPT-4o relevant-region replies) is computed once and stored
+in a single versioned zip file:
+
+    plan.json              manifest: version, source video, frame size, segments and per-step analysis
+    steps/<i>/start.png    start keyframe of step i
+    steps/<i>/stop.png     stop keyframe of step i
+    steps/<i>/dino.png     start keyframe annotated with all detected regions
+    steps/<i>/relevant.png start keyframe annotated with the relevant regions
+
+`python segment_replay.py --plan <plan.zip>` replays a plan on any device without the video.
+"""
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+PLAN_MANIFEST = "plan.json"
+ASPECT_TOLERANCE = 0.02  # Relative aspect-ratio difference between recording and device that is still the same layout
+STEP_FILES = {"start.png": "tmp_start.png", "stop.png": "tmp_stop.png", "dino.png": "dino.png", "relevant.png": "relevant_regions.png"}
+
+
+def default_plan_path(video_path):
+    return os.path.splitext(video_path)[0] + ".plan.zip"
+
+
+class ReplayPlan:
+    """Read access to a compiled replay plan."""
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+
+    @classmethod
+    def load(cls, path):
+        with zipfile.ZipFile(path) as zf:
+            manifest = json.loads(zf.read(PLAN_MANIFEST))
+        if manifest.get("version") != PLAN_VERSION:
+            raise ValueError(f"Unsupported replay plan version {manifest.get('version')} in {path}")
+        return cls(path, manifest)
+
+    @property
+    def video_stem(self):
+        return self.manifest["video"]["stem"]
+
+    @property
+    def frame_size(self):
+        """(width, height) of the recording the plan was compiled from."""
+        return tuple(self.manifest["frame_size"])
+
+    @property
+    def segments(self):
+        return [tuple(s) for s in self.manifest["segments"]]
+
+    @property
+    def merged_segments(self):
+        """Replay steps removed by collapsing near-duplicate segments when the plan was compiled."""
+        return self.manifest.get("merged_segments", 0)
+
+    def step(self, index):
+        return self.manifest["steps"][index]
+
+    def check_screen(self, screen_size):
+        """
+        Warns if a device screen has another aspect ratio than the recording.
+
+        Recorded regions are mapped onto the device by scaling each axis, which only
+        preserves the layout when both screens have the same shape.
+
+        Returns:
+            bool: True if the aspect ratios match.
+        """
+        (rec_w, rec_h), (dev_w, dev_h) = self.frame_size, screen_size
+        mismatch = abs((dev_w / dev_h) / (rec_w / rec_h) - 1)
+        if mismatch > ASPECT_TOLERANCE:
+            logger.warning(f"⚠️ Device screen {dev_w}x{dev_h} does not have the aspect ratio of the recording "
+                           f"({rec_w}x{rec_h}); recorded regions may land on the wrong elements.")
+            return False
+        return True
+
+    def extract_step(self, index, step_out_dir):
+        """
+        Writes the images of a step into a step folder, under the names a replay uses.
+
+        Returns:
+            dict: Same keys as video_analysis.analyze_step.
+        """
+        os.makedirs(step_out_dir, exist_ok=True)
+        with zipfile.ZipFile(self.path) as zf:
+            for name, out_name in STEP_FILES.items():
+                with open(os.path.join(step_out_dir, out_name), "wb") as f:
+                    f.write(zf.read(f"steps/{index}/{name}"))
+
+        step = self.step(index)
+        return {
+            "regions": step["regions"],
+            "relevant_reply": step["relevant_reply"],
+            "predicted_action": step["predicted_action"],
+            "target_indices": step["target_indices"],
+            "dino_path": os.path.join(step_out_dir, STEP_FILES["dino.png"]),
+            "relevant_path": os.path.join(step_out_dir, STEP_FILES["relevant.png"]),
+        }
+
+
+def compile_plan(video_path, plan_path=None, detector=None, vlm=None, cache_folder="./cache", fast_segmentation=False,
+                 collapse_duplicates=False):
+    """
+    Runs the video-only part of a replay and stores it as a replay plan.
+
+    Args:
+        video_path (str): Path to the input video.
+        plan_path (str): Output file (defaults to <video>.plan.zip).
+        detector: Object providing run_grounding_dino/annotate_relevant_regions (defaults to dino_detection).
+        vlm: Object providing ask_gpt_for_relevant_regions (defaults to the openai_api module).
+        cache_folder (str): Similarity cache directory (None disables the cache).
+        fast_segmentation (bool): Only decode and score frames around transitions found from packet statistics.
+        collapse_duplicates (bool): Merge consecutive segments whose keyframes show no localized change.
+
+    Returns:
+        str: Path of the written plan.
+    """
+    plan_path = plan_path or default_plan_path(video_path)
+    detector = detector or load_detector()
+    vlm = vlm or openai_api
+
+    frames, stable_segments, merged = segment_video(video_path, cache_folder, collapse_duplicates, fast=fast_segmentation)
+    frame_h, frame_w = frames[0].shape[:2]
+
+    manifest = {
+        "version": PLAN_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "video": {
+            "name": os.path.basename(video_path),
+            "stem": os.path.splitext(os.path.basename(video_path))[0],
+            "size": os.path.getsize(video_path),
+            "sha256": file_sha256(video_path),
+        },
+        "frame_size": [frame_w, frame_h],
+        "segments": [list(map(int, s)) for s in stable_segments],
+        "merged_segments": merged,
+        "steps": [],
+    }
+
+    tmp_plan_path = plan_path + ".tmp"
+    with tempfile.TemporaryDirectory() as work_dir, zipfile.ZipFile(tmp_plan_path, "w") as zf:
+        write_keyframes(work_dir, frames, stable_segments)
+        del frames
+
+        for i in range(len(stable_segments) - 1):
+            logger.info(f"📂 Analyzing segment {i}...")
+            tmp_start_path, tmp_stop_path = keyframe_paths(work_dir, i)
+            analysis = analyze_step(os.path.dirname(tmp_start_path), tmp_start_path, tmp_stop_path, detector, vlm)
+
+            # PNGs are already compressed; store them as-is.
+            for name, path in (("start.png", tmp_start_path), ("stop.png", tmp_stop_path),
+                               ("dino.png", analysis["dino_path"]), ("relevant.png", analysis["relevant_path"])):
+                zf.write(path, f"steps/{i}/{name}", compress_type=zipfile.ZIP_STORED)
+
+            manifest["steps"].append({
+                "index": i,
+                "start_frame": int(stable_segments[i][1]),
+                "stop_frame": int(stable_segments[i + 1][0]),
+                "regions": analysis["regions"],
+                "relevant_reply": analysis["relevant_reply"],
+                "predicted_action": analysis["predicted_action"],
+                "target_indices": analysis["target_indices"],
+            })
+
+        zf.writestr(PLAN_MANIFEST, json.dumps(manifest, indent=1), compress_type=zipfile.ZIP_DEFLATED)
+    os.replace(tmp_plan_path, plan_path)
+
+    logger.info(f"✅ Replay plan with {len(manifest['steps'])} steps written to {plan_path}")
+    return plan_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a recording into a reusable replay plan.")
+    parser.add_argument("video_path", type=str, help="Path to the input video")
+    parser.add_argument("-o", "--output", default=None, help="Plan file (default: <video>.plan.zip)")
+    parser.add_argument("--fast-segmentation", action="store_true", help="Locate transitions from packet statistics and only decode frames around them (needs PyAV or ffprobe)")
+    parser.add_argument("--collapse-duplicates", action="store_true", help="Merge consecutive segments whose keyframes show no localized change (drops their steps)")
+    parser.add_argument("--log-level", default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    compile_plan(args.video_path, args.output, fast_segmentation=args.fast_segmentation, collapse_duplicates=args.collapse_duplicates)
@@ -1,19 +1,22 @@
 import os
-import json
-import pickle
-import time
+import logging
 import cv2
 import sys
 import argparse
-from typing import List, Optional
-from math import hypot
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-from openai_api import ask_gpt_for_action_region, ask_gpt_state_consistency, ask_gpt_for_relevant_regions
+import openai_api
 from adb_device_controller import ADBDeviceController
 from execute_action import execute_actions
-import yyh_utils  # Your video/frame utils
+import tracing
+from video_analysis import extract_json, load_detector, segment_video, keyframe_paths, write_keyframes, analyze_step
 from input_formatter import parse_xml_string, label_screenshot, AndroidElement
-from dino_detection import run_grounding_dino, annotate_relevant_regions # Call reusable function from dino_detection.py
+from consistency_gate import LocalConsistencyGate
+from checkpoint import ReplayCheckpoint
+from replay_plan import ReplayPlan
+from region_fusion import RegionFusion
+from state_memo import StateMemo
 
 """
 Main script for segmenting a video of Android UI interaction and replaying those actions on a device.
@@ -21,26 +24,17 @@ Main script for segmenting a video of Android UI interaction and replaying those
 - Uses ADB to control a real or emulated Android device.
 - Extracts stable segments from a video recording.
 - For each segment: identifies key UI regions, queries GPT-4o for semantic reasoning, and executes actions via ADB.
+
+The device, the VLM client and the region detector can be swapped for recorded stand-ins
+(see replay_fixtures.py), which is how benchmark.py replays the dataset offline.
 """
 
-def extract_json(reply_text):
-    """
-    Extracts JSON object from GPT reply (removes any markdown formatting).
-    """
-    reply_text = reply_text.strip()
-    if reply_text.startswith("```json"):
-        reply_text = reply_text[7:]
-    elif reply_text.startswith("```"):
-        reply_text = reply_text[3:]
-    if reply_text.endswith("```"):
-        reply_text = reply_text[:-3]
+logger = logging.getLogger(__name__)
 
-    try:
-        return json.loads(reply_text.strip())
-    except json.JSONDecodeError as e:
-        print("❌ JSON decoding failed:", e)
-        raise
+# --- Constants ---
+POSITIONAL_ACTIONS = ("tap", "double_tap", "long_press")
 
+@tracing.traced("human.inspect")
 def show_images(start_img, stop_img, current_img):
     """
     Displays three images side by side for human inspection (waits for keypress).
@@ -66,11 +60,12 @@ def show_images(start_img, stop_img, current_img):
         print("Exiting.")
         sys.exit(0)
 
-def match_action_to_element(action: dict, elements: List[AndroidElement]) -> Optional[AndroidElement]:
+def match_action_to_element(action: dict, fusion: RegionFusion) -> Optional[AndroidElement]:
     """
     Attempts to map an action (from GPT or logic) to the best matching AndroidElement.
     Tries by text, then by proximity to a position if given.
     """
+    elements = fusion.elements
     if "text" in action:
         target_text = action["text"].strip().lower()
         # Try exact match first
@@ -84,188 +79,309 @@ def match_action_to_element(action: dict, elements: List[AndroidElement]) -> Opt
 
     # Fallback: match to nearest clickable element if "position" is present
     if "position" in action:
-        px, py = action["position"]
-        closest_element = min(
-            elements,
-            key=lambda e: hypot(px - e.center[0], py - e.center[1]),
-            default=None
-        )
-        return closest_element
+        return fusion.nearest_element(action["position"])
 
     return None
 
-def main(video_path):
+def locate_action(action: dict, fusion: RegionFusion, target_indices=()) -> bool:
+    """
+    Sets the device position of an action in place.
+
+    The two index spaces are kept apart by tagging every candidate with its kind:
+    ("element", i) is label i on the live screenshot (XML elements), ("region", i) DINO
+    region i of the recording mapped onto the device. The reply's "element" is tried before
+    its "region"; otherwise the action is matched to an element by text or proximity.
+    Positional actions that name nothing fall back to the regions selected for the step.
+
+    Returns:
+        bool: True if a position was found.
+    """
+    named = [(kind, action[kind]) for kind in ("element", "region") if action.get(kind) is not None]
+    for candidate in named:
+        position = fusion.center(candidate)
+        if position is not None:
+            action["position"] = position
+            logger.info(f"🎯 Using {candidate[0]} {candidate[1]} at {position}")
+            return True
+
+    matched_element = match_action_to_element(action, fusion)
+    if matched_element:
+        action["position"] = matched_element.center
+        logger.info(f"🎯 Matched element: '{matched_element.text}' at {matched_element.center}")
+        return True
+
+    if action.get("action") in POSITIONAL_ACTIONS:
+        for candidate in (("region", index) for index in target_indices):
+            position = fusion.center(candidate)
+            if position is not None:
+                action["position"] = position
+                logger.info(f"🎯 Using selected recording region {candidate[1]} mapped to {position}")
+                return True
+    return False
+
+def check_state_consistency(gate, vlm, reference_path, live_path, vlm_reference_path=None, action="", target_regions=""):
+    """
+    Decides whether the live screen matches the reference state, asking GPT-4o only when needed.
+
+    The local gate compares the raw reference frame with the live screenshot; confident
+    verdicts are returned directly, ambiguous (or audited) ones are escalated to the VLM,
+    which may receive an annotated version of the reference (vlm_reference_path).
+    """
+    local = gate.check(cv2.imread(reference_path), cv2.imread(live_path)) if gate else None
+    if local and local["verdict"] is not None and not local["audit"]:
+        match = {"same_state": local["verdict"]}
+        if local["verdict"] == "no":
+            match["description"] = f"Local {local['tier'].upper()} check found the screens clearly different."
+        return match
+
+    match = extract_json(vlm.ask_gpt_state_consistency(vlm_reference_path or reference_path, live_path, action, target_regions))
+    if local:
+        gate.record_vlm_verdict(local, match["same_state"])
+    return match
+
+def parse_elements(xml_str):
+    """Clickable elements of a UI dump, or all elements if there are only a few clickable ones."""
+    elements = parse_xml_string(xml_str, bound_margin=10, min_cent_dist=20, clickable_only=True)
+    if len(elements) <= 5:
+        elements = parse_xml_string(xml_str, bound_margin=10, min_cent_dist=20)
+    return elements
+
+def dump_elements(device):
+    """Dumps the UI hierarchy of the device and parses its elements."""
+    xml_str = device.get_ui_xml()
+    return xml_str, parse_elements(xml_str)
+
+@tracing.traced("step.prepare")
+def prepare_step(pool, device, step_out_dir, analyze):
+    """
+    Captures the device state and runs the video-only analysis of a step concurrently.
+
+    The screenshot, the UI hierarchy dump (with parsing) and `analyze` (DINO and the
+    relevant-region query, or reading the replay plan) are independent, so a step waits
+    for the slowest of them instead of their sum. The tasks keep the step's tracing attributes.
+
+    Returns:
+        (str, str, list, dict): Screenshot path, UI XML, parsed elements and the analysis.
+    """
+    screenshot = pool.submit(tracing.bind(device.screenshot), index=0, save_path=step_out_dir)
+    ui_dump = pool.submit(tracing.bind(dump_elements), device)
+    analysis = pool.submit(tracing.bind(analyze))
+    xml_str, elements = ui_dump.result()
+    return screenshot.result(), xml_str, elements, analysis.result()
+
+def main(video_path=None, use_local_gate=True, audit_every=0, device=None, vlm=None, detector=None,
+         interactive=True, out_root="temp", cache_folder="./cache", resume=False, plan_path=None, localize_changes=True,
+         fast_segmentation=False, collapse_duplicates=False):
     """
     Main entry point: processes video and replays UI actions segment by segment.
+
+    Args:
+        video_path (str): Path to the input video (not needed when replaying a plan).
+        use_local_gate (bool): Decide clear-cut state consistency locally before asking GPT-4o.
+        audit_every (int): Also send every n-th local consistency decision to GPT-4o.
+        device: Device controller (defaults to ADBDeviceController()).
+        vlm: Object providing the ask_gpt_* functions (defaults to the openai_api module).
+        detector: Object providing run_grounding_dino/annotate_relevant_regions (defaults to dino_detection).
+        interactive (bool): Show the frames and wait for ENTER after each step.
+        out_root (str): Directory for temporary and intermediate files.
+        cache_folder (str): Similarity cache directory (None disables the cache).
+        resume (bool): Continue an interrupted replay from its checkpoint.
+        plan_path (str): Replay a compiled replay plan (see replay_plan.py) instead of analyzing the video.
+        localize_changes (bool): Send the recording's stop frame to GPT-4o as a low-detail view plus high-detail crops of the changed areas.
+        fast_segmentation (bool): Only decode and score frames around transitions found from packet statistics.
+        collapse_duplicates (bool): Merge consecutive segments whose keyframes show no localized change.
+
+    Returns:
+        dict: Replay summary with the number of segments, executed, skipped and merged steps.
     """
-    print("📹 Starting video processing...")
-    print("Initializing ADB device controller...")
-    device = ADBDeviceController()
+    logger.info("📹 Starting video processing...")
+    if device is None:
+        logger.info("Initializing ADB device controller...")
+        device = ADBDeviceController()
+    vlm = vlm or openai_api
+    plan = ReplayPlan.load(plan_path) if plan_path else None
+    if plan is None:
+        detector = detector or load_detector()
+    gate = LocalConsistencyGate(audit_every=audit_every) if use_local_gate else None
+    memo = StateMemo(parse_elements)
 
     # Set up output directory for temp and intermediate files
-    video_stem = os.path.splitext(os.path.basename(video_path))[0]
-    video_out_dir = os.path.join("temp", video_stem)
+    video_stem = plan.video_stem if plan else os.path.splitext(os.path.basename(video_path))[0]
+    video_out_dir = os.path.join(out_root, video_stem)
     os.makedirs(video_out_dir, exist_ok=True)
 
     # Get initial screenshot from device
     live_path = device.screenshot(index=0, save_path=video_out_dir)
-
-    # Read frames and header from the video using your custom util
-    frames, y_frames = yyh_utils.read_frames_from_video(video_path, header_pixel_size=33)
-
-    # Segment similarity caching to speed up repeated runs
-    cache_folder = "./cache"
-    os.makedirs(cache_folder, exist_ok=True)
-    sim_file = os.path.join(cache_folder, f"sim_list_{video_stem}.pkl")
-
-    if os.path.exists(sim_file):
-        with open(sim_file, "rb") as f:
-            sim_list = pickle.load(f)
-        print("✅ Similarity list loaded.")
-    else:
-        sim_list = yyh_utils.calculate_sim_seq(y_frames)
-        with open(sim_file, "wb") as f:
-            pickle.dump(sim_list, f)
-        print("📼 Similarity list calculated and saved.")
-
-    print("🔍 Detecting stable segments...")
-    segmenter = yyh_utils.VideoStableSegment(
-        stable_sim_threshold=0.99,
-        stable_interval_threshold=3
-    )
-    stable_segments = segmenter.detect_keyframes(sim_list)
-
-    if stable_segments[0][0] > 2:
-        stable_segments = [(0, 1)] + stable_segments
-
-    for i in range(len(stable_segments) - 1):
-        time.sleep(0.5)
-        print(f"\n📂 Processing segment {i}...")
-
-        step_out_dir = os.path.join(video_out_dir, f"step_{i}")
-        os.makedirs(step_out_dir, exist_ok=True)
-
-        start = stable_segments[i][1]
-        stop = stable_segments[i + 1][0]
-
-        start_img = frames[start]
-        stop_img = frames[stop]
-        live_path = device.screenshot(index=0, save_path=step_out_dir)
-
-        tmp_start_path = os.path.join(step_out_dir, "tmp_start.png")
-        tmp_stop_path = os.path.join(step_out_dir, "tmp_stop.png")
-        cv2.imwrite(tmp_start_path, start_img)
-        cv2.imwrite(tmp_stop_path, stop_img)
-
-        # XML UI parse and clickable element detection
-        xml_str = device.get_ui_xml()
-        elements = parse_xml_string(xml_str, bound_margin=10, min_cent_dist=20, clickable_only=True)
-        if len(elements) <= 5:
-            elements = parse_xml_string(xml_str, bound_margin=10, min_cent_dist=20)
-
-        # Save screenshot with UI element rectangles for debugging/labeling
-        labeled_path = label_screenshot(
-            screenshot_path=live_path,
-            screenshot_dir=step_out_dir,
-            name=f"labeled",
-            elements=elements,
-        )
-        current_img_labeled_xml_region = cv2.imread(labeled_path)
-
-        # Use DINO detection for grounding region proposals
-        dino_out_path = os.path.join(step_out_dir, "dino.png")
-        dino_regions = run_grounding_dino(tmp_start_path, dino_out_path)
-
-        # Prepare region descriptions for GPT prompt
-        regions = []
-        for idx, e in enumerate(elements):
-            region = {
-                "index": idx,
-                "center": e.center,
-                "box": list(e.bounds),
-                "phrase": e.text if e.text else "unknown element"
-            }
-            regions.append(region)
-
-        relevant = ask_gpt_for_relevant_regions(dino_out_path, tmp_stop_path)
-        relevant = extract_json(relevant)
-        print(f"🔍 Relevant regions: {relevant}")
-        target_indices = relevant["target_regions"]
-        print(f"🧠 GPT selected regions: {target_indices}")
-
-        relevant_annotated_path = os.path.join(step_out_dir, "relevant_regions.png")
-        annotate_relevant_regions(tmp_start_path, relevant_annotated_path, dino_regions, target_indices)
-
-        region_index_to_center = {r["index"]: r["center"] for r in regions}
-
-        show_images(
-            cv2.imread(relevant_annotated_path),
-            stop_img,
-            current_img_labeled_xml_region
-        )
-
-        match = extract_json(
-            ask_gpt_state_consistency(relevant_annotated_path, live_path, relevant["predicted_action"], relevant["target_regions"])
-        )
-
-        attempts = 0
-        max_attempts = 3
-        while match["same_state"] != "yes" and attempts < max_attempts:
-            print(f"🔄 Attempting to align state (try {attempts + 1}/{max_attempts})...")
-            elements = parse_xml_string(xml_str, bound_margin=10, min_cent_dist=20, clickable_only=True)
-            if len(elements) <= 5:
-                elements = parse_xml_string(xml_str, bound_margin=10, min_cent_dist=20)
-
-            labeled_path = label_screenshot(
-                screenshot_path=live_path,
-                screenshot_dir=step_out_dir,
-                name=f"labeled",
-                elements=elements,
-            )
-
-            recovery_reply = ask_gpt_for_action_region(tmp_start_path, tmp_stop_path, labeled_path, relevant["predicted_action"])
-            recovery_action = extract_json(recovery_reply)
-
-            if "region" in recovery_action and recovery_action["region"] in region_index_to_center:
-                recovery_action["position"] = region_index_to_center[recovery_action["region"]]
-                print(f"🎯 Recovery using region index: {recovery_action['region']} at {recovery_action['position']}")
-            else:
-                matched_element = match_action_to_element(recovery_action, elements)
-                if matched_element:
-                    recovery_action["position"] = matched_element.center
-                    print(f"🎯 Recovery matched element: '{matched_element.text}' at {matched_element.center}")
-
-            execute_actions(device, [recovery_action])
-            time.sleep(1.0)
-            live_path = device.screenshot(index=0, save_path=step_out_dir)
-            match = extract_json(ask_gpt_state_consistency(tmp_start_path, live_path))
-            attempts += 1
-
-        if match["same_state"] == "yes":
-            reply = ask_gpt_for_action_region(relevant_annotated_path, tmp_stop_path, labeled_path, relevant["predicted_action"], target_indices)
-            action = extract_json(reply)
-
-            matched_element = match_action_to_element(action, elements)
-            if "region" in action and action["region"] in region_index_to_center:
-                action["position"] = region_index_to_center[action["region"]]
-                print(f"🎯 Using region index: {action['region']} at {action['position']}")
-            elif matched_element:
-                action["position"] = matched_element.center
-                print(f"🎯 Matched element: '{matched_element.text}' at {matched_element.center}")
-            else:
-                print("⚠️ No valid region or element match. Using original position if available.")
-
-            execute_actions(device, [action])
-            print("✅ Action executed.\n")
-        else:
-            print("⚠️ Skipping action: current GUI state does not match start state.\nMismatch reason:", match["description"])
-
-        input("Press Enter to continue...")
-
-    print("✅ Video processing completed.")
+    if plan is not None:
+        live_h, live_w = cv2.imread(live_path).shape[:2]
+        plan.check_screen((live_w, live_h))
+
+    # Segment boundaries and keyframes are checkpointed, so a resumed replay does not decode the video again.
+    # Plans carry their own segments; for a video they depend on the segmentation options.
+    segmentation = None if plan else {"fast": fast_segmentation, "collapse_duplicates": collapse_duplicates}
+    checkpoint = ReplayCheckpoint.open(video_out_dir, plan_path or video_path, resume, segmentation)
+    stable_segments = checkpoint.segments
+    if plan is not None:
+        if stable_segments != plan.segments:
+            stable_segments = plan.segments
+            checkpoint.set_segments(stable_segments, plan.merged_segments)
+    elif stable_segments is None or not all(
+        os.path.exists(p) for i in range(len(stable_segments) - 1) for p in keyframe_paths(video_out_dir, i)
+    ):
+        frames, stable_segments, merged = segment_video(video_path, cache_folder, collapse_duplicates, fast=fast_segmentation)
+        write_keyframes(video_out_dir, frames, stable_segments)
+        checkpoint.set_segments(stable_segments, merged)
+        del frames
+
+    summary = {"segments": len(stable_segments), "steps": len(stable_segments) - 1, "executed": 0, "skipped": 0, "resumed": 0,
+               "merged": checkpoint.merged_segments}
+    if summary["merged"]:
+        logger.info(f"🔗 {summary['merged']} near-duplicate steps were merged away during segmentation.")
+
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="step-prepare") as pool:
+        for i in range(len(stable_segments) - 1):
+            if checkpoint.is_completed(i):
+                logger.info(f"⏩ Step {i} already {checkpoint.get(i, 'status')}, skipping.")
+                summary["resumed"] += 1
+                continue
+
+            tracing.set_attributes(step=i)
+            memo.start_step()
+            with tracing.span("step"):
+                device.wait_for_settle()
+                logger.info(f"📂 Processing segment {i}...")
+
+                step_out_dir = os.path.join(video_out_dir, f"step_{i}")
+                os.makedirs(step_out_dir, exist_ok=True)
+
+                tmp_start_path, tmp_stop_path = keyframe_paths(video_out_dir, i)
+
+                # Video-only analysis: from the replay plan if one is given, otherwise DINO + GPT-4o now
+                if plan is not None:
+                    analyze = lambda: plan.extract_step(i, step_out_dir)
+                else:
+                    analyze = lambda: analyze_step(
+                        step_out_dir, tmp_start_path, tmp_stop_path, detector, vlm,
+                        cached={"regions": checkpoint.get(i, "regions"), "relevant_reply": checkpoint.get(i, "relevant_reply")},
+                        record=lambda key, value: checkpoint.record(i, key, value),
+                        localize=localize_changes,
+                    )
+
+                # Screenshot, XML UI dump (clickable element detection) and analysis run concurrently
+                live_path, xml_str, elements, analysis = prepare_step(pool, device, step_out_dir, analyze)
+
+                # Save screenshot with UI element rectangles for debugging/labeling
+                labeled_path = label_screenshot(
+                    screenshot_path=live_path,
+                    screenshot_dir=step_out_dir,
+                    name=f"labeled",
+                    elements=elements,
+                )
+                current_img_labeled_xml_region = cv2.imread(labeled_path)
+                state = memo.add(live_path, xml_str, elements, labeled_path)
+
+                relevant_annotated_path = analysis["relevant_path"]
+                predicted_action = analysis["predicted_action"]
+                target_indices = analysis["target_indices"]
+
+                # Map the recording's DINO regions onto the device's UI elements
+                recording_w, recording_h = plan.frame_size if plan is not None else cv2.imread(tmp_start_path).shape[1::-1]
+                device_h, device_w = current_img_labeled_xml_region.shape[:2]
+                fusion = RegionFusion(analysis["regions"], elements, (recording_w, recording_h), (device_w, device_h))
+
+                if interactive:
+                    show_images(
+                        cv2.imread(relevant_annotated_path),
+                        cv2.imread(tmp_stop_path),
+                        current_img_labeled_xml_region
+                    )
+
+                match = memo.consistency(state, tmp_start_path, lambda: check_state_consistency(
+                    gate, vlm, tmp_start_path, live_path, relevant_annotated_path, predicted_action, target_indices
+                ))
+                checkpoint.append(i, "consistency", match)
+
+                # Recovery: every new screen is looked up in the state memo, so screens seen before
+                # reuse their UI dump, labels and verdict, and bouncing between screens is cut short.
+                attempts = 0
+                max_attempts = 3
+                while match["same_state"] != "yes" and attempts < max_attempts:
+                    logger.info(f"🔄 Attempting to align state (try {attempts + 1}/{max_attempts})...")
+                    recovery_reply = vlm.ask_gpt_for_action_region(tmp_start_path, tmp_stop_path, state.labeled_path, predicted_action)
+                    recovery_action = extract_json(recovery_reply)
+
+                    locate_action(recovery_action, fusion)
+
+                    checkpoint.append(i, "recovery_actions", recovery_action)
+                    execute_actions(device, [recovery_action])
+                    device.wait_for_settle()
+                    live_path = device.screenshot(index=0, save_path=step_out_dir)
+                    state = memo.observe(live_path, device, step_out_dir, previous=state)
+                    fusion = RegionFusion(analysis["regions"], state.elements, (recording_w, recording_h), (device_w, device_h))
+                    attempts += 1
+                    if memo.revisit():
+                        match = {"same_state": "no", "description": f"Recovery returned to screen state {state.id} it had already left."}
+                        logger.warning(f"🔁 Recovery oscillates (back at state {state.id}); giving up on this step.")
+                        checkpoint.append(i, "consistency", match)
+                        break
+                    match = memo.consistency(state, tmp_start_path, lambda: check_state_consistency(gate, vlm, tmp_start_path, live_path))
+                    checkpoint.append(i, "consistency", match)
+                labeled_path = state.labeled_path
+
+                if match["same_state"] == "yes":
+                    reply = vlm.ask_gpt_for_action_region(
+                        relevant_annotated_path, tmp_stop_path, labeled_path, predicted_action, target_indices
+                    )
+                    action = extract_json(reply)
+
+                    if not locate_action(action, fusion, target_indices):
+                        logger.warning("⚠️ No valid region or element match. Using original position if available.")
+
+                    checkpoint.record(i, "action", action)
+                    execute_actions(device, [action])
+                    checkpoint.mark(i, "executed")
+                    summary["executed"] += 1
+                    logger.info("✅ Action executed.")
+                else:
+                    checkpoint.mark(i, "skipped")
+                    summary["skipped"] += 1
+                    logger.warning(f"⚠️ Skipping action: current GUI state does not match start state. Mismatch reason: {match['description']}")
+
+            if interactive:
+                input("Press Enter to continue...")
+
+    tracing.set_attributes(step=None)
+    if gate:
+        gate.log_summary()
+    memo.log_summary()
+    log_rate_limit = getattr(vlm, "log_rate_limit_summary", None)
+    if log_rate_limit:
+        log_rate_limit()
+    logger.info("✅ Video processing completed.")
+    return summary
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Segment and replay actions from video.")
-    parser.add_argument("video_path", type=str, help="Path to the input video")
+    parser.add_argument("video_path", type=str, nargs="?", help="Path to the input video")
+    parser.add_argument("--plan", default=None, help="Replay a plan compiled with replay_plan.py instead of analyzing the video")
+    parser.add_argument("--no-local-gate", action="store_true", help="Always ask GPT-4o for state consistency")
+    parser.add_argument("--audit-every", type=int, default=0, help="Also send every n-th locally decided consistency check to GPT-4o to measure disagreement")
+    parser.add_argument("--fast-segmentation", action="store_true", help="Locate transitions from packet statistics and only decode frames around them (needs PyAV or ffprobe)")
+    parser.add_argument("--collapse-duplicates", action="store_true", help="Merge consecutive segments whose keyframes show no localized change (drops their steps)")
+    parser.add_argument("--no-change-crops", action="store_true", help="Send GPT-4o whole high-detail screenshots instead of crops of the changed areas")
+    parser.add_argument("--resume", action="store_true", help="Resume an interrupted replay from its checkpoint in the output directory")
+    parser.add_argument("--log-level", default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    parser.add_argument("--trace", default=None, help="Write per-stage timing spans as Chrome-trace JSON to this path")
     args = parser.parse_args()
-    main(args.video_path)
+    if not args.video_path and not args.plan:
+        parser.error("either video_path or --plan is required")
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    tracing.enable(args.trace is not None)
+    try:
+        main(args.video_path, use_local_gate=not args.no_local_gate, audit_every=args.audit_every, resume=args.resume, plan_path=args.plan, localize_changes=not args.no_change_crops,
+             fast_segmentation=args.fast_segmentation, collapse_duplicates=args.collapse_duplicates)
+    finally:
+        if args.trace:
+            tracing.export_chrome_trace(args.trace)
+            logger.info("⏱ Stage timings:\n" + tracing.format_summary())
@@ -0,0 +1,177 @@
+import logging
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import tracing
+from consistency_gate import normalize_screen, SAME_ABS_THRESHOLD
+from input_formatter import label_screenshot
+from yyh_utils import perceptual_hash, hamming_distance, max_tile_change
+
+"""
+Per-replay memo of the device screen states seen so far.
+
+Recovery actions often bounce between the same two or three screens. Every screenshot is
+fingerprinted (dHash of the normalized screen); a screen seen before reuses its UI XML, parsed
+elements, labeled screenshot and consistency verdicts instead of another UI dump and model call.
+
+- A fingerprint hit is confirmed on the normalized screens with a mean absolute difference
+  check and a per-tile changed-pixel check, so small localized changes (typed text, a toggled
+  checkbox, a snackbar) that barely move the mean still make a new state.
+- A screenshot taken right after an action that changed pixels never reuses a cached verdict;
+  if it still matched the pre-action state, that state's UI dump and labels are refreshed too.
+- `revisit` tells when the recovery of a step returns to a screen it already left for a
+  different one (A -> B -> A), i.e. it oscillates. Staying on the same screen (A -> A) is not
+  an oscillation; it counts toward the caller's normal attempt limit.
+"""
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+HASH_SIZE = 16            # dHash side length (256-bit fingerprints)
+MAX_HASH_DISTANCE = 8     # Fingerprints within this Hamming distance are candidates for the same state
+MAX_STATES = 64           # Least recently seen states are forgotten beyond this many
+TILE_SIZE = 16            # Tile side (normalized pixels) of the localized confirmation
+MAX_TILE_CHANGE = 0.05    # A tile with a larger changed-pixel fraction makes the screens different
+
+
+class ScreenState:
+    """A distinct device screen with everything derived from it."""
+    def __init__(self, state_id, fingerprint, screen, xml_str, elements, labeled_path):
+        self.id = state_id
+        self.fingerprint = fingerprint
+        self.screen = screen                # normalized grayscale screenshot (for confirmation)
+        self.xml_str = xml_str
+        self.elements = elements
+        self.labeled_path = labeled_path
+        self.verdicts = {}                  # reference frame path -> consistency match dict
+
+
+class StateMemo:
+    """
+    Screen states of one replay, keyed by perceptual fingerprint.
+
+    Args:
+        parse_elements (callable): UI XML -> AndroidElements (as used for labeling).
+    """
+    def __init__(self, parse_elements):
+        self.parse_elements = parse_elements
+        self.states = OrderedDict()
+        self.next_id = 0
+        self.trail = []
+        self.stats = {"lookups": 0, "hits": 0, "dumps_saved": 0, "verdicts_reused": 0, "oscillations": 0}
+
+    @staticmethod
+    def fingerprint(screenshot_path):
+        """(fingerprint, normalized screen) of a screenshot."""
+        screen = normalize_screen(cv2.imread(screenshot_path))
+        return perceptual_hash(screen, HASH_SIZE), screen
+
+    def find(self, fingerprint, screen):
+        """Known state showing the same screen, or None."""
+        self.stats["lookups"] += 1
+        for state in self.states.values():
+            if hamming_distance(state.fingerprint, fingerprint) > MAX_HASH_DISTANCE or state.screen.shape != screen.shape:
+                continue
+            if float(np.mean(cv2.absdiff(state.screen, screen))) <= SAME_ABS_THRESHOLD \
+                    and max_tile_change(state.screen, screen, TILE_SIZE) <= MAX_TILE_CHANGE:
+                self.states.move_to_end(state.id)
+                self.stats["hits"] += 1
+                return state
+        return None
+
+    def _store(self, fingerprint, screen, xml_str, elements, labeled_path):
+        state = ScreenState(self.next_id, fingerprint, screen, xml_str, elements, labeled_path)
+        self.next_id += 1
+        self.states[state.id] = state
+        if len(self.states) > MAX_STATES:
+            self.states.popitem(last=False)
+        return state
+
+    def add(self, screenshot_path, xml_str, elements, labeled_path):
+        """
+        Records a state whose UI dump was already taken; a known screen gets the fresh dump
+        and keeps its verdicts.
+        """
+        fingerprint, screen = self.fingerprint(screenshot_path)
+        state = self.find(fingerprint, screen)
+        if state is None:
+            state = self._store(fingerprint, screen, xml_str, elements, labeled_path)
+        else:
+            state.xml_str, state.elements, state.labeled_path = xml_str, elements, labeled_path
+        self.trail.append(state.id)
+        return state
+
+    def _dump(self, screenshot_path, device, out_dir):
+        xml_str = device.get_ui_xml()
+        elements = self.parse_elements(xml_str)
+        labeled_path = label_screenshot(
+            screenshot_path=screenshot_path,
+            screenshot_dir=out_dir,
+            name=f"labeled_state{self.next_id}",
+            elements=elements,
+        )
+        return xml_str, elements, labeled_path
+
+    @tracing.traced("state.observe")
+    def observe(self, screenshot_path, device, out_dir, previous=None):
+        """
+        State of a fresh screenshot: a hash lookup for known screens, otherwise a UI dump,
+        parsing and labeling.
+
+        Args:
+            previous (ScreenState): State before the action that led to this screenshot. If the
+                action changed pixels, the returned state's cached verdicts are dropped, and a
+                match with `previous` itself gets a fresh UI dump.
+        """
+        fingerprint, screen = self.fingerprint(screenshot_path)
+        state = self.find(fingerprint, screen)
+        changed = previous is not None and (
+            previous.screen.shape != screen.shape or max_tile_change(previous.screen, screen, TILE_SIZE) > 0
+        )
+        if state is None:
+            state = self._store(fingerprint, screen, *self._dump(screenshot_path, device, out_dir))
+        elif changed and state is previous:
+            logger.debug(f"Action changed state {state.id} slightly; refreshing its UI dump and verdicts.")
+            state.xml_str, state.elements, state.labeled_path = self._dump(screenshot_path, device, out_dir)
+            state.fingerprint, state.screen = fingerprint, screen
+            state.verdicts.clear()
+        else:
+            self.stats["dumps_saved"] += 1
+            logger.debug(f"♻️ Screen matches known state {state.id}; reusing its UI dump.")
+            if changed:
+                state.verdicts.clear()
+        self.trail.append(state.id)
+        return state
+
+    def start_step(self):
+        """Starts a new oscillation window (called at the beginning of every replay step)."""
+        self.trail = []
+
+    def revisit(self):
+        """True if the latest state was visited earlier in this step and left for a different one since."""
+        if len(self.trail) > 2 and self.trail[-1] != self.trail[-2] and self.trail[-1] in self.trail[:-2]:
+            self.stats["oscillations"] += 1
+            return True
+        return False
+
+    def consistency(self, state, reference_path, check):
+        """
+        Consistency verdict of a state against a reference frame, computed by `check()` only once.
+        """
+        match = state.verdicts.get(reference_path)
+        if match is not None:
+            self.stats["verdicts_reused"] += 1
+            return match
+        match = check()
+        state.verdicts[reference_path] = match
+        return match
+
+    def log_summary(self):
+        s = self.stats
+        logger.info(
+            f"📊 State memo: {len(self.states)} states, {s['hits']}/{s['lookups']} lookups hit, "
+            f"{s['dumps_saved']} UI dumps and {s['verdicts_reused']} consistency checks saved, "
+            f"{s['oscillations']} oscillations stopped"
+        )
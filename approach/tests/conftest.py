@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The approach modules import each other as top-level modules (run from approach/).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,75 @@
+import struct
+import subprocess
+import time
+
+from yyh_utils import file_sha256
+
+
+class FakeADB:
+    """
+    In-memory stand-in for the adb executable, passed as ADBDeviceController(runner=...).
+
+    Models installed packages (by APK hash), app data, emulator snapshots and a fixed delay
+    per command, and records every command line in `commands`.
+
+    Args:
+        emulator (bool): Whether the fake device reports being an emulator.
+        delay (float): Simulated seconds per adb command.
+    """
+    def __init__(self, emulator=True, delay=0.0):
+        self.emulator = emulator
+        self.delay = delay
+        self.packages = {}        # package -> sha256 of the installed APK
+        self.app_data = set()     # packages with data
+        self.snapshots = {}       # name -> (packages, app_data)
+        self.apk_packages = {}    # local APK path -> package (what aapt would report)
+        self.commands = []
+
+    def __call__(self, cmd, capture_output=True, text=True):
+        self.commands.append(cmd)
+        time.sleep(self.delay)
+        args = cmd[3:] if len(cmd) > 2 and cmd[1] == "-s" else cmd[1:]
+        code, out = self.handle(args)
+        if not text and isinstance(out, str):
+            out = out.encode()
+        return subprocess.CompletedProcess(cmd, code, out, "" if text else b"")
+
+    def handle(self, args):
+        if args[:3] == ["shell", "pm", "path"]:
+            return 0, f"package:/data/app/{args[3]}-1/base.apk\n" if args[3] in self.packages else ""
+        if args[:2] == ["shell", "sha256sum"]:
+            package = args[2].split("/")[3].rsplit("-", 1)[0]
+            return (0, f"{self.packages[package]}  {args[2]}\n") if package in self.packages else (1, "")
+        if args[:1] == ["install"]:
+            package = self.apk_packages[args[-1]]
+            self.packages[package] = file_sha256(args[-1])
+            return 0, "Performing Streamed Install\nSuccess\n"
+        if args[:3] == ["shell", "pm", "clear"]:
+            self.app_data.discard(args[3])
+            return 0, "Success\n" if args[3] in self.packages else "Failed\n"
+        if args[:2] == ["shell", "monkey"]:
+            self.app_data.add(args[3])
+            return 0, "Events injected: 1\n"
+        if args[:3] == ["shell", "getprop", "ro.kernel.qemu"]:
+            return 0, "1\n" if self.emulator else "\n"
+        if args[:3] == ["shell", "getprop", "sys.boot_completed"]:
+            return 0, "1\n"
+        if args[:3] == ["emu", "avd", "snapshot"] and self.emulator:
+            if args[3] == "list":
+                return 0, "".join(f"{k}  {name}  0  00:00:00\n" for k, name in enumerate(self.snapshots)) + "OK\n"
+            if args[3] == "save":
+                self.snapshots[args[4]] = (dict(self.packages), set(self.app_data))
+                return 0, "OK\n"
+            if args[3] == "load" and args[4] in self.snapshots:
+                packages, app_data = self.snapshots[args[4]]
+                self.packages, self.app_data = dict(packages), set(app_data)
+                return 0, "OK\n"
+            return 0, f"KO: unknown snapshot {args[4]}\n"
+        if args[:3] == ["shell", "wm", "size"]:
+            return 0, "Physical size: 1080x2400\n"
+        if args[:1] == ["shell"] and args[-1].endswith("md5sum"):
+            return 0, "d41d8cd98f00b204e9800998ecf8427e  -\n"
+        if args[:1] == ["exec-out"]:
+            # Raw screencap of a blank 32x32 screen: width, height, format, RGBA pixels
+            return 0, struct.pack("<III", 32, 32, 1) + bytes(32 * 32 * 4)
+        return 0, ""
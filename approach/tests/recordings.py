@@ -0,0 +1,19 @@
+import cv2
+import numpy as np
+import pytest
+
+SCREENS = 3
+FRAMES_PER_SCREEN = 12
+
+
+def write_recording(path, screens=SCREENS, frames_per_screen=FRAMES_PER_SCREEN):
+    """A short recording of `screens` screens; each transition shows a new box on the previous screen."""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 10, (360, 640))
+    if not writer.isOpened():
+        pytest.skip("OpenCV cannot write mp4 files here")
+    screen = np.full((640, 360, 3), 230, np.uint8)
+    for k in range(screens):
+        cv2.rectangle(screen, (40, 120 + 160 * k), (320, 240 + 160 * k), (60 * k, 120, 200 - 60 * k), -1)
+        for _ in range(frames_per_screen):
+            writer.write(screen)
+    writer.release()
@@ -0,0 +1,107 @@
+import struct
+import subprocess
+import time
+
+import adb_device_controller
+from adb_device_controller import ADBDeviceController
+
+
+class ScreenADB:
+    """adb runner serving a sequence of screen hashes and counting full-frame captures."""
+    def __init__(self, hashes):
+        self.hashes = list(hashes)
+        self.frame_captures = 0
+
+    def __call__(self, cmd, capture_output=True, text=True):
+        if cmd[1:4] == ["shell", "wm", "size"]:
+            return subprocess.CompletedProcess(cmd, 0, "Physical size: 1080x2400\n", "")
+        if cmd[-1].endswith("md5sum"):
+            digest = self.hashes.pop(0) if len(self.hashes) > 1 else self.hashes[0]
+            return subprocess.CompletedProcess(cmd, 0, f"{digest}  -\n", "")
+        if cmd[1] == "exec-out":
+            self.frame_captures += 1
+            return subprocess.CompletedProcess(cmd, 0, struct.pack("<III", 32, 32, 1) + bytes(32 * 32 * 4), b"")
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+
+def test_static_screen_settles_on_device_hashes_only():
+    adb = ScreenADB(["a" * 32])
+    device = ADBDeviceController(runner=adb)
+    assert device.wait_for_settle(interval=0.0)
+    assert adb.frame_captures == 0
+
+
+def test_screen_changing_after_the_first_identical_pair_is_not_settled():
+    adb = ScreenADB(["a" * 32, "a" * 32, "b" * 32, "b" * 32, "b" * 32])
+    device = ADBDeviceController(runner=adb)
+    assert device.wait_for_settle(interval=0.0, min_dwell=0.0)
+    assert adb.hashes == ["b" * 32]  # kept polling until the new screen was stable
+    assert adb.frame_captures == 0
+
+
+def test_settle_waits_for_the_minimum_dwell():
+    adb = ScreenADB(["a" * 32])
+    device = ADBDeviceController(runner=adb)
+    start = time.monotonic()
+    assert device.wait_for_settle(interval=0.0, min_dwell=0.05)
+    assert time.monotonic() - start >= 0.05
+
+
+def test_hash_skips_status_bar():
+    adb = ScreenADB(["a" * 32])
+    commands = []
+    device = ADBDeviceController(runner=lambda cmd, **kw: commands.append(cmd) or adb(cmd, **kw))
+    device.screen_hash()
+    assert commands[-1][-1] == f"screencap | tail -c +{16 + 1080 * 4 * int(2400 * 0.04) + 1} | md5sum"
+
+
+def test_changing_screen_falls_back_to_tolerant_captures(monkeypatch):
+    monkeypatch.setattr(adb_device_controller, "SETTLE_HASH_PHASE", 0.05)
+    adb = ScreenADB([str(i) * 32 for i in range(10)] * 1000)
+    device = ADBDeviceController(runner=adb)
+    assert device.wait_for_settle(interval=0.001)
+    assert adb.frame_captures >= 3
+
+
+GETEVENT = """add device 1: /dev/input/event2
+  name:     "qwerty2"
+  events:
+    KEY (0001): KEY_ESC
+add device 2: /dev/input/event1
+  name:     "virtio_input_multi_touch_1"
+  events:
+    ABS (0003): ABS_MT_SLOT           : value 0, min 0, max 9, fuzz 0, flat 0, resolution 0
+                ABS_MT_POSITION_X     : value 0, min 0, max 32767, fuzz 0, flat 0, resolution 0
+                ABS_MT_POSITION_Y     : value 0, min 0, max 32767, fuzz 0, flat 0, resolution 0
+"""
+
+
+def test_touch_device_is_read_from_getevent():
+    def runner(cmd, **kwargs):
+        if cmd[-2:] == ["getevent", "-pl"]:
+            return subprocess.CompletedProcess(cmd, 0, GETEVENT, "")
+        return ScreenADB(["a" * 32])(cmd, **kwargs)
+
+    touch = ADBDeviceController(runner=runner).touch_device()
+    assert touch["path"] == "/dev/input/event1"
+    assert touch["scale"] == (32768 / 1080, 32768 / 2400)
+    assert not touch["pressure"]
+
+
+def test_input_methods_run_one_compiled_script_each():
+    commands = []
+    device = ADBDeviceController("emulator-5554", runner=lambda cmd, **kw: commands.append(cmd) or subprocess.CompletedProcess(cmd, 0, "", ""))
+    device.click(10, 20)
+    device.long_click(10, 20, 800)
+    device.swipe(1, 2, 3, 4)
+    device.input_text("hello world")
+    device.back()
+    device.home()
+    assert [cmd[3:] for cmd in commands] == [
+        ["shell", "input tap 10 20"],
+        ["shell", "input swipe 10 20 11 21 800"],
+        ["shell", "input swipe 1 2 3 4 500"],
+        ["shell", "input text 'hello world'"],
+        ["shell", "input keyevent 4"],
+        ["shell", "input keyevent 3"],
+    ]
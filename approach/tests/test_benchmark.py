@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+import benchmark
+import tracing
+from recordings import write_recording
+from replay_fixtures import build_keyframe_fixture
+
+
+@pytest.fixture
+def entry(tmp_path):
+    entry_dir = tmp_path / "Synthetic-1"
+    entry_dir.mkdir()
+    write_recording(entry_dir / "video-#1.mp4")
+    yield str(entry_dir)
+    tracing.enable(False)
+    tracing.reset()
+
+
+def test_keyframe_fixture_replays_every_step_within_budget(entry):
+    fixture = build_keyframe_fixture(benchmark.find_video(entry))
+    steps = len(fixture.data["states"]) - 1
+
+    result = benchmark.run_entry(entry)
+
+    assert result["mode"] == "replay"
+    assert result["segments"] - 1 == steps >= 1
+    assert (result["executed"], result["skipped"], result["divergences"]) == (steps, 0, 0)
+    # One relevant-region and one action query per step; consistency is decided locally
+    assert result["vlm_calls"] == {"ask_gpt_for_relevant_regions": steps, "ask_gpt_for_action_region": steps}
+    assert result["device_actions_per_segment"] == 1
+
+    with open(benchmark.DEFAULT_BUDGET, "r", encoding="utf-8") as f:
+        budget = json.load(f)
+    assert result["vlm_calls_per_segment"] <= budget["max_vlm_calls_per_segment"]
+    assert benchmark.check_budget(result, budget) == []
@@ -0,0 +1,127 @@
+import struct
+import zlib
+from types import SimpleNamespace
+
+import pytest
+
+import openai_api
+
+
+def write_png(path, width, height):
+    """A valid grayscale PNG of the given size (only its header matters for token estimates)."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + b"\x00" * width for _ in range(height))
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(rows)))
+        f.write(chunk(b"IEND", b""))
+    return str(path)
+
+
+def sent_tokens(monkeypatch, call):
+    sent = []
+    reply = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="{}"))])
+
+    def chat_completion(priority, **kwargs):
+        sent.append(kwargs["messages"])
+        return reply
+
+    monkeypatch.setattr(openai_api, "chat_completion", chat_completion)
+    call()
+    return openai_api.estimate_tokens(sent[0])
+
+
+def test_relevant_regions_call_gets_cheaper_with_stop_crops(tmp_path, monkeypatch):
+    start = write_png(tmp_path / "dino.png", 1080, 2400)
+    stop = write_png(tmp_path / "stop.png", 1080, 2400)
+    crops = [
+        {"path": write_png(tmp_path / f"stop_crop{k}.png", 300, 200), "box": [0, 400 * k, 300, 400 * k + 200]}
+        for k in range(3)
+    ]
+
+    full = sent_tokens(monkeypatch, lambda: openai_api.ask_gpt_for_relevant_regions(start, stop))
+    cropped = sent_tokens(monkeypatch, lambda: openai_api.ask_gpt_for_relevant_regions(start, stop, stop_crops=crops))
+
+    assert cropped < full
+
+
+def test_crops_costing_more_than_the_full_view_are_not_sent(tmp_path):
+    stop = write_png(tmp_path / "stop.png", 1080, 2400)
+    crops = [
+        {"path": write_png(tmp_path / f"stop_crop{k}.png", 1080, 1000), "box": [0, 1000 * k, 1080, 1000 * (k + 1)]}
+        for k in range(2)
+    ]
+
+    parts = openai_api.image_parts(stop, "FOLLOW-UP state", "high", crops)
+
+    assert len(parts) == 1
+    assert parts[0]["image_url"]["detail"] == "high"
+
+
+class FakeDetector:
+    def run_grounding_dino(self, image_path, output_path):
+        return []
+
+    def annotate_relevant_regions(self, image_path, output_path, regions, relevant_indices):
+        pass
+
+
+class FakeVLM:
+    def __init__(self):
+        self.stop_crops = []
+
+    def ask_gpt_for_relevant_regions(self, start_img_path, stop_img_path, stop_crops=None):
+        self.stop_crops.append(stop_crops)
+        return '{"target_regions": [], "predicted_action": "tap"}'
+
+
+def keyframes(tmp_path, *changes):
+    import cv2
+    import numpy as np
+
+    start = np.full((2400, 1080, 3), 230, np.uint8)
+    stop = start.copy()
+    for change in changes:
+        cv2.rectangle(stop, *change, (40, 40, 200), -1)
+    paths = str(tmp_path / "tmp_start.png"), str(tmp_path / "tmp_stop.png")
+    cv2.imwrite(paths[0], start)
+    cv2.imwrite(paths[1], stop)
+    return paths
+
+
+def crop_files(tmp_path):
+    return sorted(p.name for p in tmp_path.glob("stop_crop*.png"))
+
+
+def test_small_change_is_sent_as_a_crop(tmp_path):
+    import video_analysis
+
+    vlm = FakeVLM()
+    video_analysis.analyze_step(str(tmp_path), *keyframes(tmp_path, ((800, 1200), (900, 1300))), FakeDetector(), vlm)
+    assert crop_files(tmp_path) == ["stop_crop0.png"]
+    assert len(vlm.stop_crops[0]) == 1
+
+
+def test_crops_not_worth_sending_are_never_written(tmp_path):
+    import video_analysis
+
+    vlm = FakeVLM()
+    # Three changes far apart: three 2x2-tile crops cost more than the 2x4-tile full view
+    changes = [((0, 300), (440, 740)), ((600, 900), (1040, 1340)), ((0, 1600), (440, 2040))]
+    video_analysis.analyze_step(str(tmp_path), *keyframes(tmp_path, *changes), FakeDetector(), vlm)
+    assert vlm.stop_crops == [None]
+    assert crop_files(tmp_path) == []
+
+
+def test_cached_reply_skips_change_localization(tmp_path, monkeypatch):
+    import video_analysis
+
+    monkeypatch.setattr(video_analysis, "change_boxes", lambda *args: pytest.fail("localized a cached step"))
+    vlm = FakeVLM()
+    cached = {"relevant_reply": '{"target_regions": [], "predicted_action": "tap"}'}
+    video_analysis.analyze_step(str(tmp_path), *keyframes(tmp_path, ((800, 1200), (900, 1300))), FakeDetector(), vlm, cached=cached)
+    assert vlm.stop_crops == []
+    assert crop_files(tmp_path) == []
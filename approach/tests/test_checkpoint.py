@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+import segment_replay
+from checkpoint import ReplayCheckpoint
+from recordings import write_recording
+from replay_fixtures import ReplayFixture, SimulatedDevice, RecordedVLM, RecordedDetector, build_keyframe_fixture
+
+FAST = {"fast": True, "collapse_duplicates": False}
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"not really a video")
+    return str(path)
+
+
+def write_checkpoint(out_dir, video, segmentation=FAST):
+    checkpoint = ReplayCheckpoint.open(out_dir, video, segmentation=segmentation)
+    checkpoint.set_segments([(0, 10), (20, 30), (40, 50)], merged=1)
+    checkpoint.record(0, "regions", [[1, 2, 3, 4]])
+    checkpoint.mark(0, "executed")
+    checkpoint.append(1, "consistency", {"same_state": "no"})
+    return checkpoint
+
+
+def test_resume_restores_segments_and_completed_steps(tmp_path, video):
+    write_checkpoint(str(tmp_path), video)
+    checkpoint = ReplayCheckpoint.open(str(tmp_path), video, resume=True, segmentation=FAST)
+    assert checkpoint.segments == [(0, 10), (20, 30), (40, 50)]
+    assert checkpoint.merged_segments == 1
+    assert checkpoint.completed_steps() == [0]
+    assert checkpoint.is_completed(0) and not checkpoint.is_completed(1)
+    assert checkpoint.get(0, "regions") == [[1, 2, 3, 4]]
+    assert checkpoint.get(1, "consistency") == [{"same_state": "no"}]
+
+
+def test_without_resume_a_new_checkpoint_is_started(tmp_path, video):
+    write_checkpoint(str(tmp_path), video)
+    checkpoint = ReplayCheckpoint.open(str(tmp_path), video, segmentation=FAST)
+    assert checkpoint.segments is None and checkpoint.completed_steps() == []
+
+
+def test_checkpoint_of_a_modified_video_is_discarded(tmp_path, video):
+    write_checkpoint(str(tmp_path), video)
+    with open(video, "ab") as f:
+        f.write(b"more frames")
+    checkpoint = ReplayCheckpoint.open(str(tmp_path), video, resume=True, segmentation=FAST)
+    assert checkpoint.segments is None and checkpoint.completed_steps() == []
+
+
+@pytest.mark.parametrize("segmentation", [{"fast": False, "collapse_duplicates": False}, {"fast": True, "collapse_duplicates": True}])
+def test_checkpoint_with_other_segmentation_options_is_discarded(tmp_path, video, segmentation):
+    write_checkpoint(str(tmp_path), video)
+    checkpoint = ReplayCheckpoint.open(str(tmp_path), video, resume=True, segmentation=segmentation)
+    assert checkpoint.segments is None and checkpoint.completed_steps() == []
+
+
+def replay(video_path, out_root, **kwargs):
+    fixture = ReplayFixture.load(os.path.join(os.path.dirname(video_path), "replay_fixture"))
+    device, vlm = SimulatedDevice(fixture), RecordedVLM(fixture)
+    summary = segment_replay.main(video_path, device=device, vlm=vlm, detector=RecordedDetector(fixture),
+                                  interactive=False, out_root=out_root, cache_folder=None, **kwargs)
+    return summary, device, vlm
+
+
+def test_resumed_replay_skips_completed_steps(tmp_path):
+    video_path = str(tmp_path / "video.mp4")
+    write_recording(video_path)
+    build_keyframe_fixture(video_path)
+    out_root = str(tmp_path / "out")
+
+    first, _, _ = replay(video_path, out_root)
+    assert first["executed"] == first["steps"] >= 1 and first["resumed"] == 0
+
+    resumed, device, vlm = replay(video_path, out_root, resume=True)
+    assert resumed["resumed"] == first["steps"] and resumed["executed"] == 0
+    assert not vlm.calls and not device.scripts
+
+    rerun, _, _ = replay(video_path, out_root, resume=True, collapse_duplicates=True)
+    assert rerun["resumed"] == 0 and rerun["executed"] == rerun["steps"]
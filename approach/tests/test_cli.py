@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import cli
+from recordings import write_recording, SCREENS
+
+APPROACH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("argv, func, expected", [
+    (["segment", "v.mp4", "--fast-segmentation", "--keyframes", "out"], cli.cmd_segment,
+     {"video_path": "v.mp4", "fast_segmentation": True, "collapse_duplicates": False, "keyframes": "out"}),
+    (["compare", "a.png", "b.png", "SIFT", "--matcher", "FLANN", "--max-dim", "640"], cli.cmd_compare,
+     {"image1": "a.png", "image2": "b.png", "method": "SIFT", "matcher": "FLANN", "max_dim": 640}),
+    (["detect", "s.png", "--dino-backend", "fixed", "--dino-size", "800", "1333"], cli.cmd_detect,
+     {"image_path": "s.png", "output": "dino.png", "dino_backend": "fixed", "dino_size": [800, 1333]}),
+    (["compile", "v.mp4", "-o", "p.zip", "--collapse-duplicates"], cli.cmd_compile,
+     {"video_path": "v.mp4", "output": "p.zip", "collapse_duplicates": True, "dino_backend": None}),
+    (["replay", "--plan", "p.zip", "--resume", "--audit-every", "5", "--reset-app", "dataset/X"], cli.cmd_replay,
+     {"video_path": None, "plan": "p.zip", "resume": True, "audit_every": 5, "reset_app": "dataset/X", "no_local_gate": False}),
+])
+def test_every_subcommand_parses(argv, func, expected):
+    args = cli.build_parser().parse_args(argv)
+    assert args.func is func
+    assert {key: getattr(args, key) for key in expected} == expected
+
+
+def test_replay_needs_a_video_or_a_plan():
+    args = cli.build_parser().parse_args(["replay"])
+    with pytest.raises(SystemExit, match="video_path or --plan"):
+        args.func(args)
+
+
+def test_cli_and_video_analysis_do_not_import_heavy_modules():
+    code = ("import sys, cli, video_analysis; "
+            "print(sorted(m for m in ('openai', 'torch', 'skimage', 'groundingdino') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=APPROACH_DIR, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_segment_prints_the_segments(tmp_path, capsys):
+    video_path = str(tmp_path / "video.mp4")
+    write_recording(video_path)
+    args = cli.build_parser().parse_args(["segment", video_path, "--cache", str(tmp_path / "cache"), "--keyframes", str(tmp_path / "keyframes")])
+    args.func(args)
+    segments = json.loads(capsys.readouterr().out)
+    assert len(segments) == SCREENS
+    assert sorted(os.listdir(tmp_path / "keyframes")) == [f"step_{i}" for i in range(SCREENS - 1)]
@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+
+from consistency_gate import LocalConsistencyGate
+
+
+def screen(seed):
+    rng = np.random.default_rng(seed)
+    img = np.full((800, 480, 3), 255, np.uint8)
+    for _ in range(60):
+        x, y = int(rng.integers(0, 440)), int(rng.integers(40, 760))
+        w, h = int(rng.integers(10, 40)), int(rng.integers(10, 40))
+        cv2.rectangle(img, (x, y), (x + w, y + h), [int(c) for c in rng.integers(0, 200, 3)], -1)
+    return img
+
+
+def noise(seed):
+    return np.random.default_rng(seed).integers(0, 256, (800, 480, 3), dtype=np.uint8)
+
+
+def test_identical_screens_are_decided_by_abs_diff():
+    reference = screen(0)
+    result = LocalConsistencyGate().check(reference, reference.copy())
+    assert (result["verdict"], result["tier"]) == ("yes", "abs")
+
+
+def test_uniformly_darker_screen_is_decided_by_ssim():
+    reference = screen(0)
+    result = LocalConsistencyGate().check(reference, cv2.subtract(reference, 8))
+    assert (result["verdict"], result["tier"]) == ("yes", "ssim")
+
+
+def test_partly_blank_screen_is_decided_by_sift():
+    reference = screen(0)
+    live = reference.copy()
+    live[600:] = 255
+    result = LocalConsistencyGate().check(reference, live)
+    assert (result["verdict"], result["tier"]) == ("yes", "sift")
+
+
+def test_different_screens_are_escalated_unless_enabled():
+    reference, live = screen(0), noise(3)
+    default = LocalConsistencyGate()
+    result = default.check(reference, live)
+    assert result["verdict"] is None and result["lean"] == "no"
+    assert default.stats["escalated"] == 1
+
+    result = LocalConsistencyGate(decide_different=True).check(reference, live)
+    assert (result["verdict"], result["tier"]) == ("no", "sift")
+
+
+def test_every_nth_confident_decision_is_audited():
+    gate = LocalConsistencyGate(audit_every=2)
+    reference = screen(0)
+    audits = [gate.check(reference, reference)["audit"] for _ in range(4)]
+    assert audits == [False, True, False, True]
+    assert gate.stats["audited"] == 2
+    assert gate.summary()["skip_rate"] == 0.5
+
+
+def test_vlm_disagreements_are_counted():
+    gate = LocalConsistencyGate(audit_every=1)
+    reference = screen(0)
+    confident = gate.check(reference, reference)
+    gate.record_vlm_verdict(confident, "no")
+    escalated = gate.check(reference, noise(3))
+    gate.record_vlm_verdict(escalated, "yes")
+    gate.record_vlm_verdict(escalated, "no")
+
+    assert gate.stats["disagreements"] == 1
+    assert gate.stats["lean_disagreements"] == 1
+    summary = gate.summary()
+    assert summary["audit_disagreement_rate"] == 1.0
+    assert summary["lean_disagreement_rate"] == 0.5
@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import device_setup
+from adb_device_controller import ADBDeviceController
+from device_setup import DeviceSetup
+from fake_adb import FakeADB
+from yyh_utils import file_sha256
+
+PACKAGE = "fake.app"
+APPROACH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def no_launch_dwell(monkeypatch):
+    monkeypatch.setattr(device_setup, "LAUNCH_MIN_DWELL", 0.0)
+
+
+@pytest.fixture
+def apk(tmp_path):
+    path = tmp_path / "app.apk"
+    path.write_bytes(b"apk v1")
+    return str(path)
+
+
+def make_setup(apk, emulator=True, use_snapshots=True):
+    fake = FakeADB(emulator=emulator)
+    fake.apk_packages[apk] = PACKAGE
+    return fake, DeviceSetup(ADBDeviceController("emulator-5554", runner=fake), use_snapshots=use_snapshots)
+
+
+def issued(fake, *prefix):
+    return [cmd for cmd in fake.commands if cmd[3:3 + len(prefix)] == list(prefix)]
+
+
+def test_install_is_skipped_when_the_device_has_the_same_apk(apk):
+    fake, setup = make_setup(apk, use_snapshots=False)
+    fake.packages[PACKAGE] = file_sha256(apk)
+    report = setup.prepare(apk, PACKAGE)
+    assert not report["installed"]
+    assert not issued(fake, "install")
+
+
+def test_changed_apk_is_reinstalled(apk):
+    fake, setup = make_setup(apk, use_snapshots=False)
+    fake.packages[PACKAGE] = "0" * 64
+    report = setup.prepare(apk, PACKAGE)
+    assert report["installed"]
+    assert len(issued(fake, "install")) == 1
+    assert fake.packages[PACKAGE] == file_sha256(apk)
+
+
+def test_app_data_is_cleared_before_launch(apk):
+    fake, setup = make_setup(apk, use_snapshots=False)
+    fake.app_data.add(PACKAGE)
+    report = setup.prepare(apk, PACKAGE, launch=False)
+    assert report["method"] == "clear"
+    assert issued(fake, "shell", "pm", "clear", PACKAGE)
+    assert PACKAGE not in fake.app_data
+
+
+def test_emulator_saves_a_snapshot_then_loads_it(apk):
+    fake, setup = make_setup(apk)
+    cold = setup.prepare(apk, PACKAGE)
+    assert cold["method"] == "clear" and cold["installed"]
+    assert cold["snapshot"] in fake.snapshots
+
+    fake.commands.clear()
+    fake.app_data.add("other.app")  # state left behind by a replay
+    warm = setup.prepare(apk, PACKAGE)
+    assert warm["method"] == "snapshot" and not warm["installed"]
+    assert warm["snapshot"] == cold["snapshot"]
+    assert not issued(fake, "install") and not issued(fake, "shell", "pm", "clear")
+    assert fake.app_data == {PACKAGE}
+
+
+def test_physical_device_falls_back_to_clearing(apk):
+    fake, setup = make_setup(apk, emulator=False)
+    assert not setup.use_snapshots
+    for _ in range(2):
+        report = setup.prepare(apk, PACKAGE)
+        assert report["method"] == "clear" and report["snapshot"] is None
+    assert len(issued(fake, "install")) == 1
+    assert len(issued(fake, "shell", "pm", "clear")) == 2
+    assert not [cmd for cmd in fake.commands if "emu" in cmd]
+
+
+def test_device_setup_does_not_import_the_replay_stack():
+    code = "import sys, device_setup; print(sorted(m for m in ('openai', 'replay_plan', 'video_analysis') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=APPROACH_DIR, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,61 @@
+import os
+
+import cv2
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("GroundingDINO.groundingdino.util.inference")
+
+import dino_backends  # noqa: E402
+import dino_detection  # noqa: E402
+
+if not os.path.exists(dino_detection.WEIGHTS_PATH):
+    pytest.skip(f"GroundingDINO weights not found at {dino_detection.WEIGHTS_PATH}", allow_module_level=True)
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset")
+RECORDINGS = ["AuthToken-1/authtoken-#1.mp4", "Markor-264/video-#264.mp4"]
+
+# Minimum share of the reference boxes a backend must reproduce (IoU >= PARITY_IOU)
+MIN_RECALL = {"fixed": 0.95, "fixed-int8": 0.8, "onnx": 0.95, "onnx-int8": 0.8}
+MIN_PRECISION = {"fixed": 0.95, "fixed-int8": 0.8, "onnx": 0.95, "onnx-int8": 0.8}
+
+
+@pytest.fixture(scope="module")
+def screenshots(tmp_path_factory):
+    out_dir = tmp_path_factory.mktemp("screens")
+    paths = []
+    for k, recording in enumerate(RECORDINGS):
+        capture = cv2.VideoCapture(os.path.join(DATASET_DIR, recording))
+        ok, frame = capture.read()
+        capture.release()
+        if ok:
+            paths.append(str(out_dir / f"screen{k}.png"))
+            cv2.imwrite(paths[-1], frame)
+    if not paths:
+        pytest.skip("no dataset recordings to take screenshots from")
+    return paths
+
+
+@pytest.fixture(scope="module")
+def reference(screenshots):
+    """Detections of the original dino_detection path (load_image + predict)."""
+    backend = dino_backends.ReferenceBackend()
+    return [backend.predict(path) for path in screenshots]
+
+
+@pytest.mark.parametrize("name", ["fixed", "fixed-int8", "onnx", "onnx-int8"])
+def test_backend_boxes_match_reference(name, screenshots, reference):
+    if name.startswith("onnx"):
+        pytest.importorskip("onnxruntime")
+    image_size = cv2.imread(screenshots[0]).shape[1::-1]
+    backend = dino_backends.create_backend(name, dino_backends.reference_input_size(image_size))
+
+    counts = [dino_backends.parity(ref, backend.predict(path)) for ref, path in zip(reference, screenshots)]
+    matched = sum(c["matched"] for c in counts)
+    assert matched >= MIN_RECALL[name] * sum(c["reference_boxes"] for c in counts)
+    assert matched >= MIN_PRECISION[name] * sum(c["boxes"] for c in counts)
+
+
+def test_reference_input_size_follows_load_image():
+    assert dino_backends.reference_input_size((1080, 1920)) == (750, 1333)
+    assert dino_backends.reference_input_size((1080, 1350)) == (800, 1000)
@@ -0,0 +1,43 @@
+import subprocess
+import time
+
+from execute_action import compile_actions, execute_actions, DOUBLE_TAP_INTERVAL
+
+TOUCH = {"path": "/dev/input/event1", "scale": (2.0, 2.0), "pressure": False}
+
+
+def test_double_tap_uses_one_sendevent_sequence_with_a_touch_device():
+    [(kind, script)] = compile_actions([{"action": "double_tap", "position": (100, 200)}], TOUCH)
+    assert kind == "script"
+    assert "input tap" not in script and "input motionevent" not in script
+    assert script.count("sendevent /dev/input/event1 3 53 200") == 2
+    assert script.count("sendevent /dev/input/event1 3 54 400") == 2
+    assert f"sleep {DOUBLE_TAP_INTERVAL}" in script
+    assert "&" not in script
+
+
+def test_double_tap_falls_back_to_motionevents():
+    [(_, script)] = compile_actions([{"action": "double_tap", "position": (100, 200)}])
+    assert script.count("input motionevent DOWN 100 200") == 2
+    assert script.count("input motionevent UP 100 200") == 2
+
+
+class RecordingDevice:
+    def __init__(self):
+        self.calls = []
+
+    def run_script(self, script):
+        self.calls.append(("script", script))
+        return subprocess.CompletedProcess(["adb"], 0, "", "")
+
+    def wait_for_settle(self, timeout=3.0, **kwargs):
+        self.calls.append(("settle", timeout))
+        return True
+
+
+def test_wait_pauses_for_the_full_duration_even_on_a_settled_screen():
+    device = RecordingDevice()
+    start = time.monotonic()
+    execute_actions(device, [{"action": "tap", "position": (1, 2)}, {"action": "wait", "duration": 200}])
+    assert time.monotonic() - start >= 0.2
+    assert device.calls == [("script", "input tap 1 2")]
@@ -0,0 +1,142 @@
+import math
+
+import cv2
+import numpy as np
+import pytest
+
+import video_analysis
+import yyh_utils
+from recordings import write_recording, SCREENS, FRAMES_PER_SCREEN
+from yyh_utils import SparseFrames, calculate_sparse_sim_seq, read_missing_frames, transition_windows
+
+FRAMES = 60
+CHANGE = 20  # the only frame with a large packet besides the first keyframe
+
+
+def screen(k):
+    img = np.full((640, 360, 3), 230, np.uint8)
+    cv2.rectangle(img, (40, 120), (320, 240), (0, 120, 200), -1)
+    if k:
+        cv2.rectangle(img, (40, 300), (320, 500), (200, 60, 0), -1)
+    return img
+
+
+def spinner(img, i):
+    img = img.copy()
+    angle = i * 0.6
+    cv2.line(img, (180, 560), (int(180 + 90 * math.cos(angle)), int(560 + 60 * math.sin(angle))), (0, 0, 0), 10)
+    return img
+
+
+def write_video(path, spin):
+    """Screen 0 until CHANGE, screen 1 afterwards, with a spinner drawn on the frames in `spin`."""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 10, (360, 640))
+    if not writer.isOpened():
+        pytest.skip("OpenCV cannot write mp4 files here")
+    for i in range(FRAMES):
+        frame = screen(i >= CHANGE)
+        writer.write(spinner(frame, i) if i in spin else frame)
+    writer.release()
+    return str(path)
+
+
+@pytest.fixture
+def one_large_packet(monkeypatch):
+    """Packet statistics of an encoder that gives the spinner small packets."""
+    sizes, keyframes = [150] * FRAMES, [False] * FRAMES
+    sizes[0], keyframes[0], sizes[CHANGE] = 5000, True, 5000
+    monkeypatch.setattr(yyh_utils, "read_packet_stats", lambda video: (sizes, keyframes))
+
+
+def segment_both(video_path):
+    full_frames, full, _ = video_analysis.segment_video(video_path, cache_folder=None)
+    frames, fast, _ = video_analysis.segment_video(video_path, cache_folder=None, fast=True)
+    return full, fast, full_frames, frames
+
+
+def assert_same_keyframes(full, full_frames, frames, tmp_path):
+    video_analysis.write_keyframes(str(tmp_path / "fast"), frames, full)
+    for i in range(len(full) - 1):
+        for path, index in zip(video_analysis.keyframe_paths(str(tmp_path / "fast"), i), (full[i][1], full[i + 1][0])):
+            assert (cv2.imread(path) == full_frames[index]).all()
+
+
+def test_transition_windows_pad_candidates_and_merge_overlaps():
+    sizes, keyframes = [150] * FRAMES, [False] * FRAMES
+    sizes[0], keyframes[0], sizes[CHANGE] = 5000, True, 5000
+    assert transition_windows(sizes, keyframes, pad=5) == [(0, 5), (14, 25)]
+    sizes[27] = 5000
+    assert transition_windows(sizes, keyframes, pad=5) == [(0, 5), (14, 32)]
+    keyframes[50] = True  # a keyframe is a candidate whatever its size
+    assert transition_windows(sizes, keyframes, pad=5) == [(0, 5), (14, 32), (44, 55)]
+
+
+def test_sparse_frames_only_serve_decoded_frames():
+    frames = SparseFrames(10, {0: "a", 9: "b"})
+    assert len(frames) == 10
+    assert frames[0] == "a" and frames[-1] == "b"
+    assert frames.has(9) and not frames.has(5)
+    with pytest.raises(IndexError, match="Frame 5 was not decoded"):
+        frames[5]
+
+
+def test_sparse_similarity_counts_missing_pairs_as_identical():
+    a, b = np.zeros((64, 64), np.uint8), np.full((64, 64), 255, np.uint8)
+    frames = SparseFrames(5, {0: a, 1: b, 3: a, 4: a})
+    sims = calculate_sparse_sim_seq(frames, known={3: 0.5})
+    assert sims[0] < 0.1 and sims[1:3] == [1.0, 1.0] and sims[3] == 0.5
+
+
+def test_read_packet_stats_reports_every_frame(tmp_path):
+    path = tmp_path / "video.mp4"
+    write_recording(path)
+    stats = yyh_utils.read_packet_stats(str(path))
+    if stats is None:
+        pytest.skip("neither PyAV nor ffprobe is installed")
+    sizes, keyframes = stats
+    assert len(sizes) == len(keyframes) == SCREENS * FRAMES_PER_SCREEN
+    assert keyframes[0] and all(size > 0 for size in sizes)
+
+
+def test_fast_and_full_segmentation_agree_on_a_recording(tmp_path):
+    path = tmp_path / "video.mp4"
+    write_recording(path)
+    if yyh_utils.read_packet_stats(str(path)) is None:
+        pytest.skip("neither PyAV nor ffprobe is installed")
+    full, fast, full_frames, frames = segment_both(str(path))
+    assert fast == full and len(full) == SCREENS
+    assert_same_keyframes(full, full_frames, frames, tmp_path)
+
+
+def test_change_outlasting_its_window_is_followed(tmp_path, one_large_packet):
+    # The spinner keeps the screen changing after the window (14, 25) of the large packet ends.
+    video_path = write_video(tmp_path / "tail.mp4", spin=range(CHANGE + 1, CHANGE + 13))
+    full, fast, full_frames, frames = segment_both(video_path)
+    assert full[1][0] > 25 + 3
+    assert fast == full
+    assert_same_keyframes(full, full_frames, frames, tmp_path)
+
+
+def test_change_starting_before_its_window_is_followed(tmp_path, one_large_packet):
+    video_path = write_video(tmp_path / "lead.mp4", spin=range(CHANGE - 8, CHANGE))
+    full, fast, full_frames, frames = segment_both(video_path)
+    assert full[0][1] < 14
+    assert fast == full
+    assert_same_keyframes(full, full_frames, frames, tmp_path)
+
+
+def test_windows_that_keep_growing_fall_back_to_the_full_decode(tmp_path, one_large_packet, monkeypatch):
+    monkeypatch.setattr(yyh_utils, "FAST_MAX_PASSES", 1)
+    video_path = write_video(tmp_path / "lead.mp4", spin=range(CHANGE - 8, CHANGE))
+    segmenter = yyh_utils.VideoStableSegment(video_analysis.STABLE_SIM_THRESHOLD, video_analysis.STABLE_INTERVAL_THRESHOLD)
+    assert yyh_utils.read_frames_fast(video_path, video_analysis.HEADER_PIXEL_SIZE, segmenter) is None
+    full, fast, _, frames = segment_both(video_path)
+    assert fast == full and isinstance(frames, list)
+
+
+def test_missing_keyframes_are_read_on_demand(tmp_path):
+    video_path = write_video(tmp_path / "plain.mp4", spin=())
+    frames, y_frames = yyh_utils.read_frames_in_windows(video_path, 0, [(0, 3)])
+    assert read_missing_frames(video_path, 0, frames, y_frames, [2, 40])
+    assert frames.has(40) and y_frames.has(40) and not frames.has(39)
+    assert not read_missing_frames(video_path, 0, frames, y_frames, [FRAMES + 5])
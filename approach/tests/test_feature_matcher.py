@@ -0,0 +1,21 @@
+import cv2
+import numpy as np
+
+from feature_matcher import FeatureMatcher
+
+
+def screen(seed):
+    rng = np.random.default_rng(seed)
+    img = np.full((400, 300), 255, np.uint8)
+    for _ in range(40):
+        x, y = rng.integers(0, 280), rng.integers(0, 380)
+        cv2.rectangle(img, (int(x), int(y)), (int(x) + 20, int(y) + 20), int(rng.integers(0, 200)), -1)
+    return img
+
+
+def test_one_off_screenshots_are_not_cached():
+    matcher = FeatureMatcher("ORB")
+    reference = screen(0)
+    for seed in range(1, 6):
+        matcher.similarity(reference, screen(seed), cache_b=False)
+    assert len(matcher._cache) == 1
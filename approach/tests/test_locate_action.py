@@ -0,0 +1,59 @@
+from input_formatter import AndroidElement
+from region_fusion import RegionFusion
+from segment_replay import locate_action
+
+ELEMENTS = [
+    AndroidElement(path="0/0", bounds=(0, 100, 1080, 200), text="Search"),
+    AndroidElement(path="0/1", bounds=(0, 300, 1080, 400), text="Settings"),
+    AndroidElement(path="0/2", bounds=(0, 1800, 1080, 1900), text="Delete"),
+]
+# DINO region 1 of the recording covers the "Delete" row, not XML label 1 ("Settings")
+REGIONS = [
+    {"index": 0, "box": [0, 50, 540, 100], "phrase": "search bar"},
+    {"index": 1, "box": [0, 900, 540, 950], "phrase": "delete button"},
+]
+
+
+def fusion():
+    return RegionFusion(REGIONS, ELEMENTS, (540, 1200), (1080, 2400))
+
+
+def test_selected_dino_region_is_not_read_as_an_xml_label():
+    action = {"action": "tap", "region": 1}
+    assert locate_action(action, fusion(), target_indices=[1])
+    assert action["position"] == ELEMENTS[2].center
+
+
+def test_element_field_is_an_xml_label():
+    action = {"action": "tap", "element": 1}
+    assert locate_action(action, fusion(), target_indices=[1])
+    assert action["position"] == ELEMENTS[1].center
+
+
+def test_region_is_a_dino_region_even_when_not_selected():
+    action = {"action": "tap", "region": 1}
+    assert locate_action(action, fusion(), target_indices=[0])
+    assert action["position"] == ELEMENTS[2].center
+
+
+def test_element_label_colliding_with_a_selected_region_stays_an_element():
+    # XML label 1 ("Settings") has the same number as the step's selected DINO region 1 ("Delete")
+    action = {"action": "tap", "element": 1, "region": 1}
+    assert locate_action(action, fusion(), target_indices=[1])
+    assert action["position"] == ELEMENTS[1].center
+
+
+def test_indices_may_arrive_as_strings_or_floats():
+    action = {"action": "tap", "element": "2"}
+    assert locate_action(action, fusion())
+    assert action["position"] == ELEMENTS[2].center
+
+    action = {"action": "tap", "region": 0.0}
+    assert locate_action(action, fusion())
+    assert action["position"] == fusion().region_center(0)
+
+
+def test_positional_action_without_a_target_uses_the_selected_region():
+    action = {"action": "tap"}
+    assert locate_action(action, fusion(), target_indices=[1])
+    assert action["position"] == ELEMENTS[2].center
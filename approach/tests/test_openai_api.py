@@ -0,0 +1,76 @@
+import pytest
+
+openai = pytest.importorskip("openai")
+httpx = pytest.importorskip("httpx")
+
+import openai_api
+from rate_limiter import RateLimiter
+
+
+class FakeLimiter:
+    def __init__(self, requests):
+        self.requests = requests
+        self.blocks = []
+
+    def acquire(self, tokens, priority="critical"):
+        return 0.0
+
+    def block(self, seconds):
+        self.blocks.append((seconds, len(self.requests)))
+
+
+COMPLETION = {
+    "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+}
+MESSAGES = [{"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+
+
+def mock_transport(monkeypatch, handler):
+    client_class = openai.OpenAI
+    monkeypatch.setattr(openai, "OpenAI", lambda **kwargs: client_class(
+        http_client=httpx.Client(transport=httpx.MockTransport(handler)), **kwargs
+    ))
+    monkeypatch.setattr(openai_api, "_client", None)
+
+
+def test_rate_limit_response_reaches_the_shared_limiter_on_first_failure(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(429, headers={"retry-after": "2"}, json={"error": {"message": "Rate limit reached"}})
+
+    mock_transport(monkeypatch, handler)
+    limiter = FakeLimiter(requests)
+    monkeypatch.setattr(openai_api, "_limiter", limiter)
+
+    with pytest.raises(openai.RateLimitError):
+        openai_api.chat_completion("critical", model="gpt-4o", messages=MESSAGES)
+
+    # One request per attempt: the SDK does not retry on its own before the limiter is told
+    assert limiter.blocks[0] == (2.0, 1)
+    assert len(requests) == openai_api.MAX_RATE_LIMIT_RETRIES + 1
+
+
+def test_retry_after_a_rate_limit_response_waits_for_the_shared_block(monkeypatch):
+    now = [0.0]
+    sent_at = []
+
+    def handler(request):
+        sent_at.append(now[0])
+        if len(sent_at) == 1:
+            return httpx.Response(429, headers={"retry-after": "2"}, json={"error": {"message": "Rate limit reached"}})
+        return httpx.Response(200, json=COMPLETION)
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    mock_transport(monkeypatch, handler)
+    limiter = RateLimiter(600, 600000, clock=lambda: now[0], sleep=sleep)
+    monkeypatch.setattr(openai_api, "_limiter", limiter)
+
+    reply = openai_api.chat_completion("critical", model="gpt-4o", messages=MESSAGES)
+    assert reply.choices[0].message.content == "ok"
+    assert sent_at == [0.0, pytest.approx(2.0)]
+    assert limiter.metrics()["critical"]["calls"] == 2
@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import segment_replay
+from recordings import write_recording
+from replay_fixtures import ReplayFixture, SimulatedDevice, RecordedVLM, RecordedDetector, build_keyframe_fixture, fixture_dir_for
+from segment_replay import dump_elements, prepare_step
+
+DELAY = 0.2
+
+
+@pytest.fixture
+def recording(tmp_path):
+    video_path = str(tmp_path / "video.mp4")
+    write_recording(video_path)
+    build_keyframe_fixture(video_path)
+    return video_path
+
+
+class SlowDevice(SimulatedDevice):
+    """Simulated device whose screenshot and UI dump each take DELAY seconds."""
+    def screenshot(self, index, save_path):
+        time.sleep(DELAY)
+        return super().screenshot(index, save_path)
+
+    def get_ui_xml(self, local_path=None):
+        time.sleep(DELAY)
+        return super().get_ui_xml(local_path)
+
+
+def analyze():
+    time.sleep(DELAY)
+    return {"regions": [{"index": 0, "box": [0, 0, 10, 10]}], "target_indices": [0]}
+
+
+def test_concurrent_preparation_matches_the_sequential_path(recording, tmp_path):
+    device = SlowDevice(ReplayFixture.load(fixture_dir_for(recording)))
+    sequential_dir, concurrent_dir = tmp_path / "sequential", tmp_path / "concurrent"
+    sequential_dir.mkdir()
+    concurrent_dir.mkdir()
+
+    screenshot = device.screenshot(index=0, save_path=str(sequential_dir))
+    xml_str, elements = dump_elements(device)
+    expected = (open(screenshot, "rb").read(), xml_str, [e.bounds for e in elements], analyze())
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        live_path, xml_str, elements, analysis = prepare_step(pool, device, str(concurrent_dir), analyze)
+    elapsed = time.perf_counter() - start
+
+    assert (open(live_path, "rb").read(), xml_str, [e.bounds for e in elements], analysis) == expected
+    assert elements and elapsed < 2 * DELAY  # the three tasks overlapped
+
+
+def test_failing_task_propagates(recording, tmp_path):
+    device = SimulatedDevice(ReplayFixture.load(fixture_dir_for(recording)))
+
+    def broken_analysis():
+        raise RuntimeError("detector crashed")
+
+    with ThreadPoolExecutor(max_workers=3) as pool, pytest.raises(RuntimeError, match="detector crashed"):
+        prepare_step(pool, device, str(tmp_path), broken_analysis)
+
+
+class BrokenDetector(RecordedDetector):
+    def run_grounding_dino(self, image_path, output_path):
+        raise RuntimeError("detector crashed")
+
+
+def test_failing_step_stops_the_replay_and_shuts_the_pool_down(recording, tmp_path):
+    fixture = ReplayFixture.load(fixture_dir_for(recording))
+    with pytest.raises(RuntimeError, match="detector crashed"):
+        segment_replay.main(recording, device=SimulatedDevice(fixture), vlm=RecordedVLM(fixture), detector=BrokenDetector(fixture),
+                            interactive=False, out_root=str(tmp_path / "out"), cache_folder=None)
+    assert not [t for t in threading.enumerate() if t.name.startswith("step-prepare")]
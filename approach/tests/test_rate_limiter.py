@@ -0,0 +1,120 @@
+import json
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, MAX_SLEEP, WAITER_TTL
+
+
+class FakeClock:
+    """Deterministic time: sleeping advances the clock, and hooks can run between polls."""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+        self.on_sleep = None
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        if self.on_sleep:
+            self.on_sleep()
+        self.now += seconds
+
+
+def limiter(rpm=60, tpm=60000, clock=None):
+    clock = clock or FakeClock()
+    return RateLimiter(rpm, tpm, clock=clock, sleep=clock.sleep), clock
+
+
+def state(limiter):
+    with limiter._transaction() as s:
+        return s
+
+
+class FakeMsvcrt:
+    LK_LOCK, LK_UNLCK = 1, 0
+
+    def __init__(self):
+        self.calls = []
+
+    def locking(self, fd, mode, nbytes):
+        self.calls.append(mode)
+
+
+def test_state_file_is_shared_with_msvcrt_locks_without_fcntl(tmp_path, monkeypatch):
+    msvcrt = FakeMsvcrt()
+    monkeypatch.setattr(rate_limiter, "fcntl", None)
+    monkeypatch.setattr(rate_limiter, "msvcrt", msvcrt)
+    state_path = str(tmp_path / "limits.json")
+
+    RateLimiter(60, 60000, state_path).acquire(1000)
+    RateLimiter(60, 60000, state_path).acquire(1000)  # a second "process" sees the first one's spend
+
+    with open(state_path, "r", encoding="utf-8") as f:
+        levels = json.load(f)["levels"]
+    assert levels["tokens"] < 10000 - 2000 + 100  # 10 s of budget, both calls spent from it
+    assert msvcrt.calls == [FakeMsvcrt.LK_LOCK, FakeMsvcrt.LK_UNLCK] * 2
+
+
+def test_request_bucket_allows_a_burst_then_refills_at_the_rate():
+    lim, clock = limiter(rpm=60)
+    assert [lim.acquire(10) for _ in range(10)] == [0.0] * 10  # 10 s of budget at 1 request/s
+    assert lim.acquire(10) == pytest.approx(1.0)
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+
+def test_token_bucket_delays_large_calls():
+    lim, clock = limiter(rpm=600, tpm=6000)  # 1000 tokens of burst, 100 tokens/s
+    assert lim.acquire(800) == 0.0
+    assert lim.acquire(800) == pytest.approx(6.0)  # 600 missing tokens at 100 tokens/s
+    assert lim.acquire(5000) == pytest.approx(10.0)  # larger than the bucket: waits for a full bucket
+    assert state(lim)["levels"]["tokens"] == pytest.approx(-4000)
+
+
+def test_prefetch_calls_leave_a_reserve_for_critical_calls():
+    lim, clock = limiter(rpm=60)
+    for _ in range(8):
+        lim.acquire(10)
+    # 2 requests left: a critical call goes now, a prefetch call waits until 1 + 25% of 10 are available
+    assert lim.acquire(10, "prefetch") == pytest.approx(1.5)
+    lim, clock = limiter(rpm=60)
+    for _ in range(8):
+        lim.acquire(10)
+    assert lim.acquire(10, "critical") == 0.0
+
+
+def test_prefetch_yields_to_a_waiting_critical_call_until_its_ttl():
+    lim, clock = limiter()
+    state(lim)["critical_waiters"]["other-process"] = clock() + 1.2
+    assert lim.acquire(10, "prefetch") == pytest.approx(1.5)  # polls every MAX_SLEEP until the waiter expired
+    assert clock.sleeps == [MAX_SLEEP] * 3
+    assert state(lim)["critical_waiters"] == {}
+    state(lim)["critical_waiters"]["other-process"] = clock() + 1.2
+    assert lim.acquire(10, "critical") == 0.0  # critical calls do not yield to each other
+
+
+def test_waiting_critical_call_registers_itself_with_a_ttl():
+    lim, clock = limiter(rpm=6)  # 1 request of burst, one every 10 s
+    lim.acquire(10)
+    seen = []
+    clock.on_sleep = lambda: seen.append(dict(state(lim)["critical_waiters"]))
+    assert lim.acquire(10) == pytest.approx(10.0)
+    assert len(seen) == 20 and all(len(w) == 1 for w in seen)
+    assert list(seen[0].values()) == [pytest.approx(1000.0 + MAX_SLEEP + WAITER_TTL)]
+    assert state(lim)["critical_waiters"] == {}  # removed once it got through
+
+
+def test_block_stops_every_caller_for_the_retry_after_period():
+    lim, clock = limiter(rpm=60)
+    lim.block(3.0)
+    assert state(lim)["levels"]["requests"] == 0.0
+    assert lim.acquire(10) == pytest.approx(3.0)
+    assert lim.metrics()["critical"]["calls"] == 1 and lim.metrics()["critical"]["max_wait_s"] == pytest.approx(3.0)
+
+
+def test_unknown_priority_is_rejected():
+    lim, _ = limiter()
+    with pytest.raises(ValueError):
+        lim.acquire(10, "background")
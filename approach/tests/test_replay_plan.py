@@ -0,0 +1,54 @@
+import os
+import shutil
+
+import cv2
+
+import replay_plan
+from recordings import write_recording, SCREENS
+from replay_plan import ReplayPlan, compile_plan
+
+
+def fake_analyze_step(step_out_dir, tmp_start_path, tmp_stop_path, detector, vlm):
+    """Stands in for DINO and GPT-4o: the annotated images are copies of the start keyframe."""
+    step = int(os.path.basename(os.path.dirname(tmp_start_path)).split("_")[1])
+    dino_path, relevant_path = os.path.join(step_out_dir, "dino.png"), os.path.join(step_out_dir, "relevant_regions.png")
+    shutil.copy(tmp_start_path, dino_path)
+    shutil.copy(tmp_start_path, relevant_path)
+    return {
+        "regions": [{"index": 0, "box": [10, 20 + step, 30, 40]}],
+        "relevant_reply": f'{{"target_regions": [0], "predicted_action": "tap {step}"}}',
+        "predicted_action": f"tap {step}",
+        "target_indices": [0],
+        "dino_path": dino_path,
+        "relevant_path": relevant_path,
+    }
+
+
+def test_compiled_plan_round_trips(tmp_path, monkeypatch):
+    video_path = str(tmp_path / "video.mp4")
+    write_recording(video_path)
+    monkeypatch.setattr(replay_plan, "analyze_step", fake_analyze_step)
+
+    plan_path = compile_plan(video_path, detector=object(), vlm=object(), cache_folder=None)
+    assert plan_path == str(tmp_path / "video.plan.zip")
+
+    plan = ReplayPlan.load(plan_path)
+    assert plan.video_stem == "video"
+    assert plan.frame_size == (360, 640)
+    assert len(plan.segments) == SCREENS and plan.merged_segments == 0
+
+    for i in range(SCREENS - 1):
+        step_dir = str(tmp_path / "replay" / f"step_{i}")
+        analysis = plan.extract_step(i, step_dir)
+        assert analysis["regions"] == [{"index": 0, "box": [10, 20 + i, 30, 40]}]
+        assert analysis["predicted_action"] == f"tap {i}" and analysis["target_indices"] == [0]
+        start = cv2.imread(os.path.join(step_dir, "tmp_start.png"))
+        assert start.shape == (640, 360, 3)
+        assert (cv2.imread(analysis["relevant_path"]) == start).all()
+        assert os.path.exists(os.path.join(step_dir, "tmp_stop.png")) and os.path.exists(analysis["dino_path"])
+
+
+def test_check_screen_compares_aspect_ratios():
+    plan = ReplayPlan("plan.zip", {"version": replay_plan.PLAN_VERSION, "frame_size": [360, 640]})
+    assert plan.check_screen((1080, 1920))
+    assert not plan.check_screen((1080, 2400))
@@ -0,0 +1,32 @@
+import cv2
+import numpy as np
+
+from yyh_utils import collapse_duplicate_segments
+
+
+def settings_screen():
+    frame = np.full((1200, 720), 235, np.uint8)
+    for row in range(6):
+        y = 120 + 160 * row
+        cv2.putText(frame, f"Option {row}", (40, y), cv2.FONT_HERSHEY_SIMPLEX, 1.4, 30, 3)
+        cv2.rectangle(frame, (600, y - 40), (660, y + 10), 30, 3)  # unchecked checkbox
+    return frame
+
+
+def collapse(before, after):
+    frames = [before, before, after, after]
+    return collapse_duplicate_segments(frames, [(0, 1), (2, 3)])
+
+
+def test_toggled_checkbox_keeps_its_step():
+    before = settings_screen()
+    after = before.copy()
+    cv2.rectangle(after, (606, 86), (654, 124), 30, -1)  # check the first box
+    assert collapse(before, after) == ([(0, 1), (2, 3)], 0)
+
+
+def test_noise_only_transition_is_merged():
+    before = settings_screen()
+    noise = np.random.default_rng(0).integers(-6, 7, before.shape)
+    after = np.clip(before + noise, 0, 255).astype(np.uint8)
+    assert collapse(before, after) == ([(0, 3)], 1)
@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+import pytest
+
+from state_memo import StateMemo
+
+
+class FakeDevice:
+    def __init__(self):
+        self.dumps = 0
+
+    def get_ui_xml(self):
+        self.dumps += 1
+        return "<hierarchy/>"
+
+
+@pytest.fixture
+def screens(tmp_path):
+    """Two clearly different screens; each call writes a fresh screenshot file."""
+    a = np.full((800, 400, 3), 200, np.uint8)
+    cv2.putText(a, "Settings", (40, 200), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 0), 3)
+    b = a.copy()
+    cv2.rectangle(b, (40, 400), (360, 700), (0, 0, 255), -1)
+    typed = a.copy()  # A with a few characters typed into a field
+    cv2.putText(typed, "abc", (40, 300), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+    count = iter(range(100))
+
+    def shot(name):
+        path = str(tmp_path / f"shot{next(count)}.png")
+        cv2.imwrite(path, {"A": a, "B": b, "typed": typed}[name])
+        return path
+    return shot
+
+
+def replay_trail(memo, device, shot, tmp_path, names):
+    """Registers the first screen like a step start, observes the rest like recovery attempts."""
+    memo.start_step()
+    memo.add(shot(names[0]), "<hierarchy/>", [], str(tmp_path / "labeled.png"))
+    return [(memo.observe(shot(name), device, str(tmp_path)).id, memo.revisit()) for name in names[1:]]
+
+
+def test_unchanged_screen_is_not_an_oscillation(screens, tmp_path):
+    memo, device = StateMemo(lambda xml: []), FakeDevice()
+    trail = replay_trail(memo, device, screens, tmp_path, ["A", "A", "A"])
+    assert trail == [(0, False), (0, False)]
+    assert device.dumps == 0
+
+
+def test_returning_to_a_left_screen_is_an_oscillation(screens, tmp_path):
+    memo, device = StateMemo(lambda xml: []), FakeDevice()
+    trail = replay_trail(memo, device, screens, tmp_path, ["A", "B", "A"])
+    assert trail == [(1, False), (0, True)]
+    assert device.dumps == 1  # only the new screen B needed a UI dump
+
+
+def test_self_loop_then_change_is_not_an_oscillation(screens, tmp_path):
+    memo, device = StateMemo(lambda xml: []), FakeDevice()
+    trail = replay_trail(memo, device, screens, tmp_path, ["A", "A", "B"])
+    assert [revisit for _, revisit in trail] == [False, False]
+
+
+def test_consistency_verdict_is_computed_once_per_state_and_reference(screens, tmp_path):
+    memo = StateMemo(lambda xml: [])
+    state = memo.add(screens("A"), "<hierarchy/>", [], str(tmp_path / "labeled.png"))
+    calls = []
+    check = lambda: calls.append(1) or {"same_state": "no"}
+    assert memo.consistency(state, "start.png", check) == {"same_state": "no"}
+    assert memo.consistency(state, "start.png", check) == {"same_state": "no"}
+    memo.consistency(state, "other_start.png", check)
+    assert len(calls) == 2
+
+
+def test_typed_text_is_a_new_state(screens, tmp_path):
+    memo, device = StateMemo(lambda xml: []), FakeDevice()
+    start = memo.add(screens("A"), "<hierarchy/>", [], str(tmp_path / "labeled.png"))
+    state = memo.observe(screens("typed"), device, str(tmp_path), previous=start)
+    assert state is not start
+    assert device.dumps == 1
+
+
+def test_verdict_is_not_reused_right_after_an_action_that_changed_pixels(screens, tmp_path):
+    memo, device = StateMemo(lambda xml: []), FakeDevice()
+    a = memo.add(screens("A"), "<hierarchy/>", [], str(tmp_path / "labeled.png"))
+    memo.consistency(a, "start.png", lambda: {"same_state": "no"})
+    b = memo.observe(screens("B"), device, str(tmp_path), previous=a)
+    back = memo.observe(screens("A"), device, str(tmp_path), previous=b)
+    assert back is a and device.dumps == 1
+    assert memo.consistency(back, "start.png", lambda: {"same_state": "yes"}) == {"same_state": "yes"}
+
+
+def test_verdict_is_reused_when_the_action_changed_nothing(screens, tmp_path):
+    memo, device = StateMemo(lambda xml: []), FakeDevice()
+    a = memo.add(screens("A"), "<hierarchy/>", [], str(tmp_path / "labeled.png"))
+    memo.consistency(a, "start.png", lambda: {"same_state": "no"})
+    same = memo.observe(screens("A"), device, str(tmp_path), previous=a)
+    assert memo.consistency(same, "start.png", lambda: {"same_state": "yes"}) == {"same_state": "no"}
+    assert device.dumps == 0
@@ -0,0 +1,98 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture(autouse=True)
+def recording():
+    tracing.reset()
+    tracing.enable()
+    yield
+    tracing.enable(False)
+    tracing.reset()
+
+
+def by_name():
+    return {e["name"]: e for e in tracing.events()}
+
+
+def test_nested_spans_are_contained_in_their_parent():
+    with tracing.span("outer", kind="test"):
+        with tracing.span("inner") as inner:
+            inner["bytes"] = 3
+    events = by_name()
+    outer, inner = events["outer"], events["inner"]
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    assert outer["args"] == {"kind": "test"} and inner["args"] == {"bytes": 3}
+    assert outer["tid"] == inner["tid"] == threading.get_ident()
+
+
+def test_traced_functions_carry_attributes_and_errors():
+    @tracing.traced("work")
+    def work(fail=False):
+        if fail:
+            raise ValueError("boom")
+        return 1
+
+    tracing.set_attributes(step=2)
+    assert work() == 1
+    with pytest.raises(ValueError):
+        work(fail=True)
+    tracing.set_attributes(step=None)
+    work()
+
+    args = [e["args"] for e in tracing.events()]
+    assert args == [{"step": 2}, {"step": 2, "error": "ValueError"}, {}]
+
+
+def record(name, **attrs):
+    tracing.set_attributes(**attrs)
+    with tracing.span(name):
+        pass
+
+
+def test_attributes_are_per_thread_and_bound_into_pools():
+    tracing.set_attributes(step=1)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(record, "plain").result()
+        pool.submit(tracing.bind(record), "bound", kind="worker").result()
+        pool.submit(record, "after").result()
+    record("main")
+    events = by_name()
+    assert events["plain"]["args"] == {}
+    assert events["bound"]["args"] == {"step": 1, "kind": "worker"}
+    assert events["after"]["args"] == {}  # the worker's own attributes were restored
+    assert events["main"]["args"] == {"step": 1}
+
+
+def test_chrome_trace_export_and_summary(tmp_path):
+    for _ in range(3):
+        with tracing.span("decode"):
+            pass
+    with tracing.span("ocr"):
+        pass
+
+    path = tmp_path / "trace.json"
+    tracing.export_chrome_trace(str(path))
+    trace = json.loads(path.read_text())
+    assert [e["name"] for e in trace["traceEvents"]] == ["decode"] * 3 + ["ocr"]
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in trace["traceEvents"])
+
+    summary = tracing.summary()
+    assert summary["decode"]["count"] == 3 and summary["ocr"]["count"] == 1
+    assert summary["decode"]["mean_s"] == pytest.approx(summary["decode"]["total_s"] / 3)
+    table = tracing.format_summary().splitlines()
+    assert table[0].split() == ["stage", "count", "total", "s", "mean", "s", "max", "s"]
+    assert {line.split()[0] for line in table[1:]} == {"decode", "ocr"}
+
+
+def test_disabled_tracing_records_nothing():
+    tracing.enable(False)
+    with tracing.span("ignored") as s:
+        s["x"] = 1
+    assert tracing.events() == []
@@ -0,0 +1,191 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+"""
+Lightweight span tracing for the replay pipeline.
+
+- `span(name, **attrs)` times a block of code; `traced(name)` does the same for a whole function.
+- Spans carry attributes (e.g. the replay step) and can be exported as Chrome-trace JSON
+  (open in chrome://tracing or https://ui.perfetto.dev) or summarized as a per-stage table.
+- Attributes set with `set_attributes` belong to the calling thread; `bind` carries them into a thread pool.
+- Tracing is disabled by default; a disabled span is a shared no-op object, so instrumented
+  code pays only a function call and a flag check.
+"""
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_events = []
+_local = threading.local()  # per-thread attributes, see set_attributes()
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+class _NullSpan:
+    """Returned when tracing is disabled; accepts and discards attributes."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setitem__(self, key, value):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed region of code recorded as a Chrome-trace complete event."""
+    __slots__ = ("name", "attrs", "start")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = {**_attributes(), **attrs}
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        event = {
+            "name": self.name,
+            "ph": "X",
+            "ts": (self.start - _origin) * 1e6,
+            "dur": (end - self.start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": self.attrs,
+        }
+        with _lock:
+            _events.append(event)
+        return False
+
+    def __setitem__(self, key, value):
+        self.attrs[key] = value
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+def enable(flag=True):
+    """Turn span recording on or off."""
+    global _enabled
+    _enabled = flag
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """Drop all recorded spans and the calling thread's attributes."""
+    with _lock:
+        _events.clear()
+    _attributes().clear()
+
+def _attributes():
+    if not hasattr(_local, "attrs"):
+        _local.attrs = {}
+    return _local.attrs
+
+def set_attributes(**attrs):
+    """
+    Set attributes attached to every span the calling thread opens afterwards (e.g. step=3).
+    None removes a key. Work handed to other threads gets them through `bind`.
+    """
+    attributes = _attributes()
+    for key, value in attrs.items():
+        if value is None:
+            attributes.pop(key, None)
+        else:
+            attributes[key] = value
+
+def bind(func):
+    """Wrap `func` so that it runs with the calling thread's current attributes (e.g. in a thread pool)."""
+    attrs = dict(_attributes())
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        saved = _attributes()
+        _local.attrs = dict(attrs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.attrs = saved
+    return wrapper
+
+def span(name, **attrs):
+    """
+    Time a block of code.
+
+    Usage:
+        with tracing.span("screenshot", step=i) as s:
+            ...
+            s["bytes"] = size
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, attrs)
+
+def traced(name):
+    """Decorator that records every call of a function as a span called `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def events():
+    """Return a copy of the recorded span events."""
+    with _lock:
+        return list(_events)
+
+def export_chrome_trace(path):
+    """Write recorded spans as Chrome-trace JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events(), "displayTimeUnit": "ms"}, f, default=str)
+    logger.info(f"Trace with {len(_events)} spans written to {path}")
+
+def summary():
+    """
+    Aggregate recorded spans per name.
+
+    Returns:
+        dict: name -> {"count", "total_s", "mean_s", "max_s"}, sorted by total time (descending).
+    """
+    stats = {}
+    for e in events():
+        s = stats.setdefault(e["name"], {"count": 0, "total_s": 0.0, "max_s": 0.0})
+        duration = e["dur"] / 1e6
+        s["count"] += 1
+        s["total_s"] += duration
+        s["max_s"] = max(s["max_s"], duration)
+    for s in stats.values():
+        s["mean_s"] = s["total_s"] / s["count"]
+    return dict(sorted(stats.items(), key=lambda kv: kv[1]["total_s"], reverse=True))
+
+def format_summary():
+    """Render `summary()` as a plain-text table."""
+    rows = summary()
+    width = max([len("stage")] + [len(name) for name in rows])
+    lines = [f"{'stage':<{width}}  {'count':>6}  {'total s':>9}  {'mean s':>8}  {'max s':>8}"]
+    for name, s in rows.items():
+        lines.append(f"{name:<{width}}  {s['count']:>6}  {s['total_s']:>9.3f}  {s['mean_s']:>8.3f}  {s['max_s']:>8.3f}")
+    return "\n".join(lines)
@@ -0,0 +1,205 @@
+import os
+import json
+import logging
+import pickle
+import cv2
+
+import yyh_utils  # Your video/frame utils
+from change_localization import change_boxes, focus_boxes, scale_boxes, crop_views
+from openai_api import crops_cost_less
+
+"""
+Video-only analysis of a recording: everything a replay needs that does not depend on the device.
+
+- Decodes the recording and splits it into stable segments (one replay step per transition).
+- Writes the start/stop keyframes of every step.
+- Runs GroundingDINO on start keyframes and asks GPT-4o which regions are relevant for each transition.
+
+Used by segment_replay.py for live replays and by replay_plan.py to compile reusable replay plans.
+"""
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+HEADER_PIXEL_SIZE = 33            # Status bar rows ignored by the frame similarity
+STABLE_SIM_THRESHOLD = 0.99
+STABLE_INTERVAL_THRESHOLD = 3
+
+def extract_json(reply_text):
+    """
+    Extracts JSON object from GPT reply (removes any markdown formatting).
+    """
+    reply_text = reply_text.strip()
+    if reply_text.startswith("```json"):
+        reply_text = reply_text[7:]
+    elif reply_text.startswith("```"):
+        reply_text = reply_text[3:]
+    if reply_text.endswith("```"):
+        reply_text = reply_text[:-3]
+
+    try:
+        return json.loads(reply_text.strip())
+    except json.JSONDecodeError as e:
+        logger.error(f"❌ JSON decoding failed: {e}")
+        raise
+
+def load_detector():
+    """
+    Imports the GroundingDINO detector on first use (loads the model weights).
+    """
+    import dino_detection
+    return dino_detection
+
+def segment_video(video_path, cache_folder="./cache", collapse_duplicates=False, fast=False):
+    """
+    Decodes a recording and splits it into stable segments.
+
+    Args:
+        video_path (str): Path to the input video.
+        cache_folder (str): Where similarity lists are cached between runs (None disables the cache).
+        collapse_duplicates (bool): Merge consecutive segments whose keyframes show no localized change
+                                    (drops their replay steps, so it is opt-in).
+        fast (bool): Only decode and score frames in transition windows found from packet statistics
+                     (needs PyAV or ffprobe; falls back to the full decode otherwise).
+
+    Returns:
+        frames (list): Decoded BGR frames (a yyh_utils.SparseFrames in fast mode).
+        stable_segments (list): (start, end) frame indices of each stable segment.
+        merged (int): Number of replay steps removed by collapse_duplicates.
+    """
+    video_stem = os.path.splitext(os.path.basename(video_path))[0]
+
+    segmenter = yyh_utils.VideoStableSegment(
+        stable_sim_threshold=STABLE_SIM_THRESHOLD,
+        stable_interval_threshold=STABLE_INTERVAL_THRESHOLD
+    )
+
+    sparse = None
+    if fast:
+        sparse = yyh_utils.read_frames_fast(video_path, HEADER_PIXEL_SIZE, segmenter)
+        if sparse is None:
+            logger.warning("⚠️ Fast segmentation needs PyAV or ffprobe and settled transition windows; decoding the whole video.")
+
+    # Read frames and header from the video using your custom util
+    if sparse is not None:
+        frames, y_frames, sim_list = sparse
+    else:
+        frames, y_frames = yyh_utils.read_frames_from_video(video_path, header_pixel_size=HEADER_PIXEL_SIZE)
+
+    # Segment similarity caching to speed up repeated runs (the fast path is cheap enough without)
+    sim_file = None
+    if cache_folder and sparse is None:
+        os.makedirs(cache_folder, exist_ok=True)
+        sim_file = os.path.join(cache_folder, f"sim_list_{video_stem}.pkl")
+
+    if sim_file and os.path.exists(sim_file):
+        with open(sim_file, "rb") as f:
+            sim_list = pickle.load(f)
+        logger.info("✅ Similarity list loaded.")
+    elif sparse is not None:
+        logger.info("📼 Similarity list calculated inside transition windows.")
+    else:
+        sim_list = yyh_utils.calculate_sim_seq(y_frames)
+        if sim_file:
+            with open(sim_file, "wb") as f:
+                pickle.dump(sim_list, f)
+        logger.info("📼 Similarity list calculated.")
+
+    logger.info("🔍 Detecting stable segments...")
+    stable_segments = segmenter.detect_keyframes(sim_list)
+
+    # Keyframes of the fast path must have been decoded; read stragglers, or decode everything if that fails.
+    keyframes = [1] + [s[0] for s in stable_segments] + [s[1] for s in stable_segments[:-1]]
+    if sparse is not None and not yyh_utils.read_missing_frames(video_path, HEADER_PIXEL_SIZE, frames, y_frames, keyframes):
+        logger.warning("⚠️ Fast segmentation could not read every keyframe; decoding the whole video.")
+        return segment_video(video_path, cache_folder, collapse_duplicates, fast=False)
+
+    merged = 0
+    if collapse_duplicates:
+        # Drop steps without a real transition (cursor blinks, compression noise) to save DINO and GPT-4o calls.
+        stable_segments, merged = yyh_utils.collapse_duplicate_segments(y_frames, stable_segments)
+
+    if stable_segments[0][0] > 2:
+        stable_segments = [(0, 1)] + stable_segments
+
+    return frames, stable_segments, merged
+
+def keyframe_paths(video_out_dir, step):
+    """Paths of the start and stop keyframes of a replay step."""
+    step_out_dir = os.path.join(video_out_dir, f"step_{step}")
+    return os.path.join(step_out_dir, "tmp_start.png"), os.path.join(step_out_dir, "tmp_stop.png")
+
+def write_keyframes(video_out_dir, frames, stable_segments):
+    """
+    Writes the start and stop keyframe of every replay step into its step folder.
+
+    Step i goes from the last frame of stable segment i to the first frame of segment i + 1.
+    """
+    for i in range(len(stable_segments) - 1):
+        tmp_start_path, tmp_stop_path = keyframe_paths(video_out_dir, i)
+        os.makedirs(os.path.dirname(tmp_start_path), exist_ok=True)
+        cv2.imwrite(tmp_start_path, frames[stable_segments[i][1]])
+        cv2.imwrite(tmp_stop_path, frames[stable_segments[i + 1][0]])
+
+def analyze_step(step_out_dir, tmp_start_path, tmp_stop_path, detector, vlm, cached=None, record=None, localize=True):
+    """
+    Runs the video-only analysis of one replay step.
+
+    Detects regions on the start keyframe, asks GPT-4o which of them are relevant for the
+    transition to the stop keyframe and annotates those on the start keyframe.
+
+    Args:
+        step_out_dir (str): Step folder for the annotated images.
+        tmp_start_path (str): Start keyframe.
+        tmp_stop_path (str): Stop keyframe.
+        detector: Object providing run_grounding_dino/annotate_relevant_regions.
+        vlm: Object providing ask_gpt_for_relevant_regions.
+        cached (dict): Previously computed "regions" and/or "relevant_reply" to reuse.
+        record (callable): Called as record(key, value) as soon as "regions" and "relevant_reply" are known.
+        localize (bool): Send GPT-4o the stop keyframe as a low-detail view plus high-detail crops of the changed areas.
+
+    Returns:
+        dict: {"regions", "relevant_reply", "predicted_action", "target_indices",
+               "dino_path", "relevant_path"}
+    """
+    cached = cached or {}
+    record = record or (lambda key, value: None)
+
+    # Use DINO detection for grounding region proposals
+    dino_out_path = os.path.join(step_out_dir, "dino.png")
+    dino_regions = cached.get("regions")
+    if dino_regions is None or not os.path.exists(dino_out_path):
+        dino_regions = detector.run_grounding_dino(tmp_start_path, dino_out_path)
+        record("regions", dino_regions)
+
+    relevant_reply = cached.get("relevant_reply")
+    if relevant_reply is None:
+        stop_crops = None
+        if localize:
+            # Where the transition changed the screen (None: no change found or too large to crop)
+            start_img, stop_img = cv2.imread(tmp_start_path), cv2.imread(tmp_stop_path)
+            start_size, stop_size = (start_img.shape[1], start_img.shape[0]), (stop_img.shape[1], stop_img.shape[0])
+            focus = focus_boxes(change_boxes(start_img, stop_img), start_size)
+            stop_boxes = scale_boxes(focus, start_size, stop_size) if focus else None
+            # Only the unlabeled stop keyframe: the DINO-labeled start keyframe stays whole so every index is readable.
+            # Crops are written only when they cost fewer tokens than the high-detail full view.
+            if stop_boxes and crops_cost_less(stop_size, stop_boxes):
+                stop_crops = crop_views(tmp_stop_path, stop_boxes, step_out_dir, "stop")
+        relevant_reply = vlm.ask_gpt_for_relevant_regions(dino_out_path, tmp_stop_path, stop_crops=stop_crops)
+    relevant = extract_json(relevant_reply)
+    record("relevant_reply", relevant_reply)
+    logger.info(f"🔍 Relevant regions: {relevant}")
+    target_indices = relevant["target_regions"]
+    logger.info(f"🧠 GPT selected regions: {target_indices}")
+
+    relevant_annotated_path = os.path.join(step_out_dir, "relevant_regions.png")
+    detector.annotate_relevant_regions(tmp_start_path, relevant_annotated_path, dino_regions, target_indices)
+
+    return {
+        "regions": dino_regions,
+        "relevant_reply": relevant_reply,
+        "predicted_action": relevant["predicted_action"],
+        "target_indices": target_indices,
+        "dino_path": dino_out_path,
+        "relevant_path": relevant_annotated_path,
+    }
@@ -1,6 +1,21 @@
 import cv2
+import hashlib
+import json
+import logging
+import shutil
+import subprocess
 from itertools import groupby
-from skimage.metrics import structural_similarity as ssim
+
+import numpy as np
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+def ssim(*args, **kwargs):
+    """skimage's structural_similarity, imported on first use (skimage.metrics pulls in scipy)."""
+    from skimage.metrics import structural_similarity
+    return structural_similarity(*args, **kwargs)
 
 def extract_Y(img):
     """
@@ -14,6 +29,7 @@ def extract_Y(img):
     y, _, _ = cv2.split(img_yuv)
     return y
 
+@tracing.traced("decode")
 def read_frames_from_video(video, header_pixel_size):
     """
     Reads all frames from a video file.
@@ -26,7 +42,7 @@ def read_frames_from_video(video, header_pixel_size):
         frames (list): List of original frames (BGR, OpenCV format).
         y_frames (list): List of Y channel frames (cropped at top).
     """
-    print("Reading frames from video...")
+    logger.info("Reading frames from video...")
     frames = []
     y_frames = []
     vidcap = cv2.VideoCapture(video)
@@ -42,10 +58,222 @@ def read_frames_from_video(video, header_pixel_size):
         frames.append(frame)
         y_frame = extract_Y(frame)
         y_frames.append(y_frame[header_pixel_size:])   
-        print ("Reading frame: ", len(frames), end="\r") 
     vidcap.release()
+    logger.info(f"Read {len(frames)} frames.")
     return frames, y_frames
 
+# --- Fast segmentation from compressed-stream statistics ---
+PACKET_BASELINE_QUANTILE = 0.1   # Packet size of a static screen: this quantile of non-keyframe packet sizes
+PACKET_SIZE_FACTOR = 3.0         # Packets larger than this multiple of the baseline may hold a transition
+FAST_MAX_PASSES = 3              # Decoding passes that may grow windows before falling back to a full decode
+
+def read_packet_stats(video):
+    """
+    Reads per-frame packet sizes and keyframe flags from the container without decoding.
+
+    Uses PyAV if it is installed, otherwise ffprobe.
+
+    Args:
+        video (str): Path to video file.
+
+    Returns:
+        (list, list): Packet sizes in bytes and keyframe flags in presentation order,
+                      or None if neither PyAV nor ffprobe is available.
+    """
+    try:
+        import av
+    except ImportError:
+        av = None
+
+    if av is not None:
+        with av.open(video) as container:
+            stream = container.streams.video[0]
+            packets = [
+                (p.pts if p.pts is not None else p.dts, p.size, p.is_keyframe)
+                for p in container.demux(stream) if p.size
+            ]
+    elif shutil.which("ffprobe"):
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "packet=pts,dts,size,flags", "-of", "json", video],
+            capture_output=True, text=True, check=True,
+        )
+        packets = [
+            (int(p.get("pts", p.get("dts", 0))), int(p["size"]), "K" in p.get("flags", ""))
+            for p in json.loads(result.stdout)["packets"] if int(p["size"])
+        ]
+    else:
+        return None
+
+    packets.sort(key=lambda p: p[0])  # decode order -> presentation order
+    return [p[1] for p in packets], [p[2] for p in packets]
+
+def transition_windows(sizes, keyframes, pad):
+    """
+    Frame ranges that may contain a GUI transition.
+
+    Static screens compress to tiny packets; a packet well above the static baseline (or a keyframe,
+    whose size says nothing) marks a frame that may differ from its predecessor. Each such frame is
+    padded by `pad` frames on both sides and overlapping ranges are merged.
+
+    Args:
+        sizes (list): Packet size of every frame.
+        keyframes (list): Keyframe flag of every frame.
+        pad (int): Frames added before and after every candidate frame.
+
+    Returns:
+        list: Inclusive (first, last) frame index ranges.
+    """
+    inter_sizes = sorted(s for s, k in zip(sizes, keyframes) if not k) or sorted(sizes)
+    baseline = inter_sizes[int(PACKET_BASELINE_QUANTILE * (len(inter_sizes) - 1))]
+    threshold = PACKET_SIZE_FACTOR * baseline
+
+    windows = [(0, pad)]  # the first frames are always kept
+    for i, (size, key) in enumerate(zip(sizes, keyframes)):
+        if size <= threshold and not key:
+            continue
+        first, last = max(0, i - 1 - pad), min(len(sizes) - 1, i + pad)
+        if first <= windows[-1][1] + 1:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], last))
+        else:
+            windows.append((first, last))
+    return windows
+
+class SparseFrames:
+    """
+    Frame list of which only some frames were decoded.
+
+    Has the length of the whole video; indexing a frame that was not decoded raises IndexError.
+    """
+    def __init__(self, length, frames):
+        self.length = length
+        self.frames = frames
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if index not in self.frames:
+            raise IndexError(f"Frame {index} was not decoded (outside all transition windows)")
+        return self.frames[index]
+
+    def has(self, index):
+        return index in self.frames
+
+def decoded_runs(indices):
+    """Inclusive (first, last) ranges of consecutive frame indices."""
+    runs = []
+    for index in sorted(indices):
+        if runs and index == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], index)
+        else:
+            runs.append((index, index))
+    return runs
+
+@tracing.traced("decode")
+def read_frames_in_windows(video, header_pixel_size, windows, extend=None, frames=None, y_frames=None):
+    """
+    Reads only the frames inside the given windows.
+
+    Frames outside the windows are grabbed but never converted to BGR, cropped or stored.
+
+    Args:
+        video (str): Path to video file.
+        header_pixel_size (int): Number of pixels to crop from the top of Y channel for 'y_frames'.
+        windows (list): Inclusive (first, last) frame index ranges, sorted.
+        extend (callable): Called as extend(y_frames, index) at the last frame of a window (and after
+                           every frame it added); returning True also reads the next frame.
+        frames, y_frames (dict): Frames read by an earlier call; they are kept and not read again.
+
+    Returns:
+        frames (SparseFrames): Original frames (BGR, OpenCV format) inside the windows.
+        y_frames (SparseFrames): Y channel frames (cropped at top) inside the windows.
+    """
+    frames = {} if frames is None else frames
+    y_frames = {} if y_frames is None else y_frames
+    vidcap = cv2.VideoCapture(video)
+    index, w, read, extending = 0, 0, 0, False
+    while vidcap.grab():
+        while w < len(windows) and windows[w][1] < index:
+            w += 1
+        inside = w < len(windows) and windows[w][0] <= index
+        if (inside or extending) and index not in frames:
+            success, frame = vidcap.retrieve()
+            if success:
+                frames[index] = frame
+                y_frames[index] = extract_Y(frame)[header_pixel_size:]
+                read += 1
+        if extend is not None and (extending or inside and index == windows[w][1]):
+            extending = index in y_frames and extend(y_frames, index)
+        index += 1
+    vidcap.release()
+    logger.info(f"Read {read} of {index} frames inside {len(windows)} transition windows.")
+    return SparseFrames(index, frames), SparseFrames(index, y_frames)
+
+def read_frames_fast(video, header_pixel_size, segmenter):
+    """
+    Reads the frames that can matter for segmentation, located from packet statistics.
+
+    Windows are padded by the segmenter's interval threshold plus two frames, and a window only
+    ends once its last `pad` frame pairs are stable: a change that outlasts its window without
+    large packets (a spinner, the tail of an animation) is followed while decoding, and a window
+    whose first pairs are unstable is grown backwards in another pass. Then every boundary
+    VideoStableSegment can produce lies inside a window, and pairs outside count as stable.
+
+    Args:
+        video (str): Path to video file.
+        header_pixel_size (int): Number of pixels to crop from the top of Y channel for 'y_frames'.
+        segmenter (VideoStableSegment): Segmenter whose stability rule and interval are used.
+
+    Returns:
+        (SparseFrames, SparseFrames, list): As read_frames_in_windows plus the similarity list, or None
+            if packet statistics are unavailable (neither PyAV nor ffprobe installed) or the windows
+            had not settled after FAST_MAX_PASSES passes.
+    """
+    stats = read_packet_stats(video)
+    if stats is None:
+        return None
+    pad = segmenter.interval_threshold + 2
+    windows = transition_windows(*stats, pad=pad)
+    sims = {}
+
+    def settled(y_frames, first, last):
+        """True if every frame pair from first to last (inclusive) was read and is stable."""
+        for j in range(max(0, first), last + 1):
+            if j not in y_frames or j + 1 not in y_frames:
+                return False
+            if j not in sims:
+                sims[j] = frame_similarity(y_frames[j], y_frames[j + 1])
+            if not segmenter.is_stable(sims[j]):
+                return False
+        return True
+
+    frames, y_frames = {}, {}
+    for _ in range(FAST_MAX_PASSES):
+        sparse = read_frames_in_windows(video, header_pixel_size, windows, frames=frames, y_frames=y_frames,
+                                        extend=lambda y, index: not settled(y, index - pad, index - 1))
+        windows = [(max(0, first - pad), first - 1) for first, last in decoded_runs(y_frames)
+                   if first > 0 and not settled(y_frames, first, min(last - 1, first + pad - 1))]
+        if not windows:
+            return (*sparse, calculate_sparse_sim_seq(sparse[1], known=sims))
+    logger.warning(f"Transition windows still growing after {FAST_MAX_PASSES} passes.")
+    return None
+
+def read_missing_frames(video, header_pixel_size, frames, y_frames, indices):
+    """
+    Reads the given frames into SparseFrames that lack them.
+
+    Returns:
+        bool: True if all of them are available afterwards.
+    """
+    missing = [i for i in indices if not frames.has(i)]
+    if missing:
+        read_frames_in_windows(video, header_pixel_size, [(i, i) for i in sorted(set(missing))],
+                               frames=frames.frames, y_frames=y_frames.frames)
+    return all(frames.has(i) for i in indices)
+
 class VideoStableSegment:
     """
     Video segmenter based on frame similarity.
@@ -64,6 +292,12 @@ class VideoStableSegment:
         # Higher interval: harder to be stable, fewer (longer) segments.
         self.interval_threshold = stable_interval_threshold
 
+    def is_stable(self, sim):
+        """
+        Returns True if a similarity score between two consecutive frames counts as stable.
+        """
+        return sim > self.sim_threshold
+
     def return_stable_flags(self, list_):
         """
         Returns a boolean list: True where the region is stable, False where not (with interval adjustment).
@@ -71,7 +305,7 @@ class VideoStableSegment:
         result_list = [True for _ in list_]
     
         for index, item in enumerate(list_):
-            if item <= self.sim_threshold:
+            if not self.is_stable(item):
                 start = max(0, index - self.interval_threshold)
                 end = min(len(list_), index + self.interval_threshold + 1)
     
@@ -80,6 +314,7 @@ class VideoStableSegment:
     
         return result_list
 
+    @tracing.traced("segmentation")
     def detect_keyframes(self, sim_sequence):
         """
         Detects stable segment keyframes based on similarity sequence.
@@ -112,6 +347,7 @@ class VideoStableSegment:
     
         return [(a, b) for a, b in zip(keyframes_start_index, keyframes_index)]
     
+@tracing.traced("similarity")
 def calculate_sim_seq(frame_list):
     """
     Calculate a sequence of SSIM similarities between consecutive frames.
@@ -124,6 +360,108 @@ def calculate_sim_seq(frame_list):
     """
     sim_list = []
     for i in range(0, len(frame_list)-1):
-        sim = ssim(frame_list[i], frame_list[i+1])
+        sim = frame_similarity(frame_list[i], frame_list[i+1])
         sim_list.append(sim)
     return sim_list
+
+@tracing.traced("similarity")
+def calculate_sparse_sim_seq(frame_list, known=None):
+    """
+    Like calculate_sim_seq for SparseFrames: pairs that were not decoded count as identical (1.0).
+    Similarities already in `known` (pair index -> score) are not computed again.
+    """
+    known = known or {}
+    return [
+        known[i] if i in known else
+        frame_similarity(frame_list[i], frame_list[i + 1]) if frame_list.has(i) and frame_list.has(i + 1) else 1.0
+        for i in range(len(frame_list) - 1)
+    ]
+
+def frame_similarity(frame_a, frame_b):
+    """
+    SSIM similarity between two Y channel frames of the same size.
+    """
+    return ssim(frame_a, frame_b)
+
+def perceptual_hash(frame, hash_size=8):
+    """
+    Difference hash (dHash) of a grayscale frame.
+
+    Args:
+        frame (np.ndarray): Y channel (grayscale) frame.
+        hash_size (int): Hash side length; the hash has hash_size * hash_size bits.
+
+    Returns:
+        int: Hash as an integer bit field.
+    """
+    small = cv2.resize(frame, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two perceptual hashes."""
+    return bin(hash_a ^ hash_b).count("1")
+
+def file_sha256(path):
+    """SHA-256 hex digest of a local file, read in 1 MB chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# --- Near-duplicate segment collapsing ---
+COLLAPSE_DIFF_THRESHOLD = 25     # Per-pixel absolute difference that counts as changed (0-255)
+COLLAPSE_TILE_SIZE = 32          # Side of the tiles the changed-pixel fraction is measured in
+COLLAPSE_MAX_TILE_CHANGE = 0.1   # A tile with a larger changed fraction is a real (localized) change
+
+def max_tile_change(frame_a, frame_b, tile_size=COLLAPSE_TILE_SIZE):
+    """
+    Largest fraction of changed pixels in any tile of two Y channel frames of the same size.
+
+    Unlike a whole-frame score, this stays high for changes confined to a small area
+    (a toggled checkbox, a focused field), while isolated noise pixels keep it low.
+    """
+    changed = (cv2.absdiff(frame_a, frame_b) > COLLAPSE_DIFF_THRESHOLD).astype(np.float32)
+    h, w = changed.shape[:2]
+    changed = np.pad(changed, ((0, -h % tile_size), (0, -w % tile_size)))
+    tiles = changed.reshape(changed.shape[0] // tile_size, tile_size, changed.shape[1] // tile_size, tile_size)
+    return float(tiles.mean(axis=(1, 3)).max())
+
+@tracing.traced("segmentation.collapse")
+def collapse_duplicate_segments(y_frames, stable_segments, max_hash_distance=4, max_change=COLLAPSE_MAX_TILE_CHANGE):
+    """
+    Merges consecutive stable segments that have no meaningful transition between them.
+
+    Cursor blinks or compression noise can briefly drop the frame similarity and split one
+    screen into several stable segments. The transition between segment i and i + 1 goes from
+    the last frame of segment i to the first frame of segment i + 1; the segments are merged only
+    when those two keyframes have nearly the same perceptual hash and no tile of the frames (at
+    the segmenter's resolution) changed by more than `max_change`, so small real changes such as
+    a toggled switch keep their replay step.
+
+    Args:
+        y_frames (list): Y channel frames (header cropped), as used for segmentation.
+        stable_segments (list): (start, end) frame indices from VideoStableSegment.detect_keyframes.
+        max_hash_distance (int): Maximum dHash Hamming distance for keyframes to be considered duplicates.
+        max_change (float): Maximum changed-pixel fraction of any tile for keyframes to be considered duplicates.
+
+    Returns:
+        (list, int): Collapsed segments and the number of removed replay steps.
+    """
+    if not stable_segments:
+        return stable_segments, 0
+
+    collapsed = [stable_segments[0]]
+    for seg in stable_segments[1:]:
+        prev_start, prev_end = collapsed[-1]
+        before, after = y_frames[prev_end], y_frames[seg[0]]
+        if hamming_distance(perceptual_hash(before), perceptual_hash(after)) <= max_hash_distance \
+                and max_tile_change(before, after) <= max_change:
+            collapsed[-1] = (prev_start, seg[1])
+        else:
+            collapsed.append(seg)
+
+    removed = len(stable_segments) - len(collapsed)
+    logger.info(f"Collapsed {removed} near-duplicate segment transitions ({len(stable_segments)} -> {len(collapsed)} segments).")
+    return collapsed, removed